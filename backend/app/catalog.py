@@ -0,0 +1,194 @@
+"""
+Bulk product catalog import.
+
+A CSV (with a header row) or NDJSON catalog is spooled to a temporary file
+as it arrives, so memory stays bounded however large the upload is, then
+read back one row at a time. Each row is validated on its own; valid rows
+are upserted by SKU in chunks with INSERT ... ON CONFLICT (sku) DO UPDATE,
+each chunk in its own DB transaction, and invalid ones are reported with
+their line number. The search index is refreshed once, after the last
+chunk. Spool writes and the reading, parsing and validation of each chunk
+run in a worker thread, so a large import does not stall the event loop.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import codecs
+import csv
+import json
+import os
+import tempfile
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import dialect_insert
+from app.models.models import Product, WeightUnit
+
+MAX_IMPORT_BYTES = int(os.getenv("CATALOG_IMPORT_MAX_BYTES", str(512 * 1024 * 1024)))
+IMPORT_CHUNK = int(os.getenv("CATALOG_IMPORT_CHUNK", "1000"))
+SPOOL_IN_MEMORY_BYTES = 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("csv", "ndjson")
+
+
+class CatalogRow(BaseModel):
+    sku: str = Field(min_length=1, max_length=50)
+    name: str = Field(min_length=1, max_length=100)
+    price_per_unit: float = Field(ge=0)
+    unit: WeightUnit = WeightUnit.KILOGRAMS
+    category: Optional[str] = Field(default=None, max_length=50)
+    icon: Optional[str] = Field(default=None, max_length=10)
+    color: Optional[str] = Field(default=None, max_length=7)
+    is_active: bool = True
+
+
+class CatalogImportError(ValueError):
+    """Raised when an upload cannot be imported at all."""
+
+    def __init__(self, message: str, too_large: bool = False):
+        self.too_large = too_large
+        super().__init__(message)
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str]) -> str:
+    if requested:
+        if requested not in FORMATS:
+            raise CatalogImportError(f"Unknown format {requested} (expected csv or ndjson)")
+        return requested
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in ("text/csv", "application/csv"):
+        return "csv"
+    if media_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return "ndjson"
+    raise CatalogImportError("Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson")
+
+
+async def spool(chunks: AsyncIterator[bytes], max_bytes: int = MAX_IMPORT_BYTES):
+    """Copy a request body to a temp file (in memory while small)."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_IN_MEMORY_BYTES)
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            spooled.close()
+            raise CatalogImportError(f"Catalog exceeds {max_bytes} bytes", too_large=True)
+        # Past SPOOL_IN_MEMORY_BYTES this is a disk write
+        await asyncio.to_thread(spooled.write, chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def _csv_rows(text) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    reader = csv.DictReader(text)
+    for record in reader:
+        line = reader.line_num
+        if None in record:
+            yield line, None, "More fields than the header"
+            continue
+        # Empty cells mean "not set", so optional fields fall back to defaults
+        yield line, {k.strip(): v.strip() for k, v in record.items() if k and v is not None and v.strip()}, None
+
+
+def _ndjson_rows(text) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError as e:
+            yield line, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "Expected a JSON object"
+            continue
+        yield line, record, None
+
+
+def _first_error(e: ValidationError) -> str:
+    error = e.errors()[0]
+    field = ".".join(str(part) for part in error["loc"])
+    return f"{field}: {error['msg']}" if field else error["msg"]
+
+
+async def _upsert_chunk(session: AsyncSession, rows: List[CatalogRow]) -> Tuple[int, int]:
+    """Upsert one chunk by SKU and commit; returns (inserted, updated)."""
+    latest: Dict[str, CatalogRow] = {}
+    for row in rows:
+        latest[row.sku] = row   # A SKU repeated within the chunk: the last row wins
+    existing = set((await session.scalars(select(Product.sku).where(Product.sku.in_(latest)))).all())
+
+    inserted = updated = 0
+    seen = set(existing)
+    for row in rows:
+        if row.sku in seen:
+            updated += 1
+        else:
+            inserted += 1
+            seen.add(row.sku)
+
+    now = datetime.utcnow()
+    stmt = dialect_insert(session, Product)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.sku],
+        set_={
+            "name": excluded.name,
+            "price_per_unit": excluded.price_per_unit,
+            "unit": excluded.unit,
+            "category": excluded.category,
+            "icon": excluded.icon,
+            "color": excluded.color,
+            "is_active": excluded.is_active,
+            # Explicit: onupdate does not fire for ON CONFLICT, and the search index refresh keys on it
+            "updated_at": excluded.updated_at,
+        },
+    )
+    await session.execute(stmt, [
+        {**row.model_dump(), "created_at": now, "updated_at": now} for row in latest.values()
+    ])
+    await session.commit()
+    return inserted, updated
+
+
+def _next_chunk(rows, chunk_size: int, reject) -> List[CatalogRow]:
+    """Read and validate rows until `chunk_size` are valid or the input ends."""
+    chunk: List[CatalogRow] = []
+    for line, record, error in rows:
+        if error:
+            reject(line, None, error)
+            continue
+        try:
+            chunk.append(CatalogRow.model_validate(record))
+        except ValidationError as e:
+            sku = record.get("sku")
+            reject(line, sku if isinstance(sku, str) else None, _first_error(e))
+            continue
+        if len(chunk) >= chunk_size:
+            break
+    return chunk
+
+
+async def import_catalog(session: AsyncSession, spooled, fmt: str, chunk_size: int = IMPORT_CHUNK) -> dict:
+    """Validate and upsert every row of a spooled catalog; returns the summary."""
+    text = codecs.getreader("utf-8-sig")(spooled, errors="replace")
+    rows = _csv_rows(text) if fmt == "csv" else _ndjson_rows(text)
+
+    summary = {"inserted": 0, "updated": 0, "rejected": 0, "errors": []}
+
+    def reject(line: int, sku, error: str):
+        summary["rejected"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line, "sku": sku, "error": error})
+
+    try:
+        # Each chunk is read in a thread while nothing else touches `rows` or `summary`
+        while chunk := await asyncio.to_thread(_next_chunk, rows, chunk_size, reject):
+            inserted, updated = await _upsert_chunk(session, chunk)
+            summary["inserted"] += inserted
+            summary["updated"] += updated
+    except csv.Error as e:
+        raise CatalogImportError(f"Malformed CSV: {e}")
+    return summary
@@ -0,0 +1,258 @@
+"""
+Embedded (SQLite) mode for in-store boxes.
+
+SQLite allows one writer at a time, so rather than have request sessions
+fight over the write lock, sales and sync uploads go through the same
+single-task WriteQueue as scale readings (see writer.py). Rare writes
+(catalog, users) keep using ordinary sessions and wait on busy_timeout.
+
+With EDGE_UPLOAD_URL set (Settings.edge_upload_url), EdgeUploader copies
+new transactions and measurements to the central PostgreSQL database in
+bulk every EDGE_UPLOAD_SECONDS. Products, operators and devices are matched by SKU,
+email and MAC address. Uploading needs EDGE_STORE_ID and WORKER_ID, both
+unique per store: sync receipts scoped to the store make a retried upload
+a no-op, and distinct worker ids keep transaction numbers from colliding
+with another store's (a collision stops the upload rather than dropping sales).
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+import os
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from app.database import check_dialect
+from app.models.models import (
+    Device,
+    EdgeUploadState,
+    Measurement,
+    Product,
+    SyncReceipt,
+    Transaction,
+    TransactionItem,
+    User,
+)
+from app.reports import record_sales
+from app.writer import Job, WriteQueue
+
+UPLOAD_SECONDS = float(os.getenv("EDGE_UPLOAD_SECONDS", "30"))
+UPLOAD_BATCH = int(os.getenv("EDGE_UPLOAD_BATCH", "5000"))
+
+logger = logging.getLogger(__name__)
+
+
+class EdgeUploadError(RuntimeError):
+    """Raised when local rows cannot be matched to the central database."""
+
+
+async def _watermark(session: AsyncSession, kind: str) -> int:
+    state = await session.get(EdgeUploadState, kind)
+    return state.last_id if state else 0
+
+
+def _advance(kind: str, last_id: int) -> Job:
+    async def job(session: AsyncSession):
+        state = await session.get(EdgeUploadState, kind)
+        if state is None:
+            state = EdgeUploadState(kind=kind)
+            session.add(state)
+        state.last_id = last_id
+        state.uploaded_at = datetime.utcnow()
+    return job
+
+
+class EdgeUploader:
+    """Copy local transactions and measurements to the central database."""
+
+    def __init__(self, local_factory: Callable, writer: WriteQueue, central_url: str,
+                 store_id: Optional[str], batch: int = UPLOAD_BATCH):
+        if not store_id:
+            raise RuntimeError("Set EDGE_STORE_ID (unique per store) to upload to the central database")
+        self.local_factory = local_factory
+        self.writer = writer
+        self.central_engine = create_async_engine(central_url, pool_size=1, max_overflow=1)
+        check_dialect(self.central_engine)
+        self.central_factory = async_sessionmaker(self.central_engine, class_=AsyncSession, expire_on_commit=False)
+        self.store_id = store_id
+        # Receipts are scoped to the store, like a sync client's
+        self.client_id = f"edge:{store_id}"[:64]
+        self.batch = batch
+        self.uploaded: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self.last_upload: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    async def upload_transactions(self) -> int:
+        """Upload the next batch of transactions; returns how many were read."""
+        async with self.local_factory() as local:
+            last = await _watermark(local, "transactions")
+            transactions = (await local.scalars(
+                select(Transaction)
+                .options(selectinload(Transaction.items))
+                .where(Transaction.id > last)
+                .order_by(Transaction.id)
+                .limit(self.batch)
+            )).all()
+            if not transactions:
+                return 0
+            product_ids = {item.product_id for tx in transactions for item in tx.items}
+            skus = dict((await local.execute(
+                select(Product.id, Product.sku).where(Product.id.in_(product_ids))
+            )).all())
+            user_ids = {tx.created_by_id for tx in transactions if tx.created_by_id}
+            emails = dict((await local.execute(
+                select(User.id, User.email).where(User.id.in_(user_ids))
+            )).all()) if user_ids else {}
+
+        async with self.central_factory() as central:
+            central_products = dict((await central.execute(
+                select(Product.sku, Product.id).where(Product.sku.in_([s for s in skus.values() if s]))
+            )).all())
+            unmatched = sorted(pid for pid in product_ids if skus.get(pid) not in central_products)
+            if unmatched:
+                raise EdgeUploadError(f"Products with no central match by SKU: {unmatched}")
+            central_users = dict((await central.execute(
+                select(User.email, User.id).where(User.email.in_(emails.values()))
+            )).all()) if emails else {}
+
+            keys = {tx.transaction_number: f"t:{tx.transaction_number}" for tx in transactions}
+            # Already uploaded, e.g. the watermark update was lost
+            applied = set((await central.scalars(
+                select(SyncReceipt.idempotency_key).where(
+                    SyncReceipt.client_id == self.client_id,
+                    SyncReceipt.idempotency_key.in_(keys.values()),
+                )
+            )).all())
+            new_rows = [
+                {
+                    "transaction_number": tx.transaction_number,
+                    "total_amount": tx.total_amount,
+                    "payment_method": tx.payment_method,
+                    "notes": tx.notes,
+                    "created_by_id": central_users.get(emails.get(tx.created_by_id)),
+                    "created_at": tx.created_at,
+                    "items": [
+                        {"product_id": central_products[skus[item.product_id]], "weight": item.weight,
+                         "unit_price": item.unit_price, "total_price": item.total_price}
+                        for item in tx.items
+                    ],
+                }
+                for tx in transactions if keys[tx.transaction_number] not in applied
+            ]
+            if new_rows:
+                try:
+                    ids = (await central.scalars(
+                        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+                        [{k: v for k, v in row.items() if k != "items"} for row in new_rows],
+                    )).all()
+                except IntegrityError:
+                    raise EdgeUploadError(
+                        "Transaction numbers already used by another store; "
+                        "give every store its own WORKER_ID"
+                    )
+                for row, tx_id in zip(new_rows, ids):
+                    row["id"] = tx_id
+                    for line in row["items"]:
+                        line["transaction_id"] = tx_id
+                item_rows = [line for row in new_rows for line in row["items"]]
+                if item_rows:
+                    await central.execute(insert(TransactionItem), item_rows)
+                await central.execute(insert(SyncReceipt), [
+                    {"client_id": self.client_id, "idempotency_key": keys[row["transaction_number"]],
+                     "kind": "transaction", "result_id": row["id"]}
+                    for row in new_rows
+                ])
+                await record_sales(central, new_rows)
+            await central.commit()
+
+        await self.writer.submit(_advance("transactions", transactions[-1].id))
+        self.uploaded["transactions"] += len(new_rows)
+        self.skipped["transactions"] += len(transactions) - len(new_rows)
+        return len(transactions)
+
+    async def upload_measurements(self) -> int:
+        """Upload the next batch of measurements; returns how many were read."""
+        async with self.local_factory() as local:
+            last = await _watermark(local, "measurements")
+            rows = (await local.execute(
+                select(
+                    Measurement.id, Device.mac_address, Measurement.weight, Measurement.unit,
+                    Measurement.is_stable, Measurement.battery_level, Measurement.timestamp,
+                )
+                .join(Device, Device.id == Measurement.device_id)
+                .where(Measurement.id > last)
+                .order_by(Measurement.id)
+                .limit(self.batch)
+            )).all()
+            if not rows:
+                return 0
+
+        async with self.central_factory() as central:
+            devices = dict((await central.execute(
+                select(Device.mac_address, Device.id).where(Device.mac_address.in_({row.mac_address for row in rows}))
+            )).all())
+            keys = {row.id: f"m:{row.id}" for row in rows}
+            applied = set((await central.scalars(
+                select(SyncReceipt.idempotency_key).where(
+                    SyncReceipt.client_id == self.client_id,
+                    SyncReceipt.idempotency_key.in_(keys.values()),
+                )
+            )).all())
+            fresh = [row for row in rows if keys[row.id] not in applied and row.mac_address in devices]
+            unknown = sum(row.mac_address not in devices for row in rows)
+            if unknown:
+                logger.warning("Skipping %d measurements from devices unknown centrally", unknown)
+            if fresh:
+                ids = (await central.scalars(
+                    insert(Measurement).returning(Measurement.id, sort_by_parameter_order=True),
+                    [{"device_id": devices[row.mac_address], "weight": row.weight, "unit": row.unit,
+                      "is_stable": row.is_stable, "battery_level": row.battery_level,
+                      "timestamp": row.timestamp} for row in fresh],
+                )).all()
+                await central.execute(insert(SyncReceipt), [
+                    {"client_id": self.client_id, "idempotency_key": keys[row.id],
+                     "kind": "measurement", "result_id": measurement_id}
+                    for row, measurement_id in zip(fresh, ids)
+                ])
+            await central.commit()
+
+        await self.writer.submit(_advance("measurements", rows[-1].id))
+        self.uploaded["measurements"] += len(fresh)
+        self.skipped["measurements"] += len(rows) - len(fresh)
+        return len(rows)
+
+    async def upload_once(self) -> Dict[str, int]:
+        """Upload everything written so far, a batch per central DB transaction."""
+        before = dict(self.uploaded)
+        for upload in (self.upload_transactions, self.upload_measurements):
+            while await upload() == self.batch:
+                pass
+        self.last_upload = datetime.utcnow()
+        self.last_error = None
+        return {kind: count - before.get(kind, 0) for kind, count in self.uploaded.items()}
+
+    async def run(self, interval: float = UPLOAD_SECONDS):
+        while True:
+            try:
+                await self.upload_once()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Upload to the central database failed")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        await self.central_engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "store_id": self.store_id,
+            "uploaded": dict(self.uploaded),
+            "skipped": dict(self.skipped),
+            "last_upload": self.last_upload.isoformat() if self.last_upload else None,
+            "last_error": self.last_error,
+        }
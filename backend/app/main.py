@@ -1,40 +1,144 @@
 """
 FastAPI main application entry point.
+
+``create_app(settings)`` builds the API without doing any expensive work
+or touching process-wide state: the lifespan builds the app's database
+engine, transaction number allocator, writers, search index, optional
+measurement recorder and background tasks from those settings and keeps
+them on ``app.state``; the password hasher and JWT library load on first
+use. ``app`` is the instance built from the environment.
 """
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-import os
-
-# Configuration
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+from functools import partial
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+import asyncio
+import logging
+
+from app.catalog import CatalogImportError, detect_format, import_catalog, spool
+from app.config import Settings, get_settings
+from app.database import build_engine, build_session_factory, get_db, init_db
+from app.edge import EdgeUploader
+from app.recording import RECORD_PATH, MeasurementRecorder
+from app.reports import ReportError, backfill_sales, init_sales_rollup, sales_report, utc_naive
+from app.search import (
+    ProductSearchIndex,
+    ensure_trigram_indexes,
+    refresh_periodically,
+    refresh_popularity_periodically,
+    search_products_db,
+)
+from app.sync import BundleError, apply_bundle, decode_bundle, read_body
+from app.models.models import Device, Product, Transaction, WeightUnit
+from app.ratelimit import LoadShedder, TokenBucketLimiter, acquire_all, admission_stats, retry_after_header
+from app.transactions import UnknownProductError, persist_transactions
+from app.writer import WriteQueue
+from app.txnumber import TransactionNumberAllocator, number_second, release_worker_id, resolve_worker_id
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-# App instance
-app = FastAPI(
-    title="BLE Scale API",
-    description="Backend API for ESP32 BLE Weight Measurement System",
-    version="1.0.0",
-)
+# Tries per sale when its transaction number turns out to be taken already
+NUMBER_ATTEMPTS = 5
 
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = logging.getLogger(__name__)
+
+# Password hashing (bcrypt CryptContext, built on first use)
+_pwd_context = None
+
+router = APIRouter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI, settings: Settings):
+    """Set up the app's engine, writers and caches on app.state, and tear them down."""
+    state = app.state
+    # Uploading stores share the central database, so they need their own WORKER_ID
+    worker_id = resolve_worker_id(
+        settings.worker_id,
+        settings.worker_processes,
+        single_host=settings.embedded and not settings.edge_upload_url,
+    )
+    state.device_limiter = TokenBucketLimiter(settings.rate_limit_device_per_sec, settings.rate_limit_device_burst)
+    state.client_limiter = TokenBucketLimiter(settings.rate_limit_client_per_sec, settings.rate_limit_client_burst)
+    state.load_shedder = load_shedder = LoadShedder(
+        settings.shed_max_in_flight, settings.shed_max_pool_wait_seconds
+    )
+    state.engine = engine = build_engine(settings)
+    state.session_factory = session_factory = build_session_factory(engine)
+    await init_db(engine)
+    async with session_factory() as session:
+        await init_sales_rollup(session)
+        # Resume after the newest number issued, in case this is a restart
+        last_number = await session.scalar(select(func.max(Transaction.transaction_number)))
+    # Collision-free transaction numbers (no DB round trip per allocation)
+    state.tx_numbers = TransactionNumberAllocator(worker_id, issued_until=number_second(last_number))
+    backfill = asyncio.create_task(backfill_sales(session_factory))
+    if settings.search_backend == "postgres":
+        state.product_index = None
+        async with engine.begin() as conn:
+            await ensure_trigram_indexes(conn)
+        refresher = asyncio.create_task(refresh_popularity_periodically(session_factory))
+    else:
+        state.product_index = ProductSearchIndex()
+        async with session_factory() as session:
+            await state.product_index.refresh(session)
+        refresher = asyncio.create_task(refresh_periodically(state.product_index, session_factory))
+    state.measurement_recorder = MeasurementRecorder(RECORD_PATH) if RECORD_PATH else None
+    # One task writes readings in batches; in embedded (SQLite) mode sales
+    # and sync uploads too (sales_writer)
+    state.writer = writer = WriteQueue(session_factory, observe_pool_wait=load_shedder.observe_pool_wait)
+    writer_task = asyncio.create_task(writer.run())
+    load_shedder.queue_depth = writer.depth
+    state.sales_writer = writer if settings.embedded else None
+    state.uploader = upload_task = None
+    if settings.embedded and settings.edge_upload_url:
+        state.uploader = EdgeUploader(session_factory, writer, settings.edge_upload_url, settings.edge_store_id)
+        upload_task = asyncio.create_task(state.uploader.run())
+    try:
+        yield
+    finally:
+        for task in (backfill, refresher, upload_task):
+            if task:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        if state.uploader:
+            await state.uploader.close()
+        writer.stop()
+        await writer_task
+        if state.measurement_recorder:
+            await state.measurement_recorder.close()
+        await engine.dispose()
+        release_worker_id(worker_id)
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API for `settings` (default: from the environment)."""
+    settings = settings or get_settings()
+    application = FastAPI(
+        title="BLE Scale API",
+        description="Backend API for ESP32 BLE Weight Measurement System",
+        version="1.0.0",
+        lifespan=partial(lifespan, settings=settings),
+    )
+    application.state.settings = settings
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    application.include_router(router)
+    return application
 
 
 # =============================================================================
@@ -71,7 +175,7 @@ class ProductCreate(BaseModel):
     name: str
     sku: Optional[str] = None
     price_per_unit: float
-    unit: str = "kg"
+    unit: WeightUnit = WeightUnit.KILOGRAMS
     category: Optional[str] = None
     icon: Optional[str] = None
     color: Optional[str] = None
@@ -113,13 +217,14 @@ class DeviceResponse(BaseModel):
 
 class TransactionItemCreate(BaseModel):
     product_id: int
-    weight: float
-    unit_price: float
-    total_price: float
+    weight: float = Field(gt=0)  # grams
+    # Accepted for compatibility; prices are always recomputed server-side
+    unit_price: Optional[float] = None
+    total_price: Optional[float] = None
 
 
 class TransactionCreate(BaseModel):
-    items: List[TransactionItemCreate]
+    items: List[TransactionItemCreate] = Field(min_length=1)
     payment_method: Optional[str] = "cash"
     notes: Optional[str] = None
 
@@ -136,49 +241,156 @@ class TransactionResponse(BaseModel):
         from_attributes = True
 
 
+class TransactionItemResponse(BaseModel):
+    id: int
+    product_id: int
+    weight: float
+    unit_price: float
+    total_price: float
+
+    class Config:
+        from_attributes = True
+
+
+class TransactionDetailResponse(TransactionResponse):
+    items: List[TransactionItemResponse]
+
+
 class MeasurementCreate(BaseModel):
     device_mac: str
     weight: float
-    unit: str = "g"
+    unit: WeightUnit = WeightUnit.GRAMS
     is_stable: bool = False
     battery_level: Optional[int] = None
 
 
+class SalesReportRow(BaseModel):
+    period: Optional[datetime] = None
+    product_id: Optional[int] = None
+    product_name: Optional[str] = None
+    category: Optional[str] = None
+    operator_id: Optional[int] = None
+    revenue: float
+    weight_g: float
+    items: int
+
+
+class SalesReportResponse(BaseModel):
+    group_by: List[str]
+    period: str
+    start: Optional[datetime]
+    end: Optional[datetime]
+    rows: List[SalesReportRow]
+
+
+class CatalogImportRowError(BaseModel):
+    line: int
+    sku: Optional[str] = None
+    error: str
+
+
+class CatalogImportResponse(BaseModel):
+    inserted: int
+    updated: int
+    rejected: int
+    errors: List[CatalogImportRowError]
+
+
+# Same rules as the online endpoints: a bundle holding an empty basket or a
+# non-positive weight is rejected as a whole (422, with the item's index)
+class SyncTransaction(TransactionCreate):
+    idempotency_key: str = Field(min_length=1, max_length=64)
+    created_at: Optional[datetime] = None
+
+    @field_validator("created_at")
+    @classmethod
+    def _naive_utc(cls, ts: Optional[datetime]) -> Optional[datetime]:
+        # Stored as naive UTC, like every other timestamp
+        return utc_naive(ts) if ts else ts
+
+
+class SyncMeasurement(MeasurementCreate):
+    idempotency_key: str = Field(min_length=1, max_length=64)
+    # Checked per item by apply_bundle, so one bad unit rejects only its reading
+    unit: str = "g"
+    timestamp: Optional[datetime] = None
+
+    @field_validator("timestamp")
+    @classmethod
+    def _naive_utc(cls, ts: Optional[datetime]) -> Optional[datetime]:
+        return utc_naive(ts) if ts else ts
+
+
+class SyncBundle(BaseModel):
+    # Stable per app install; idempotency keys only need to be unique per client
+    client_id: str = Field(min_length=1, max_length=64)
+    transactions: List[SyncTransaction] = []
+    measurements: List[SyncMeasurement] = []
+
+
+class SyncItemResult(BaseModel):
+    idempotency_key: str
+    kind: str
+    status: str  # applied, duplicate or rejected
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class SyncUploadResponse(BaseModel):
+    applied: int
+    duplicates: int
+    rejected: int
+    results: List[SyncItemResult]
+
+
 # =============================================================================
 # Authentication Helpers
 # =============================================================================
 
+def password_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_context().hash(password)
+
 
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None,
+                        settings: Optional[Settings] = None) -> str:
+    from jose import jwt   # Loads its crypto backends; keep it off the import path
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    settings = settings or get_settings()
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.jwt_algorithm)
 
 
 # =============================================================================
 # API Routes
 # =============================================================================
 
-@app.get("/")
+@router.get("/")
 async def root():
     return {"message": "BLE Scale API", "version": "1.0.0"}
 
 
-@app.get("/health")
+@router.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
 
 # Auth routes
-@app.post("/auth/register", response_model=UserResponse)
+@router.post("/auth/register", response_model=UserResponse)
 async def register(user: UserCreate):
     """Register a new user."""
     # In production, this would use the database
@@ -192,93 +404,324 @@ async def register(user: UserCreate):
     }
 
 
-@app.post("/auth/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+@router.post("/auth/login", response_model=Token)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """Login and get access token."""
     # In production, validate against database
+    settings = request.app.state.settings
     access_token = create_access_token(
         data={"sub": form_data.username},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+        expires_delta=timedelta(minutes=settings.access_token_expire_minutes),
+        settings=settings,
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 # Product routes
-@app.get("/products", response_model=List[ProductResponse])
-async def get_products():
+@router.get("/products", response_model=List[ProductResponse])
+async def get_products(db: AsyncSession = Depends(get_db)):
     """Get all products."""
-    # Mock data for demo
-    return [
-        {"id": 1, "name": "Apples", "sku": "APL001", "price_per_unit": 3.50, "unit": "kg", "category": "Fruits", "icon": "🍎", "color": "#FF6B6B", "is_active": True},
-        {"id": 2, "name": "Oranges", "sku": "ORG001", "price_per_unit": 4.00, "unit": "kg", "category": "Fruits", "icon": "🍊", "color": "#FFB74D", "is_active": True},
-        {"id": 3, "name": "Bananas", "sku": "BAN001", "price_per_unit": 2.80, "unit": "kg", "category": "Fruits", "icon": "🍌", "color": "#FFEB3B", "is_active": True},
-    ]
+    result = await db.scalars(
+        select(Product).where(Product.is_active.is_(True)).order_by(Product.id)
+    )
+    return result.all()
 
 
-@app.post("/products", response_model=ProductResponse)
-async def create_product(product: ProductCreate):
+@router.get("/products/search", response_model=List[ProductResponse])
+async def search_products(request: Request, q: str, limit: int = 20, db: AsyncSession = Depends(get_db)):
+    """Type-ahead product lookup by name, SKU or category."""
+    limit = max(1, min(limit, 100))
+    index = request.app.state.product_index
+    if index is None:
+        return await search_products_db(db, q, limit)
+    return index.search(q, limit)
+
+
+@router.post("/products", response_model=ProductResponse)
+async def create_product(product: ProductCreate, request: Request, db: AsyncSession = Depends(get_db)):
     """Create a new product."""
-    return {
-        "id": 4,
-        **product.model_dump(),
-        "is_active": True,
-    }
+    db_product = Product(**product.model_dump())
+    db.add(db_product)
+    await db.commit()
+    index = request.app.state.product_index
+    if index is not None:
+        index.upsert(db_product)
+    return db_product
+
+
+@router.post("/products/import", response_model=CatalogImportResponse)
+async def import_products(request: Request, format: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    Create or update products by SKU from a CSV (header row required) or
+    NDJSON body, chosen by Content-Type or ?format=. Invalid rows are
+    skipped and reported (the first 100, with line numbers); valid ones are
+    committed in chunks, so an interrupted import keeps its earlier chunks.
+    A row replaces every field of an existing product; omitted optional
+    fields go back to their defaults.
+    """
+    try:
+        fmt = detect_format(request.headers.get("content-type"), format)
+        spooled = await spool(request.stream())
+    except CatalogImportError as e:
+        raise HTTPException(
+            status_code=(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if e.too_large
+                else status.HTTP_400_BAD_REQUEST
+            ),
+            detail=str(e),
+        )
+    with spooled:
+        try:
+            summary = await import_catalog(db, spooled, fmt)
+        except CatalogImportError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    index = request.app.state.product_index
+    if index is not None:
+        await index.refresh(db)
+    return summary
 
 
 # Device routes
-@app.get("/devices", response_model=List[DeviceResponse])
-async def get_devices():
+@router.get("/devices", response_model=List[DeviceResponse])
+async def get_devices(db: AsyncSession = Depends(get_db)):
     """Get all registered devices."""
-    return []
+    result = await db.scalars(select(Device).order_by(Device.id))
+    return result.all()
 
 
-@app.post("/devices", response_model=DeviceResponse)
-async def register_device(device: DeviceCreate):
+@router.post("/devices", response_model=DeviceResponse)
+async def register_device(device: DeviceCreate, db: AsyncSession = Depends(get_db)):
     """Register a new device."""
-    return {
-        "id": 1,
-        **device.model_dump(),
-        "calibration_factor": 420.0,
-        "last_seen": datetime.utcnow(),
-        "is_active": True,
-    }
+    db_device = Device(**device.model_dump(), last_seen=datetime.utcnow())
+    db.add(db_device)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Device already registered"
+        )
+    return db_device
 
 
 # Transaction routes
-@app.get("/transactions", response_model=List[TransactionResponse])
-async def get_transactions(skip: int = 0, limit: int = 50):
+@router.get("/transactions", response_model=List[TransactionResponse])
+async def get_transactions(skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_db)):
     """Get transaction history."""
-    return []
+    result = await db.scalars(
+        select(Transaction).order_by(Transaction.id.desc()).offset(skip).limit(limit)
+    )
+    return result.all()
 
 
-@app.post("/transactions", response_model=TransactionResponse)
-async def create_transaction(transaction: TransactionCreate):
-    """Create a new transaction."""
-    total = sum(item.total_price for item in transaction.items)
-    tx_number = f"TX{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-    
-    return {
-        "id": 1,
-        "transaction_number": tx_number,
-        "total_amount": total,
-        "payment_method": transaction.payment_method,
-        "notes": transaction.notes,
-        "created_at": datetime.utcnow(),
-    }
+@router.get("/transactions/{transaction_id}", response_model=TransactionDetailResponse)
+async def get_transaction(transaction_id: int, db: AsyncSession = Depends(get_db)):
+    """Get a transaction with its items."""
+    result = await db.scalars(
+        select(Transaction)
+        .options(selectinload(Transaction.items))
+        .where(Transaction.id == transaction_id)
+    )
+    db_transaction = result.first()
+    if db_transaction is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return db_transaction
+
+
+@router.post("/transactions", response_model=TransactionResponse)
+async def create_transaction(transaction: TransactionCreate, request: Request):
+    """Create a new transaction, priced from the catalog."""
+    # No session of our own while waiting for the writer: it needs a pooled
+    # connection for the batch
+    state = request.app.state
+    next_number = state.tx_numbers.next
+    for _ in range(NUMBER_ATTEMPTS):
+        try:
+            if state.sales_writer:
+                (created,) = await state.sales_writer.submit(
+                    lambda session: persist_transactions(session, [transaction], next_number)
+                )
+                return created
+            async with state.session_factory() as db:
+                (created,) = await persist_transactions(db, [transaction], next_number)
+                await db.commit()
+            return created
+        except UnknownProductError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except IntegrityError:
+            # The number was taken: another process is using our worker id
+            logger.warning("Transaction number already in use; is WORKER_ID shared by several processes?")
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Could not allocate a unique transaction number",
+        headers=retry_after_header(1),
+    )
+
+
+# Report routes
+@router.get("/reports/sales", response_model=SalesReportResponse)
+async def get_sales_report(
+    group_by: str = "product",
+    period: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Revenue, weight sold (grams) and item count in [start, end), grouped by
+    a comma-separated subset of product, category and operator (empty for
+    totals) and bucketed by period: hour, day or none.
+    """
+    groups = [group.strip() for group in group_by.split(",") if group.strip()]
+    try:
+        rows = await sales_report(db, groups, period, start, end)
+    except ReportError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"group_by": groups, "period": period, "start": start, "end": end, "rows": rows}
 
 
 # Measurement routes
-@app.post("/measurements")
-async def record_measurement(measurement: MeasurementCreate):
+@router.post("/measurements")
+async def record_measurement(measurement: MeasurementCreate, request: Request):
     """Record a weight measurement from device."""
+    state = request.app.state
+    shed = state.load_shedder.check()
+    if shed:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server overloaded ({shed[0]})",
+            headers=retry_after_header(shed[1]),
+        )
+
+    client = request.client.host if request.client else "unknown"
+    wait = acquire_all((state.client_limiter, client), (state.device_limiter, measurement.device_mac))
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers=retry_after_header(wait),
+        )
+
+    # Held until the reading is committed, so in-flight work and pool wait
+    # both reflect how far behind the database is
+    with state.load_shedder.slot():
+        try:
+            stored = await state.writer.add_reading(
+                measurement.device_mac,
+                measurement.weight,
+                measurement.unit.value,
+                measurement.is_stable,
+                measurement.battery_level,
+            )
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Could not store the reading",
+                headers=retry_after_header(state.load_shedder.retry_after),
+            )
+        if not stored:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Device {measurement.device_mac} is not registered",
+            )
+        if state.measurement_recorder:
+            state.measurement_recorder.record(
+                measurement.device_mac,
+                measurement.weight,
+                measurement.unit.value,
+                measurement.is_stable,
+                measurement.battery_level,
+            )
+        return {
+            "status": "recorded",
+            "device": measurement.device_mac,
+            "weight": measurement.weight,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+
+
+# Offline sync routes
+@router.post("/sync/upload", response_model=SyncUploadResponse)
+async def sync_upload(request: Request):
+    """
+    Apply a bundle of queued transactions and measurements from a client
+    that was offline. The body is JSON (a SyncBundle), optionally sent with
+    Content-Encoding gzip or zstd. Items are deduplicated by the client's
+    idempotency keys.
+    """
+    state = request.app.state
+    shed = state.load_shedder.check()
+    if shed:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server overloaded ({shed[0]})",
+            headers=retry_after_header(shed[1]),
+        )
+
+    with state.load_shedder.slot():
+        try:
+            raw = decode_bundle(await read_body(request.stream()), request.headers.get("content-encoding"))
+        except BundleError as e:
+            raise HTTPException(
+                status_code=(
+                    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE if e.unsupported
+                    else status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if e.too_large
+                    else status.HTTP_400_BAD_REQUEST
+                ),
+                detail=str(e),
+            )
+        try:
+            bundle = SyncBundle.model_validate_json(raw)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        next_number = state.tx_numbers.next
+        try:
+            if state.sales_writer:
+                results = await state.sales_writer.submit(
+                    lambda session: apply_bundle(
+                        session, bundle.client_id, bundle.transactions, bundle.measurements, next_number
+                    )
+                )
+            else:
+                async with state.session_factory() as db:
+                    results = await apply_bundle(db, bundle.client_id, bundle.transactions, bundle.measurements,
+                                                 next_number)
+                    await db.commit()
+        except IntegrityError:
+            # Another upload applied one of these keys concurrently; a retry
+            # will report those items as duplicates.
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Concurrent upload of the same items, retry",
+                headers=retry_after_header(1),
+            )
+
+    counts = {s: sum(r["status"] == s for r in results) for s in ("applied", "duplicate", "rejected")}
     return {
-        "status": "recorded",
-        "device": measurement.device_mac,
-        "weight": measurement.weight,
-        "timestamp": datetime.utcnow().isoformat(),
+        "applied": counts["applied"],
+        "duplicates": counts["duplicate"],
+        "rejected": counts["rejected"],
+        "results": results,
     }
 
 
+@router.get("/metrics/admission")
+async def get_admission_metrics(request: Request):
+    """Counters for throttled and shed ingestion requests."""
+    state = request.app.state
+    return admission_stats(state.device_limiter, state.client_limiter, state.load_shedder)
+
+
+@router.get("/metrics/edge")
+async def get_edge_metrics(request: Request):
+    """Write queue and central upload counters (embedded mode only)."""
+    state = request.app.state
+    if not state.sales_writer:
+        raise HTTPException(status_code=404, detail="Not running in embedded mode")
+    return {"writer": state.writer.stats(), "upload": state.uploader.stats() if state.uploader else None}
+
+
 # =============================================================================
 # Ownership Transfer API
 # =============================================================================
@@ -320,7 +763,7 @@ class TransferLogResponse(BaseModel):
     transferred_at: datetime
 
 
-@app.post("/transfers/initiate", response_model=TransferInitResponse)
+@router.post("/transfers/initiate", response_model=TransferInitResponse)
 async def initiate_transfer(request: TransferInitRequest):
     """
     Initiate a device ownership transfer.
@@ -347,7 +790,7 @@ async def initiate_transfer(request: TransferInitRequest):
     }
 
 
-@app.post("/transfers/verify", response_model=TransferCompleteResponse)
+@router.post("/transfers/verify", response_model=TransferCompleteResponse)
 async def verify_transfer(request: TransferVerifyRequest):
     """
     Verify transfer code and complete ownership transfer.
@@ -400,7 +843,7 @@ async def verify_transfer(request: TransferVerifyRequest):
     }
 
 
-@app.delete("/transfers/{code}")
+@router.delete("/transfers/{code}")
 async def cancel_transfer(code: str):
     """Cancel a pending transfer."""
     if code in transfer_tokens:
@@ -409,14 +852,16 @@ async def cancel_transfer(code: str):
     raise HTTPException(status_code=404, detail="Transfer not found")
 
 
-@app.get("/transfers/history", response_model=List[TransferLogResponse])
+@router.get("/transfers/history", response_model=List[TransferLogResponse])
 async def get_transfer_history(device_mac: Optional[str] = None):
     """Get ownership transfer history."""
     # Mock data for demo
     return []
 
 
+app = create_app()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
-
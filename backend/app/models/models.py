@@ -2,7 +2,7 @@
 SQLAlchemy database models for the BLE Scale system.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Enum, UniqueConstraint
 from sqlalchemy.orm import relationship, declarative_base
 import enum
 
@@ -86,7 +86,7 @@ class Transaction(Base):
     payment_method = Column(String(20))
     notes = Column(String(500))
     created_by_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
     created_by = relationship("User", back_populates="transactions")
@@ -97,7 +97,7 @@ class TransactionItem(Base):
     __tablename__ = "transaction_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     weight = Column(Float, nullable=False)  # in grams
     unit_price = Column(Float, nullable=False)
@@ -108,6 +108,46 @@ class TransactionItem(Base):
     product = relationship("Product", back_populates="transaction_items")
 
 
+class SalesHourly(Base):
+    """Sales per hour, product and operator, kept current as transactions are written."""
+    __tablename__ = "sales_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    operator_id = Column(Integer, primary_key=True, default=0)  # 0 = no operator
+    revenue = Column(Float, nullable=False, default=0.0)
+    weight_g = Column(Float, nullable=False, default=0.0)
+    items = Column(Integer, nullable=False, default=0)
+
+
+class SalesDaily(Base):
+    """Sales per day, product and operator, kept current alongside SalesHourly."""
+    __tablename__ = "sales_daily"
+
+    day = Column(DateTime, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    operator_id = Column(Integer, primary_key=True, default=0)  # 0 = no operator
+    revenue = Column(Float, nullable=False, default=0.0)
+    weight_g = Column(Float, nullable=False, default=0.0)
+    items = Column(Integer, nullable=False, default=0)
+
+
+class ProductPopularity(Base):
+    """Units sold per product, recounted from sales_daily for DB-side search ranking."""
+    __tablename__ = "product_popularity"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    items = Column(Integer, nullable=False, default=0)
+
+
+class SalesRollupState(Base):
+    """Single row: transaction items below this id are not yet in the sales summaries."""
+    __tablename__ = "sales_rollup_state"
+
+    id = Column(Integer, primary_key=True)
+    backfill_below_id = Column(Integer, nullable=False)
+
+
 class Measurement(Base):
     __tablename__ = "measurements"
 
@@ -136,3 +176,25 @@ class Calibration(Base):
 
     # Relationships
     device = relationship("Device", back_populates="calibrations")
+
+
+class SyncReceipt(Base):
+    """Idempotency keys of offline uploads that have already been applied, per client."""
+    __tablename__ = "sync_receipts"
+    __table_args__ = (UniqueConstraint("client_id", "idempotency_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(String(64), nullable=False)
+    idempotency_key = Column(String(64), nullable=False)
+    kind = Column(String(20), nullable=False)  # "transaction" or "measurement"
+    result_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class EdgeUploadState(Base):
+    """How far an in-store box has uploaded each table to the central database."""
+    __tablename__ = "edge_upload_state"
+
+    kind = Column(String(20), primary_key=True)  # "transactions" or "measurements"
+    last_id = Column(Integer, nullable=False, default=0)
+    uploaded_at = Column(DateTime)
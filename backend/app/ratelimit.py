@@ -0,0 +1,194 @@
+"""
+Admission control for the ingestion endpoints.
+
+Token buckets bound how fast a single device or client may submit readings,
+and the load shedder rejects work outright when the server itself is
+saturated, so one misbehaving scale cannot starve every other device.
+"""
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Optional, Tuple
+import math
+import os
+import time
+
+# Configuration (rates and shedding thresholds come from Settings)
+BUCKET_IDLE_SECONDS = float(os.getenv("RATE_LIMIT_IDLE_SECONDS", "300"))
+
+
+class TokenBucketLimiter:
+    """
+    Keyed token buckets with O(1) acquire and idle eviction.
+
+    Buckets live in an ordered dict kept in last-access order, so the idle
+    ones are always at the front and can be dropped without scanning.
+    A bucket idle for longer than it takes to refill is full again, so
+    evicting it never changes a decision.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        idle_seconds: float = BUCKET_IDLE_SECONDS,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.idle_seconds = max(idle_seconds, burst / rate)
+        self.max_keys = max_keys
+        self.clock = clock
+        self.throttled = 0
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    def wait(self, key: Hashable, cost: float = 1.0) -> float:
+        """
+        Seconds until `cost` tokens are available for `key` (0.0 if they
+        are now), without taking any.
+        """
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        self._evict(now)
+        if bucket[0] >= cost:
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens from the bucket for `key`.
+
+        Returns 0.0 when admitted, otherwise the number of seconds until
+        enough tokens will be available.
+        """
+        wait = self.wait(key, cost)
+        if wait:
+            self.throttled += 1
+            return wait
+        self._buckets[key][0] -= cost
+        return 0.0
+
+    def _evict(self, now: float):
+        """Drop buckets that have been idle long enough to be full again."""
+        buckets = self._buckets
+        while buckets:
+            key, (_, last_seen) = next(iter(buckets.items()))
+            if len(buckets) <= self.max_keys and now - last_seen < self.idle_seconds:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LoadShedder:
+    """
+    Overload guard for one app's ingestion.
+
+    Tracks requests currently being ingested and a moving average of how
+    long sessions wait for a pooled database connection. Once either passes
+    its threshold new work is refused with a retry hint instead of queueing
+    behind work that is already late.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 256,
+        max_pool_wait: float = 0.5,
+        retry_after: float = 1.0,
+        smoothing: float = 0.2,
+        stale_after: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_pool_wait = max_pool_wait
+        self.retry_after = retry_after
+        self.smoothing = smoothing
+        self.stale_after = stale_after
+        self.clock = clock
+        self.in_flight = 0
+        self.pool_wait = 0.0
+        self._pool_wait_at = 0.0
+        self.shed: Counter = Counter()
+        self.queue_depth: Optional[Callable[[], int]] = None
+
+    def observe_pool_wait(self, seconds: float):
+        """Record how long a session waited to check out a connection."""
+        now = self.clock()
+        if now - self._pool_wait_at > self.stale_after:
+            self.pool_wait = seconds
+        else:
+            self.pool_wait += self.smoothing * (seconds - self.pool_wait)
+        self._pool_wait_at = now
+
+    def check(self) -> Optional[Tuple[str, float]]:
+        """Return (reason, retry_after) if new work should be shed."""
+        depth = self.in_flight + (self.queue_depth() if self.queue_depth else 0)
+        if depth >= self.max_in_flight:
+            reason = "queue_full"
+        elif (
+            self.pool_wait > self.max_pool_wait
+            and self.clock() - self._pool_wait_at <= self.stale_after
+        ):
+            reason = "pool_wait"
+        else:
+            return None
+        self.shed[reason] += 1
+        return reason, self.retry_after
+
+    @contextmanager
+    def slot(self):
+        """Count the enclosed block as in-flight ingestion work."""
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+def acquire_all(*requests: Tuple[TokenBucketLimiter, Hashable], cost: float = 1.0) -> float:
+    """
+    Take `cost` tokens from every (limiter, key) bucket, or from none of
+    them: a request one bucket rejects must not use up the others.
+    Returns 0.0 when admitted, otherwise the longest wait.
+    """
+    waits = [limiter.wait(key, cost) for limiter, key in requests]
+    if any(waits):
+        for (limiter, _), wait in zip(requests, waits):
+            if wait:
+                limiter.throttled += 1
+        return max(waits)
+    for limiter, key in requests:
+        limiter.acquire(key, cost)
+    return 0.0
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    """Format a Retry-After header (whole seconds, at least 1)."""
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def admission_stats(
+    device_limiter: TokenBucketLimiter, client_limiter: TokenBucketLimiter, load_shedder: LoadShedder
+) -> dict:
+    """Snapshot of one app's admission-control counters."""
+    return {
+        "throttled": {
+            "device": device_limiter.throttled,
+            "client": client_limiter.throttled,
+        },
+        "shed": dict(load_shedder.shed),
+        "in_flight": load_shedder.in_flight,
+        "pool_wait_seconds": round(load_shedder.pool_wait, 4),
+        "tracked_buckets": {
+            "device": len(device_limiter),
+            "client": len(client_limiter),
+        },
+    }
@@ -0,0 +1,88 @@
+"""
+Optional capture of ingested measurements for replay.
+
+Set MEASUREMENT_RECORD_PATH to append every accepted /measurements reading
+to a stream log (format in stream_format.py, copied in the emulator):
+a timestamp, the device MAC and the 12-byte SCLE weight packet. Replay it
+with ``python emulator/stream_log.py replay <path>``. The lifespan opens
+the recorder; records are buffered and written in blocks from a worker
+thread, so recording adds no I/O to the request path.
+"""
+from typing import Optional
+import asyncio
+import logging
+import os
+import time
+
+from app.stream_format import RECORD, UNIT_CODES, open_for_append
+
+RECORD_PATH = os.getenv("MEASUREMENT_RECORD_PATH")
+
+logger = logging.getLogger(__name__)
+
+
+class MeasurementRecorder:
+    """
+    Append readings to a stream log, flushing every N records or T seconds.
+    Flushes run one at a time in a thread; if the disk falls more than
+    `max_pending_records` behind, new readings are skipped rather than
+    buffered without bound.
+    """
+
+    def __init__(self, path: str, flush_records: int = 1024, flush_seconds: float = 1.0,
+                 max_pending_records: int = 64 * 1024):
+        self.file, self.last_t_us = open_for_append(path)
+        self.flush_bytes = flush_records * RECORD.size
+        self.flush_seconds = flush_seconds
+        self.max_pending_bytes = max_pending_records * RECORD.size
+        self.buffer = bytearray()
+        self.last_flush = time.monotonic()
+        self._flushing: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.skipped = 0
+
+    def record(self, mac: str, weight: float, unit: str, is_stable: bool,
+               battery_level: Optional[int], error: int = 0):
+        """Buffer one reading; call from the event loop."""
+        try:
+            raw_mac = bytes.fromhex(mac.replace(":", "").replace("-", ""))
+        except ValueError:
+            raw_mac = b""
+        if len(raw_mac) != 6 or len(self.buffer) >= self.max_pending_bytes:
+            self.skipped += 1
+            return
+
+        # Timestamps never go backwards, so the replayer can binary-search them
+        t_us = max(time.time_ns() // 1000, self.last_t_us)
+        self.last_t_us = t_us
+        self.buffer += RECORD.pack(
+            t_us, raw_mac, 0, b"SCLE", weight, UNIT_CODES.get(unit, 0),
+            1 if is_stable else 0, max(0, min(255, battery_level or 0)), error,
+        )
+        self.recorded += 1
+        due = len(self.buffer) >= self.flush_bytes or time.monotonic() - self.last_flush >= self.flush_seconds
+        if due and self._flushing is None:
+            self._flushing = asyncio.get_running_loop().create_task(self._flush())
+
+    def _write(self, block: bytes):
+        self.file.write(block)
+        self.file.flush()
+
+    async def _flush(self):
+        try:
+            while self.buffer:
+                block = bytes(self.buffer)
+                self.buffer.clear()
+                await asyncio.to_thread(self._write, block)
+        except Exception:
+            logger.exception("Writing %s failed", self.file.name)
+        finally:
+            self.last_flush = time.monotonic()
+            self._flushing = None
+
+    async def close(self):
+        """Write everything buffered and close the log."""
+        if self._flushing is not None:
+            await self._flushing
+        await self._flush()
+        self.file.close()
@@ -0,0 +1,311 @@
+"""
+Sales reporting from incrementally maintained aggregates.
+
+``sales_daily`` and ``sales_hourly`` hold revenue, weight and item counts
+per day (or hour), product and operator. persist_transactions() upserts
+both in the same DB transaction as the sale, one statement each per batch,
+so reports read summary rows instead of scanning every transaction item.
+
+A requested range is answered from the coarsest summary that covers it:
+whole days from sales_daily, the whole hours left at either end from
+sales_hourly, and only the partial hours at the very ends from the raw
+tables. History written before the summaries existed (items below
+``sales_rollup_state.backfill_below_id``) is also read raw until
+backfill_sales() has folded it in, newest first, a chunk per DB
+transaction.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import os
+
+from sqlalchemy import DateTime, func, literal_column, select, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import dialect_insert
+from app.models.models import (
+    Product,
+    SalesDaily,
+    SalesHourly,
+    SalesRollupState,
+    Transaction,
+    TransactionItem,
+)
+
+BACKFILL_CHUNK = int(os.getenv("SALES_BACKFILL_CHUNK", "50000"))
+
+GROUPS = ("product", "category", "operator")
+PERIODS = ("hour", "day", "none")
+
+# (model, bucket column, bucket size), coarsest first
+SUMMARIES = (
+    (SalesDaily, SalesDaily.day, "day"),
+    (SalesHourly, SalesHourly.hour, "hour"),
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ReportError(ValueError):
+    """Raised for an invalid report request."""
+
+
+def utc_naive(ts: datetime) -> datetime:
+    """Timestamps are stored as naive UTC."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _floor(ts: datetime, size: str) -> datetime:
+    ts = utc_naive(ts).replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if size == "day" else ts
+
+
+def _ceil(ts: datetime, size: str) -> datetime:
+    floor = _floor(ts, size)
+    if floor == utc_naive(ts):
+        return floor
+    return floor + (timedelta(days=1) if size == "day" else timedelta(hours=1))
+
+
+def _bucket(dialect: str, column, size: str):
+    """`column` truncated to the start of its hour or day."""
+    if dialect == "postgresql":
+        return func.date_trunc(literal_column(f"'{size}'"), column, type_=DateTime)
+    # SQLite stores DateTime as text in this exact format; keep it comparable
+    fmt = "%Y-%m-%d %H:00:00.000000" if size == "hour" else "%Y-%m-%d 00:00:00.000000"
+    return type_coerce(func.strftime(literal_column(f"'{fmt}'"), column), DateTime)
+
+
+def _add_on_conflict(stmt, model, bucket):
+    """Make an INSERT into a summary add to existing rows instead of failing."""
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[bucket, model.product_id, model.operator_id],
+        set_={
+            # excluded.items would be ColumnCollection.items()
+            "revenue": model.revenue + excluded["revenue"],
+            "weight_g": model.weight_g + excluded["weight_g"],
+            "items": model.items + excluded["items"],
+        },
+    )
+
+
+async def record_sales(session: AsyncSession, transactions: Sequence[dict]):
+    """Add persisted transactions (as returned by persist_transactions) to the summaries."""
+    for model, bucket, size in SUMMARIES:
+        totals: Dict[Tuple[datetime, int, int], list] = {}
+        for tx in transactions:
+            start = _floor(tx["created_at"], size)
+            operator = tx.get("created_by_id") or 0
+            for line in tx["items"]:
+                key = (start, line["product_id"], operator)
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = [line["total_price"], line["weight"], 1]
+                else:
+                    total[0] += line["total_price"]
+                    total[1] += line["weight"]
+                    total[2] += 1
+        if not totals:
+            return
+        await session.execute(_add_on_conflict(dialect_insert(session, model), model, bucket), [
+            {bucket.key: start, "product_id": product_id, "operator_id": operator,
+             "revenue": revenue, "weight_g": weight, "items": items}
+            for (start, product_id, operator), (revenue, weight, items) in totals.items()
+        ])
+
+
+async def init_sales_rollup(session: AsyncSession):
+    """
+    On first start, mark every existing transaction item as backfill.
+    Must run before this process writes transactions.
+    """
+    if await session.get(SalesRollupState, 1) is not None:
+        return
+    top = await session.scalar(select(func.max(TransactionItem.id)))
+    session.add(SalesRollupState(id=1, backfill_below_id=(top or 0) + 1))
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()    # Another worker got there first
+
+
+async def backfill_chunk(session: AsyncSession, chunk: int = BACKFILL_CHUNK) -> int:
+    """Fold the newest `chunk` ids of un-summarized history in; returns ids covered."""
+    state = await session.get(SalesRollupState, 1, with_for_update=True)
+    if state is None or state.backfill_below_id <= 1:
+        return 0
+    upper = state.backfill_below_id
+    lower = max(1, upper - chunk)
+
+    dialect = session.get_bind().dialect.name
+    operator = func.coalesce(Transaction.created_by_id, 0)
+    for model, bucket, size in SUMMARIES:
+        start = _bucket(dialect, Transaction.created_at, size)
+        rows = (
+            select(
+                start, TransactionItem.product_id, operator,
+                func.sum(TransactionItem.total_price), func.sum(TransactionItem.weight), func.count(),
+            )
+            .join(Transaction, Transaction.id == TransactionItem.transaction_id)
+            .where(TransactionItem.id >= lower, TransactionItem.id < upper)
+            .group_by(start, TransactionItem.product_id, operator)
+        )
+        await session.execute(_add_on_conflict(dialect_insert(session, model).from_select(
+            [bucket.key, "product_id", "operator_id", "revenue", "weight_g", "items"], rows
+        ), model, bucket))
+    state.backfill_below_id = lower
+    await session.commit()
+    return upper - lower
+
+
+async def backfill_sales(session_factory: Callable, chunk: int = BACKFILL_CHUNK, pause: float = 0.05):
+    """Backfill the summaries in the background until all history is covered."""
+    while True:
+        try:
+            async with session_factory() as session:
+                covered = await backfill_chunk(session, chunk)
+        except Exception:
+            logger.exception("Sales summary backfill failed")
+            await asyncio.sleep(30)
+            continue
+        if not covered:
+            return
+        await asyncio.sleep(pause)
+
+
+def _plan(start: Optional[datetime], end: Optional[datetime], summaries: Sequence) -> list:
+    """
+    Split [start, end) into (summary or None for raw, start, end) segments,
+    using each summary for the whole buckets it can answer. None is open.
+    """
+    if not summaries:
+        return [(None, start, end)]
+    summary, rest = summaries[0], summaries[1:]
+    size = summary[2]
+    first = _ceil(start, size) if start else None
+    last = _floor(end, size) if end else None
+    if first and last and first >= last:
+        return _plan(start, end, rest)
+    segments = [(summary, first, last)]
+    if start and start < first:
+        segments = _plan(start, first, rest) + segments
+    if end and last < end:
+        segments += _plan(last, end, rest)
+    return segments
+
+
+def _dimensions(dialect: str, group_by: Sequence[str], period: str, summary) -> list:
+    """(name, column) pairs to select and group by (from a summary, or raw if None), and the product id column."""
+    columns = []
+    if period != "none":
+        if summary is None:
+            columns.append(("period", _bucket(dialect, Transaction.created_at, period)))
+        elif summary[2] == period:
+            columns.append(("period", summary[1]))
+        else:
+            columns.append(("period", _bucket(dialect, summary[1], period)))
+    product_id = summary[0].product_id if summary else TransactionItem.product_id
+    for group in group_by:
+        if group == "product":
+            columns.append(("product_id", product_id))
+            columns.append(("product_name", Product.name))
+        elif group == "category":
+            columns.append(("category", Product.category))
+        elif group == "operator":
+            columns.append(("operator_id", summary[0].operator_id if summary else func.coalesce(Transaction.created_by_id, 0)))
+    return columns, product_id
+
+
+async def _query(session, dialect, group_by, period, summary, start, end, below_id=None):
+    """Aggregate one segment from a summary, or from the raw tables if `summary` is None."""
+    dims, product_id = _dimensions(dialect, group_by, period, summary)
+    if summary is None:
+        query = select(
+            *(column for _, column in dims),
+            func.sum(TransactionItem.total_price), func.sum(TransactionItem.weight), func.count(TransactionItem.id),
+        ).join(Transaction, Transaction.id == TransactionItem.transaction_id)
+        bucket = Transaction.created_at
+        if below_id is not None:
+            query = query.where(TransactionItem.id < below_id)
+    else:
+        model, bucket, _ = summary
+        query = select(
+            *(column for _, column in dims),
+            func.sum(model.revenue), func.sum(model.weight_g), func.sum(model.items),
+        )
+    if "product" in group_by or "category" in group_by:
+        query = query.join(Product, Product.id == product_id)
+    if start is not None:
+        query = query.where(bucket >= start)
+    if end is not None:
+        query = query.where(bucket < end)
+    if dims:
+        query = query.group_by(*(column for _, column in dims))
+    return [name for name, _ in dims], (await session.execute(query)).all()
+
+
+async def sales_report(
+    session: AsyncSession,
+    group_by: Sequence[str] = ("product",),
+    period: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    use_summary: bool = True,
+) -> List[dict]:
+    """
+    Revenue, weight (grams) and item count over [start, end), grouped by
+    any of GROUPS and bucketed by `period`. `use_summary=False` answers
+    from the raw tables only (for comparison).
+    """
+    unknown = [group for group in group_by if group not in GROUPS]
+    if unknown:
+        raise ReportError(f"Unknown group_by {', '.join(unknown)} (expected {', '.join(GROUPS)})")
+    if period not in PERIODS:
+        raise ReportError(f"Unknown period {period} (expected {', '.join(PERIODS)})")
+    start = utc_naive(start) if start else None
+    end = utc_naive(end) if end else None
+    if start and end and start >= end:
+        raise ReportError("start must be before end")
+
+    dialect = session.get_bind().dialect.name
+    if not use_summary:
+        segments = [(None, start, end)]
+        below_id = None
+    else:
+        # Hourly reports cannot be answered from daily rows
+        summaries = [s for s in SUMMARIES if period != "hour" or s[2] == "hour"]
+        segments = _plan(start, end, summaries)
+        state = await session.get(SalesRollupState, 1)
+        below_id = state.backfill_below_id if state is not None and state.backfill_below_id > 1 else None
+
+    parts = []
+    for summary, seg_start, seg_end in segments:
+        parts.append(await _query(session, dialect, group_by, period, summary, seg_start, seg_end))
+        if summary is not None and below_id is not None:
+            # History not yet backfilled into the summaries
+            parts.append(await _query(session, dialect, group_by, period, None, seg_start, seg_end, below_id))
+
+    merged: Dict[tuple, list] = {}
+    names: List[str] = []
+    for names, rows in parts:
+        for row in rows:
+            key = tuple(row[:len(names)])
+            total = merged.setdefault(key, [0.0, 0.0, 0])
+            total[0] += row[-3] or 0.0
+            total[1] += row[-2] or 0.0
+            total[2] += row[-1] or 0
+
+    report = []
+    for key in sorted(merged, key=lambda k: tuple((v is None, v) for v in k)):
+        revenue, weight, items = merged[key]
+        row = dict(zip(names, key))
+        if "operator_id" in row:
+            row["operator_id"] = row["operator_id"] or None
+        row.update(revenue=round(revenue, 2), weight_g=round(weight, 1), items=int(items))
+        report.append(row)
+    return report
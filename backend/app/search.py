@@ -0,0 +1,558 @@
+"""
+Product quick-entry search.
+
+An in-memory prefix and trigram index over product name, SKU and category
+that answers POS type-ahead queries without touching the database. Results
+rank leading matches (start of the name or SKU) above matches on any word,
+then by popularity (how often the product has been sold), then by id.
+
+The index is kept current incrementally: products and sales newer than the
+last refresh are pulled on a short interval, so every worker converges on
+the same catalog without full rebuilds. A refresh that changes nothing
+costs two indexed queries; one that changes a few products only re-warms
+their prefixes. Full top-list rebuilds (first load, large imports) run in
+a thread on a snapshot of the index, off the event loop.
+
+Deployments that prefer DB-side search can set SEARCH_BACKEND=postgres
+(Settings.search_backend) to use pg_trgm instead; popularity then comes from product_popularity, a
+per-product count recomputed from sales_daily on the same interval.
+"""
+from array import array
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import bisect
+import heapq
+import logging
+import os
+import re
+import sys
+
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.database import dialect_insert
+from app.models.models import Product, ProductPopularity, SalesDaily, TransactionItem
+
+REFRESH_SECONDS = float(os.getenv("PRODUCT_SEARCH_REFRESH_SECONDS", "30"))
+
+MAX_LIMIT = 100
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_MAX_CHAR = "\U0010ffff"
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_FIELDS = ("id", "name", "sku", "price_per_unit", "unit", "category", "icon", "color", "is_active")
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join(_TOKEN_RE.findall((value or "").lower()))
+
+
+def _trigrams(value: str) -> Set[str]:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _popularity_rank(count: int) -> int:
+    """Bucket sale counts logarithmically so rankings rarely need re-sorting."""
+    return count.bit_length()
+
+
+# Products are ordered by one int, (popularity bucket desc, id asc), so
+# ranking compares plain ints and top lists need no key function
+_ID_BITS = 40
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def _order_key(rank: int, product_id: int) -> int:
+    return ((64 - rank) << _ID_BITS) | product_id
+
+
+class _Doc:
+    __slots__ = ("product", "leads", "words", "rank")
+
+    def __init__(self, product: dict, rank: int):
+        self.product = product
+        name = _normalize(product["name"])
+        sku = _normalize(product["sku"])
+        self.leads = tuple(sys.intern(lead) for lead in (name, sku) if lead)
+        self.words = tuple(sorted({
+            sys.intern(word)
+            for word in name.split() + sku.split() + _normalize(product["category"]).split()
+        }))
+        self.rank = rank
+
+
+class _SortedPostings:
+    """
+    (word, product id) pairs kept in word order, so every prefix of a word
+    maps to one contiguous slice found with two binary searches.
+    """
+
+    def __init__(self):
+        self.words: List[str] = []
+        self.ids = array("q")
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def copy(self) -> "_SortedPostings":
+        snapshot = _SortedPostings()
+        snapshot.words = list(self.words)
+        snapshot.ids = array("q", self.ids)
+        return snapshot
+
+    def rebuild(self, pairs):
+        pairs = sorted(pairs)
+        self.words = [word for word, _ in pairs]
+        self.ids = array("q", (pid for _, pid in pairs))
+
+    def pairs(self):
+        return zip(self.words, self.ids)
+
+    def add(self, word: str, pid: int):
+        i = bisect.bisect_left(self.words, word)
+        self.words.insert(i, word)
+        self.ids.insert(i, pid)
+
+    def discard(self, word: str, pid: int):
+        i = bisect.bisect_left(self.words, word)
+        while i < len(self.words) and self.words[i] == word:
+            if self.ids[i] == pid:
+                del self.words[i]
+                del self.ids[i]
+                return
+            i += 1
+
+    def span(self, prefix: str):
+        lo = bisect.bisect_left(self.words, prefix)
+        return lo, bisect.bisect_left(self.words, prefix + _MAX_CHAR, lo)
+
+
+class ProductSearchIndex:
+    """Prefix/trigram index over active products, ranked by popularity."""
+
+    # Kept per broad prefix: enough to fill the largest page after de-duplication
+    TOP_K = 2 * MAX_LIMIT
+    # Top lists are built this long, so products leaving them (re-ranked or
+    # removed) rarely shrink one below TOP_K and force a rebuild
+    TOP_KEEP = 2 * TOP_K
+    # Prefix slices up to this many entries are ranked on the fly; broader
+    # ones use a top list maintained as products and sales change
+    RANK_DIRECTLY = 64
+    # Batches larger than this fraction of the index are merged by re-sorting
+    REBUILD_FRACTION = 0.05
+    # Id sets of broad word prefixes kept for multi-word queries, which
+    # repeat the finished words on every keystroke of the next one; bounded
+    # by the ids held (about 50 bytes each)
+    WORD_SET_IDS = 200_000
+
+    def __init__(self):
+        self._docs: Dict[int, _Doc] = {}
+        self._order: Dict[int, int] = {}
+        self._postings = {"lead": _SortedPostings(), "word": _SortedPostings()}
+        self._trigram_postings: Dict[str, array] = {}
+        self._top: Dict[tuple, List[int]] = {}
+        self._top_depth = 0  # longest prefix with a top list
+        self._word_sets: "OrderedDict[str, Set[int]]" = OrderedDict()
+        self._word_set_ids = 0
+        self._sales: Counter = Counter()
+        self._products_seen_at = None
+        self._last_item_id = 0
+        # Bumped by every change to postings or ranking, so a top-list build
+        # running on a snapshot can tell whether it is still current
+        self._generation = 0
+        # Entries whose prefixes may need a top list (re)built, or all of them
+        self._stale: Set[Tuple[str, str]] = set()
+        self._stale_all = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # -- maintenance --------------------------------------------------------
+
+    @staticmethod
+    def _entries(doc: _Doc):
+        return [("lead", lead) for lead in doc.leads] + [("word", word) for word in doc.words]
+
+    def upsert(self, product):
+        """Add or replace one product (ORM object or dict); inactive ones are removed."""
+        self.upsert_many([product])
+
+    def upsert_many(self, products):
+        """Add or replace many products, merging large batches in one pass."""
+        docs = []
+        for product in products:
+            if not isinstance(product, dict):
+                product = {field: getattr(product, field) for field in PRODUCT_FIELDS}
+            current = self._docs.get(product["id"])
+            if current is not None and current.product == product:
+                continue
+            self.remove(product["id"])
+            if product["is_active"]:
+                docs.append(_Doc(product, _popularity_rank(self._sales[product["id"]])))
+        if not docs:
+            return
+
+        self._changed()
+        for doc in docs:
+            self._docs[doc.product["id"]] = doc
+            self._order[doc.product["id"]] = _order_key(doc.rank, doc.product["id"])
+            for gram in _trigrams(doc.leads[0]) if doc.leads else ():
+                self._trigram_postings.setdefault(gram, array("q")).append(doc.product["id"])
+
+        if len(docs) > self.REBUILD_FRACTION * len(self._docs):
+            for kind, postings in self._postings.items():
+                postings.rebuild(
+                    list(postings.pairs())
+                    + [(text, doc.product["id"]) for doc in docs for k, text in self._entries(doc) if k == kind]
+                )
+            self._top.clear()
+            self._top_depth = 0
+            self._stale_all = True
+            return
+
+        for doc in docs:
+            pid = doc.product["id"]
+            for kind, text in self._entries(doc):
+                self._postings[kind].add(text, pid)
+                self._place(kind, text, pid)
+                self._stale.add((kind, text))
+
+    def remove(self, product_id: int):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        self._changed()
+        for kind, text in self._entries(doc):
+            self._postings[kind].discard(text, product_id)
+            self._displace(kind, text, product_id)
+            self._stale.add((kind, text))
+        del self._order[product_id]
+        for gram in _trigrams(doc.leads[0]) if doc.leads else ():
+            ids = self._trigram_postings[gram]
+            ids.remove(product_id)
+            if not ids:
+                del self._trigram_postings[gram]
+
+    def add_sales(self, counts: Dict[int, int]):
+        """Fold in sale counts; only products whose rank bucket moves are re-ranked."""
+        for product_id, count in counts.items():
+            self._sales[product_id] += count
+            doc = self._docs.get(product_id)
+            if doc is None:
+                continue
+            rank = _popularity_rank(self._sales[product_id])
+            if rank != doc.rank:
+                self._generation += 1
+                entries = self._entries(doc)
+                for kind, text in entries:
+                    self._displace(kind, text, product_id)
+                doc.rank = rank
+                self._order[product_id] = _order_key(rank, product_id)
+                for kind, text in entries:
+                    self._place(kind, text, product_id)
+                self._stale.update(entries)
+
+    def _cached_tops(self, kind: str, text: str):
+        """Top lists whose prefix covers `text`."""
+        for n in range(1, min(len(text), self._top_depth) + 1):
+            top = self._top.get((kind, text[:n]))
+            if top is not None:
+                yield (kind, text[:n]), top
+
+    def _place(self, kind: str, text: str, product_id: int):
+        """Insert a product into cached top lists it now ranks high enough for."""
+        order = self._order[product_id]
+        for _, top in self._cached_tops(kind, text):
+            if len(top) >= self.TOP_K and order >= top[-1]:
+                continue
+            i = bisect.bisect_left(top, order)
+            if i == len(top) or top[i] != order:
+                top.insert(i, order)
+                del top[self.TOP_KEEP:]
+
+    def _displace(self, kind: str, text: str, product_id: int):
+        """Take a product out of cached top lists; a list that runs short is rebuilt on demand."""
+        order = self._order[product_id]
+        for key, top in list(self._cached_tops(kind, text)):
+            i = bisect.bisect_left(top, order)
+            if i < len(top) and top[i] == order:
+                del top[i]
+                if len(top) < self.TOP_K:
+                    del self._top[key]
+
+    def _changed(self):
+        self._generation += 1
+        self._word_sets.clear()
+        self._word_set_ids = 0
+
+    def clear(self):
+        self.__init__()
+
+    async def refresh(self, session: AsyncSession):
+        """
+        Pull products and sales changed since the last refresh, then build
+        the top lists they invalidated (all of them in a thread after a
+        large batch).
+        """
+        query = select(Product)
+        if self._products_seen_at is not None:
+            # >= so rows committed later with the same timestamp are not missed
+            query = query.where(Product.updated_at >= self._products_seen_at)
+        products = (await session.scalars(query)).all()
+        self.upsert_many(products)
+        for product in products:
+            if self._products_seen_at is None or product.updated_at > self._products_seen_at:
+                self._products_seen_at = product.updated_at
+
+        rows = (await session.execute(
+            select(TransactionItem.product_id, func.count(), func.max(TransactionItem.id))
+            .where(TransactionItem.id > self._last_item_id)
+            .group_by(TransactionItem.product_id)
+        )).all()
+        if rows:
+            self.add_sales({row[0]: row[1] for row in rows})
+            self._last_item_id = max(row[2] for row in rows)
+        if self._stale_all:
+            await self.warm_in_thread()
+        else:
+            self._warm_stale()
+
+    def _broad_prefixes(self, postings: _SortedPostings, texts: Iterable[str]):
+        """Prefixes of `texts` too broad to rank on the fly."""
+        checked = set()
+        for text in texts:
+            for n in range(1, len(text) + 1):
+                prefix = text[:n]
+                if prefix in checked:
+                    continue
+                checked.add(prefix)
+                lo, hi = postings.span(prefix)
+                if hi - lo <= self.RANK_DIRECTLY:
+                    break  # longer prefixes of this text are narrower still
+                yield prefix, lo, hi
+
+    def _warm_stale(self):
+        """Build missing top lists for the prefixes of changed entries only."""
+        stale, self._stale = self._stale, set()
+        for kind, postings in self._postings.items():
+            texts = {text for k, text in stale if k == kind}
+            for prefix, _, _ in self._broad_prefixes(postings, texts):
+                if (kind, prefix) not in self._top:
+                    self._ranked(kind, prefix, self.TOP_K)
+
+    def _build_tops(self, postings: Dict[str, _SortedPostings], order: Dict[int, int]) -> Dict[tuple, List[int]]:
+        """Top lists for every broad prefix, computed from `postings` and `order` alone."""
+        tops = {}
+        for kind, kind_postings in postings.items():
+            for prefix, lo, hi in self._broad_prefixes(kind_postings, set(kind_postings.words)):
+                orders = map(order.__getitem__, set(kind_postings.ids[lo:hi]))
+                tops[(kind, prefix)] = sorted(orders)[:self.TOP_KEEP]
+        return tops
+
+    def _install_tops(self, tops: Dict[tuple, List[int]], generation: int) -> bool:
+        if generation != self._generation:
+            return False  # The index changed meanwhile; lists are built on demand
+        self._top.update(tops)
+        self._top_depth = max([self._top_depth] + [len(prefix) for _, prefix in tops])
+        self._stale_all = False
+        self._stale.clear()
+        return True
+
+    def warm(self):
+        """Build top lists for every prefix too broad to rank on the fly."""
+        self._install_tops(self._build_tops(self._postings, self._order), self._generation)
+
+    async def warm_in_thread(self) -> bool:
+        """
+        warm() on a snapshot in a worker thread, so searches keep being served.
+        Returns False if the index changed meanwhile and the lists were dropped.
+        """
+        generation = self._generation
+        postings = {kind: postings.copy() for kind, postings in self._postings.items()}
+        tops = await asyncio.to_thread(self._build_tops, postings, dict(self._order))
+        return self._install_tops(tops, generation)
+
+    # -- queries ------------------------------------------------------------
+
+    def _best_orders(self, ids, limit: int) -> List[int]:
+        orders = map(self._order.__getitem__, ids)
+        if limit >= self.TOP_K:
+            return sorted(orders)[:limit]
+        return heapq.nsmallest(limit, orders)
+
+    def _best(self, ids, limit: int) -> List[int]:
+        return [order & _ID_MASK for order in self._best_orders(ids, limit)]
+
+    def _ranked(self, kind: str, prefix: str, limit: int) -> List[int]:
+        """Best products with a `kind` entry starting with `prefix`."""
+        key = (kind, prefix)
+        top = self._top.get(key)
+        if top is None:
+            postings = self._postings[kind]
+            lo, hi = postings.span(prefix)
+            if hi - lo <= self.RANK_DIRECTLY:
+                return self._best(set(postings.ids[lo:hi]), limit)
+            top = self._top[key] = self._best_orders(set(postings.ids[lo:hi]), self.TOP_KEEP)
+            self._top_depth = max(self._top_depth, len(prefix))
+        return [order & _ID_MASK for order in top[:limit]]
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """Return up to `limit` products matching `query`, best first."""
+        normalized = _normalize(query)
+        limit = min(limit, MAX_LIMIT)
+        if not normalized or limit <= 0:
+            return []
+
+        # Leading matches (name or SKU starts with the query) come first
+        ids = self._ranked("lead", normalized, limit)
+        if len(ids) < limit:
+            terms = normalized.split()
+            if len(terms) == 1:
+                rest = self._ranked("word", normalized, limit + len(ids))
+            else:
+                rest = self._search_words(terms, limit + len(ids))
+            seen = set(ids)
+            ids += [pid for pid in rest if pid not in seen][:limit - len(ids)]
+        if not ids:
+            ids = self._search_trigrams(normalized, limit)
+        return [self._docs[pid].product for pid in ids]
+
+    def _word_ids(self, term: str, lo: int, hi: int) -> Set[int]:
+        """Ids of products with a word starting with `term` (do not modify)."""
+        ids = self._word_sets.get(term)
+        if ids is not None:
+            self._word_sets.move_to_end(term)
+            return ids
+        ids = set(self._postings["word"].ids[lo:hi])
+        if self.RANK_DIRECTLY < len(ids) <= self.WORD_SET_IDS:
+            self._word_sets[term] = ids
+            self._word_set_ids += len(ids)
+            while self._word_set_ids > self.WORD_SET_IDS:
+                self._word_set_ids -= len(self._word_sets.popitem(last=False)[1])
+        return ids
+
+    def _search_words(self, terms: List[str], limit: int) -> List[int]:
+        """Products with a word starting with every term."""
+        postings = self._postings["word"]
+        by_width = sorted(((postings.span(term), term) for term in terms), key=lambda item: item[0][1] - item[0][0])
+        (lo, hi), term = by_width[0]
+        candidates = self._word_ids(term, lo, hi)
+        docs = self._docs
+        for (lo, hi), term in by_width[1:]:
+            if not candidates:
+                break
+            if hi - lo > 8 * len(candidates) and term not in self._word_sets:
+                # Cheaper to check the few candidates than to walk a broad slice
+                candidates = {
+                    pid for pid in candidates
+                    if any(word.startswith(term) for word in docs[pid].words)
+                }
+            else:
+                # Iterates the smaller set; neither operand is modified
+                candidates = candidates & self._word_ids(term, lo, hi)
+        return self._best(candidates, limit)
+
+    def _search_trigrams(self, normalized: str, limit: int) -> List[int]:
+        """Fuzzy fallback on names: rank by shared trigrams, then popularity."""
+        grams = _trigrams(normalized)
+        overlap: Counter = Counter()
+        for gram in grams:
+            overlap.update(self._trigram_postings.get(gram, ()))
+        threshold = max(1, len(grams) // 2)
+        order = self._order
+        return heapq.nsmallest(
+            limit,
+            (pid for pid, hits in overlap.items() if hits >= threshold),
+            key=lambda pid: (-overlap[pid], order[pid]),
+        )
+
+
+async def refresh_periodically(index: ProductSearchIndex, session_factory: Callable,
+                               interval: float = REFRESH_SECONDS):
+    """Keep `index` in step with changes made by other workers."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as session:
+                await index.refresh(session)
+        except Exception:
+            logger.exception("Product search index refresh failed")
+
+
+# -- PostgreSQL trigram backend ---------------------------------------------
+
+async def refresh_popularity(session: AsyncSession):
+    """Recount units sold per product from sales_daily into product_popularity."""
+    totals = select(SalesDaily.product_id, func.sum(SalesDaily.items)).group_by(SalesDaily.product_id)
+    stmt = dialect_insert(session, ProductPopularity).from_select(["product_id", "items"], totals)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[ProductPopularity.product_id], set_={"items": stmt.excluded["items"]},
+    ))
+    await session.commit()
+
+
+async def refresh_popularity_periodically(session_factory: Callable, interval: float = REFRESH_SECONDS):
+    """Keep product_popularity current for search_products_db()."""
+    while True:
+        try:
+            async with session_factory() as session:
+                await refresh_popularity(session)
+        except Exception:
+            logger.exception("Product popularity refresh failed")
+        await asyncio.sleep(interval)
+
+
+TRIGRAM_INDEXES = {
+    "ix_products_name_trgm": "name",
+    "ix_products_sku_trgm": "sku",
+    "ix_products_category_trgm": "category",
+}
+
+
+async def ensure_trigram_indexes(conn: AsyncConnection):
+    """Create pg_trgm and GIN trigram indexes used by the postgres backend."""
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for name, column in TRIGRAM_INDEXES.items():
+        await conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {name} ON products USING gin ({column} gin_trgm_ops)"
+        ))
+
+
+async def search_products_db(session: AsyncSession, query: str, limit: int = 20) -> List[Product]:
+    """
+    Same ranking intent as the in-memory index, evaluated by PostgreSQL.
+    Popularity is read from product_popularity (one row per product), not
+    aggregated from sales on every keystroke.
+    """
+    pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    leading = or_(Product.name.ilike(f"{pattern}%"), Product.sku.ilike(f"{pattern}%"))
+    similarity = func.greatest(
+        func.similarity(Product.name, query),
+        func.similarity(func.coalesce(Product.sku, ""), query),
+        func.similarity(func.coalesce(Product.category, ""), query),
+    )
+    result = await session.scalars(
+        select(Product)
+        .outerjoin(ProductPopularity, ProductPopularity.product_id == Product.id)
+        .where(
+            Product.is_active.is_(True),
+            or_(
+                Product.name.ilike(f"%{pattern}%"),
+                Product.sku.ilike(f"%{pattern}%"),
+                Product.category.ilike(f"%{pattern}%"),
+                Product.name.op("%")(query),
+            ),
+        )
+        .order_by(
+            leading.desc(),
+            func.coalesce(ProductPopularity.items, 0).desc(),
+            similarity.desc(),
+            Product.name,
+        )
+        .limit(limit)
+    )
+    return result.all()
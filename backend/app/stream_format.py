@@ -0,0 +1,45 @@
+"""
+On-disk format of scale stream logs, written by the backend's measurement
+recorder (recording.py). The emulator reads and writes the same logs but
+runs without the backend, so emulator/stream_format.py is a copy of this
+module: change both together (the layout tests in each pin the bytes).
+
+A 16-byte header (magic, record size) is followed by fixed 28-byte records:
+a microsecond timestamp, the device MAC and the 12-byte SCLE weight packet
+exactly as the scale sends it. Timestamps never decrease within a log, so
+readers can binary-search them.
+"""
+from typing import BinaryIO, Tuple
+import os
+import struct
+
+FILE_MAGIC = b"SCLLOG1\0"
+FILE_HEADER = struct.Struct("<8sII")     # magic, record size, reserved
+RECORD = struct.Struct("<q6sH4sfBBBB")   # t_us, mac, reserved, SCLE packet
+UNIT_CODES = {"g": 0, "kg": 1, "lb": 2, "oz": 3}
+
+
+def open_for_append(path: str) -> Tuple[BinaryIO, int]:
+    """
+    Open a log for appending, creating it if needed. Returns the file and
+    the timestamp of its last record (0 if none), so new records can
+    continue from it. A record cut short by a crash is truncated away.
+    """
+    log = open(path, "a+b")
+    size = log.seek(0, os.SEEK_END)
+    if size < FILE_HEADER.size:
+        log.truncate(0)
+        log.write(FILE_HEADER.pack(FILE_MAGIC, RECORD.size, 0))
+        return log, 0
+    log.seek(0)
+    magic, record_size, _ = FILE_HEADER.unpack(log.read(FILE_HEADER.size))
+    if magic != FILE_MAGIC or record_size != RECORD.size:
+        log.close()
+        raise ValueError(f"{path} is not a scale stream log")
+    end = size - (size - FILE_HEADER.size) % RECORD.size
+    if end != size:
+        log.truncate(end)
+    if end == FILE_HEADER.size:
+        return log, 0
+    log.seek(end - RECORD.size)
+    return log, RECORD.unpack(log.read(RECORD.size))[0]
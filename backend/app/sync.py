@@ -0,0 +1,205 @@
+"""
+Offline sync: apply a compressed bundle of queued transactions and
+measurements from a mobile client in one request.
+
+Every item carries an idempotency key generated by the client, which
+identifies itself with the bundle's ``client_id``; keys only need to be
+unique per client. Keys already applied are found with a single lookup
+against the unique (client_id, idempotency_key) index on
+``sync_receipts``, and everything new is written with bulk inserts inside
+the request's DB transaction, so replaying a backlog costs a handful of
+statements instead of one request per item.
+
+The body is read as it streams in and refused once it passes
+MAX_UPLOAD_BYTES, before anything is decompressed.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+import io
+import os
+import zlib
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import Device, Measurement, SyncReceipt, WeightUnit
+from app.transactions import load_prices, persist_transactions
+
+MAX_BUNDLE_BYTES = int(os.getenv("SYNC_MAX_BUNDLE_BYTES", str(16 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("SYNC_MAX_UPLOAD_BYTES", str(MAX_BUNDLE_BYTES)))
+KEY_LOOKUP_CHUNK = 5000
+
+
+class BundleError(ValueError):
+    """Raised when an upload cannot be decoded."""
+
+    def __init__(self, message: str, unsupported: bool = False, too_large: bool = False):
+        self.unsupported = unsupported
+        self.too_large = too_large
+        super().__init__(message)
+
+
+async def read_body(chunks: AsyncIterator[bytes], max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Collect a request body, refusing it once it passes `max_bytes`."""
+    body = bytearray()
+    async for chunk in chunks:
+        if len(body) + len(chunk) > max_bytes:
+            raise BundleError(f"Upload exceeds {max_bytes} bytes", too_large=True)
+        body += chunk
+    return bytes(body)
+
+
+def decode_bundle(body: bytes, encoding: Optional[str], max_bytes: int = MAX_BUNDLE_BYTES) -> bytes:
+    """
+    Decompress an upload body according to its Content-Encoding.
+
+    Output is capped at `max_bytes` so a small compressed body cannot
+    expand into an unbounded allocation.
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip"):
+        try:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = decompressor.decompress(body, max_bytes + 1)
+        except zlib.error as e:
+            raise BundleError(f"Invalid gzip body: {e}")
+        if not decompressor.eof and len(data) <= max_bytes:
+            raise BundleError("Truncated gzip body")
+    elif encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise BundleError("zstd uploads are not supported on this server", unsupported=True)
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body))
+            data = reader.read(max_bytes + 1)
+        except zstandard.ZstdError as e:
+            raise BundleError(f"Invalid zstd body: {e}")
+    else:
+        raise BundleError(f"Unsupported Content-Encoding: {encoding}", unsupported=True)
+
+    if len(data) > max_bytes:
+        raise BundleError(f"Bundle exceeds {max_bytes} bytes once decompressed", too_large=True)
+    return data
+
+
+def _result(key: str, kind: str, status: str, result_id: int = None, error: str = None) -> dict:
+    return {"idempotency_key": key, "kind": kind, "status": status, "id": result_id, "error": error}
+
+
+async def _applied_keys(session: AsyncSession, client_id: str, keys: Sequence[str]) -> Dict[str, tuple]:
+    """Look up which of a client's keys were applied before: key -> (kind, result_id)."""
+    applied = {}
+    for start in range(0, len(keys), KEY_LOOKUP_CHUNK):
+        rows = await session.execute(
+            select(SyncReceipt.idempotency_key, SyncReceipt.kind, SyncReceipt.result_id).where(
+                SyncReceipt.client_id == client_id,
+                SyncReceipt.idempotency_key.in_(keys[start:start + KEY_LOOKUP_CHUNK]),
+            )
+        )
+        applied.update({row.idempotency_key: (row.kind, row.result_id) for row in rows})
+    return applied
+
+
+async def apply_bundle(session: AsyncSession, client_id: str, transactions: Sequence, measurements: Sequence,
+                       next_number) -> List[dict]:
+    """
+    Apply new items from a client's bundle and report one result per item,
+    in order (transactions first, then measurements).
+
+    Items whose key the client used before, or repeats within the bundle, come
+    back as ``duplicate`` with the id of the original row. Items that fail
+    validation come back as ``rejected`` without affecting the rest.
+    """
+    items = [("transaction", t) for t in transactions] + [("measurement", m) for m in measurements]
+    applied = await _applied_keys(session, client_id, list({item.idempotency_key for _, item in items}))
+
+    results: List[Optional[dict]] = [None] * len(items)
+    first_seen: Dict[str, int] = {}
+    repeats = []
+    fresh_tx, fresh_ms = [], []
+    for index, (kind, item) in enumerate(items):
+        key = item.idempotency_key
+        if key in applied:
+            prior_kind, prior_id = applied[key]
+            results[index] = _result(key, prior_kind, "duplicate", prior_id)
+        elif key in first_seen:
+            results[index] = _result(key, kind, "duplicate")
+            repeats.append((index, first_seen[key]))
+        else:
+            first_seen[key] = index
+            (fresh_tx if kind == "transaction" else fresh_ms).append((index, item))
+
+    receipts = []
+
+    # Transactions: one price lookup for the whole bundle
+    prices = await load_prices(
+        session, (line.product_id for _, tx in fresh_tx for line in tx.items)
+    )
+    valid_tx = []
+    for index, tx in fresh_tx:
+        missing = sorted({line.product_id for line in tx.items} - prices.keys())
+        if missing:
+            results[index] = _result(tx.idempotency_key, "transaction", "rejected",
+                                     error=f"Unknown product ids: {missing}")
+        else:
+            valid_tx.append((index, tx))
+    created = await persist_transactions(session, [tx for _, tx in valid_tx], next_number, prices=prices)
+    for (index, tx), row in zip(valid_tx, created):
+        results[index] = _result(tx.idempotency_key, "transaction", "applied", row["id"])
+        receipts.append({"client_id": client_id, "idempotency_key": tx.idempotency_key,
+                         "kind": "transaction", "result_id": row["id"]})
+
+    # Measurements: resolve every MAC in one query, then one bulk insert
+    macs = {m.device_mac for _, m in fresh_ms}
+    devices = {}
+    if macs:
+        rows = await session.execute(
+            select(Device.mac_address, Device.id).where(Device.mac_address.in_(macs))
+        )
+        devices = {row.mac_address: row.id for row in rows}
+    now = datetime.utcnow()
+    valid_ms, measurement_rows = [], []
+    for index, m in fresh_ms:
+        error = None
+        if m.device_mac not in devices:
+            error = f"Unknown device: {m.device_mac}"
+        else:
+            try:
+                unit = WeightUnit(m.unit)
+            except ValueError:
+                error = f"Unknown unit: {m.unit}"
+        if error:
+            results[index] = _result(m.idempotency_key, "measurement", "rejected", error=error)
+            continue
+        valid_ms.append((index, m))
+        measurement_rows.append({
+            "device_id": devices[m.device_mac],
+            "weight": m.weight,
+            "unit": unit,
+            "is_stable": m.is_stable,
+            "battery_level": m.battery_level,
+            "timestamp": m.timestamp or now,
+        })
+    if measurement_rows:
+        ids = (
+            await session.scalars(
+                insert(Measurement).returning(Measurement.id, sort_by_parameter_order=True),
+                measurement_rows,
+            )
+        ).all()
+        for (index, m), measurement_id in zip(valid_ms, ids):
+            results[index] = _result(m.idempotency_key, "measurement", "applied", measurement_id)
+            receipts.append({"client_id": client_id, "idempotency_key": m.idempotency_key,
+                             "kind": "measurement", "result_id": measurement_id})
+
+    if receipts:
+        await session.execute(insert(SyncReceipt), receipts)
+
+    # Repeats within the bundle point at whatever their first copy became
+    for index, first in repeats:
+        results[index]["id"] = results[first]["id"]
+
+    return results
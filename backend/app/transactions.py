@@ -0,0 +1,128 @@
+"""
+Transaction pricing and persistence.
+
+Prices are always taken from the catalog, never from the client, and a
+batch of transactions is written with a fixed number of statements no
+matter how many items it holds: one price lookup, one multi-row insert
+for the transactions, one for all of their items and one upsert into the
+hourly sales summary (see reports.py).
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import Product, Transaction, TransactionItem, WeightUnit
+from app.reports import record_sales
+
+# Grams per pricing unit (TransactionItem.weight is always in grams)
+GRAMS_PER_UNIT = {
+    WeightUnit.GRAMS: 1.0,
+    WeightUnit.KILOGRAMS: 1000.0,
+    WeightUnit.POUNDS: 453.59237,
+    WeightUnit.OUNCES: 28.349523125,
+}
+
+
+class UnknownProductError(ValueError):
+    """Raised when an order references products that are missing or inactive."""
+
+    def __init__(self, product_ids: Iterable[int]):
+        self.product_ids = sorted(set(product_ids))
+        super().__init__(f"Unknown product ids: {self.product_ids}")
+
+
+def line_total(weight_g: float, price_per_unit: float, unit: WeightUnit) -> float:
+    """Price of `weight_g` grams of a product sold per `unit`."""
+    return round(weight_g / GRAMS_PER_UNIT[WeightUnit(unit)] * price_per_unit, 2)
+
+
+async def load_prices(
+    session: AsyncSession, product_ids: Iterable[int]
+) -> Dict[int, Tuple[float, WeightUnit]]:
+    """Fetch (price_per_unit, unit) for all active products in one query."""
+    ids = set(product_ids)
+    if not ids:
+        return {}
+    rows = await session.execute(
+        select(Product.id, Product.price_per_unit, Product.unit).where(
+            Product.id.in_(ids), Product.is_active.is_(True)
+        )
+    )
+    return {row.id: (row.price_per_unit, row.unit) for row in rows}
+
+
+async def persist_transactions(
+    session: AsyncSession,
+    orders: Sequence,
+    next_number: Callable[[], str],
+    created_by_id: Optional[int] = None,
+    prices: Optional[Dict[int, Tuple[float, WeightUnit]]] = None,
+) -> List[dict]:
+    """
+    Price and insert a batch of orders inside the caller's DB transaction.
+
+    Each order needs ``items`` (objects with ``product_id`` and ``weight``
+    in grams), ``payment_method`` and ``notes``; an optional ``created_at``
+    is kept (offline uploads). Returns one dict per order, in order, with
+    the stored transaction columns plus the priced item rows. Pass
+    ``prices`` from :func:`load_prices` to reuse an earlier lookup.
+    """
+    if prices is None:
+        prices = await load_prices(
+            session, (item.product_id for order in orders for item in order.items)
+        )
+    missing = {
+        item.product_id
+        for order in orders
+        for item in order.items
+        if item.product_id not in prices
+    }
+    if missing:
+        raise UnknownProductError(missing)
+
+    now = datetime.utcnow()
+    tx_rows, item_rows = [], []
+    for order in orders:
+        lines = []
+        for item in order.items:
+            price, unit = prices[item.product_id]
+            lines.append({
+                "product_id": item.product_id,
+                "weight": item.weight,
+                "unit_price": price,
+                "total_price": line_total(item.weight, price, unit),
+            })
+        tx_rows.append({
+            "transaction_number": next_number(),
+            "total_amount": round(sum(line["total_price"] for line in lines), 2),
+            "payment_method": order.payment_method,
+            "notes": order.notes,
+            "created_by_id": created_by_id,
+            "created_at": getattr(order, "created_at", None) or now,
+        })
+        item_rows.append(lines)
+
+    if not tx_rows:
+        return []
+
+    ids = (
+        await session.scalars(
+            insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+            tx_rows,
+        )
+    ).all()
+
+    flat_items = []
+    for tx_id, tx_row, lines in zip(ids, tx_rows, item_rows):
+        tx_row["id"] = tx_id
+        tx_row["items"] = lines
+        for line in lines:
+            line["transaction_id"] = tx_id
+            flat_items.append(line)
+    if flat_items:
+        await session.execute(insert(TransactionItem), flat_items)
+        await record_sales(session, tx_rows)
+
+    return tx_rows
@@ -0,0 +1,129 @@
+"""
+Transaction number allocation.
+
+Numbers look like ``TX241019153045070042``: ``TX``, the UTC second
+(``yymmddHHMMSS``), a two-digit worker id and a four-digit per-second
+sequence. That fits ``Transaction.transaction_number`` (20 chars), sorts
+by time, and never collides as long as every process has its own worker id
+(see resolve_worker_id). Should two processes share one anyway, the
+database's unique constraint rejects the repeat and the sale is retried.
+Allocation is purely in-memory, so it costs no database round trip.
+
+A restarted process must not reissue numbers from the seconds it used
+before (including seconds borrowed ahead of the clock), so the allocator
+is seeded with the newest number already in the database and starts
+after its second.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, TextIO
+import os
+import tempfile
+import threading
+import time
+
+MAX_WORKERS = 100
+SEQUENCE_PER_SECOND = 10_000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class TransactionNumberAllocator:
+    """Snowflake-style allocator: time + worker id + sequence."""
+
+    def __init__(self, worker_id: int, clock: Callable[[], float] = time.time, issued_until: int = 0):
+        """`issued_until`: last second that may already have numbers (see number_second)."""
+        if not 0 <= worker_id < MAX_WORKERS:
+            raise ValueError(f"worker_id must be in [0, {MAX_WORKERS})")
+        self.worker_id = worker_id
+        self.clock = clock
+        self._second = issued_until
+        # Treat that second as used up, so allocation resumes after it
+        self._sequence = SEQUENCE_PER_SECOND if issued_until else 0
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        """Allocate the next transaction number."""
+        with self._lock:
+            now = int(self.clock())
+            if now > self._second:
+                self._second = now
+                self._sequence = 0
+            elif self._sequence >= SEQUENCE_PER_SECOND:
+                # Sequence exhausted (or the clock stepped back): borrow the
+                # next second rather than block or reuse a number.
+                self._second += 1
+                self._sequence = 0
+            second, sequence = self._second, self._sequence
+            self._sequence += 1
+
+        stamp = (_EPOCH + timedelta(seconds=second)).strftime("%y%m%d%H%M%S")
+        return f"TX{stamp}{self.worker_id:02d}{sequence:04d}"
+
+
+def number_second(number: Optional[str]) -> int:
+    """The second a transaction number was allocated in (0 if it is not one of ours)."""
+    if not number or len(number) != 20 or not number.startswith("TX"):
+        return 0
+    try:
+        stamp = datetime.strptime(number[2:14], "%y%m%d%H%M%S")
+    except ValueError:
+        return 0
+    return int((stamp - _EPOCH).total_seconds())
+
+
+# Lock files of the worker ids claimed by this process, held until released
+_claimed: Dict[int, TextIO] = {}
+
+
+def resolve_worker_id(first: Optional[int], count: int = 1, single_host: bool = False) -> int:
+    """
+    Claim a worker id, unique among the processes on this host.
+
+    `first` (Settings.worker_id, ``WORKER_ID``) is the first id of this
+    host's range and `count` (``WORKER_PROCESSES``) its size. Each process
+    (or app) claims a free id from the range with an exclusive lock file,
+    so sibling workers (``uvicorn --workers N``, gunicorn) that inherit the
+    same environment still get different ids, and one that finds the range
+    full refuses to start. Hosts sharing a database need ranges that do
+    not overlap, since lock files cannot keep hosts apart. Without
+    WORKER_ID, only a database written by a single host (`single_host`,
+    e.g. the embedded SQLite mode) may claim from every id.
+    """
+    if first is not None:
+        if first < 0 or count < 1 or first + count > MAX_WORKERS:
+            raise RuntimeError(f"WORKER_ID and WORKER_PROCESSES must keep worker ids in [0, {MAX_WORKERS})")
+        candidates = range(first, first + count)
+    elif single_host:
+        candidates = range(MAX_WORKERS)
+    else:
+        raise RuntimeError(
+            "Set WORKER_ID (unique per host) when several hosts may share the database"
+        )
+
+    import fcntl
+
+    lock_dir = os.getenv("WORKER_LOCK_DIR", tempfile.gettempdir())
+    for worker_id in candidates:
+        if worker_id in _claimed:
+            continue
+        handle = open(os.path.join(lock_dir, f"ble-scale-worker-{worker_id}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _claimed[worker_id] = handle
+        return worker_id
+    if first is not None:
+        raise RuntimeError(
+            f"Worker ids {candidates.start}-{candidates.stop - 1} are all in use on this host; "
+            f"set WORKER_PROCESSES to the number of worker processes"
+        )
+    raise RuntimeError("No free transaction worker slot; set WORKER_ID explicitly")
+
+
+def release_worker_id(worker_id: int):
+    """Give up a worker id claimed by resolve_worker_id()."""
+    handle = _claimed.pop(worker_id, None)
+    if handle is not None:
+        handle.close()
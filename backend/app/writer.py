@@ -0,0 +1,175 @@
+"""
+Batched database writes from a single task.
+
+Scale readings always go through a WriteQueue; in the embedded (SQLite)
+mode sales and sync uploads do too, since SQLite allows one writer at a
+time (see edge.py). Each batch takes whatever queued up while the
+previous one was committing and applies it in one DB transaction, so a
+burst costs one commit instead of one per request. If a batch fails its
+entries are retried one at a time, so a bad job only fails its own caller.
+Readings cost one device lookup and one multi-row insert per batch.
+
+Callers await their entry, so a request holds its load-shedding slot
+until its write is committed, and every batch reports how long it waited
+for a pooled connection.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import Device, Measurement, WeightUnit
+
+WRITE_BATCH = int(os.getenv("WRITE_BATCH", "256"))
+READING_BATCH = int(os.getenv("READING_BATCH", "2000"))
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[AsyncSession], Awaitable]
+
+
+class WriteQueue:
+    """Serialize and batch writes to the database."""
+
+    def __init__(self, session_factory: Callable, max_batch: int = WRITE_BATCH,
+                 max_readings: int = READING_BATCH,
+                 observe_pool_wait: Optional[Callable[[float], None]] = None):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_readings = max_readings
+        self.observe_pool_wait = observe_pool_wait
+        self._jobs: Deque[Tuple[Job, asyncio.Future]] = deque()
+        self._readings: List[Tuple[dict, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.batches = 0
+        self.jobs_written = 0
+        self.readings_written = 0
+        self.readings_dropped = 0
+
+    def depth(self) -> int:
+        """
+        Jobs waiting to be written. Readings are left out: every one belongs
+        to a request that already holds a load-shedding slot.
+        """
+        return len(self._jobs)
+
+    async def submit(self, job: Job):
+        """Run ``job(session)`` in the next batch; returns its result once committed."""
+        future = asyncio.get_running_loop().create_future()
+        self._jobs.append((job, future))
+        self._wakeup.set()
+        return await future
+
+    async def add_reading(self, mac: str, weight: float, unit: str, is_stable: bool,
+                          battery_level: Optional[int]) -> bool:
+        """
+        Write a scale reading in the next batch. Returns once it is committed:
+        True if stored, False if dropped (unknown device or unit).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._readings.append(({
+            "mac": mac, "weight": weight, "unit": unit, "is_stable": is_stable,
+            "battery_level": battery_level, "timestamp": datetime.utcnow(),
+        }, future))
+        self._wakeup.set()
+        return await future
+
+    def stop(self):
+        """Let run() return once everything queued has been written."""
+        self._stopping = True
+        self._wakeup.set()
+
+    async def run(self):
+        self._stopping = False
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._jobs or self._readings:
+                jobs = [self._jobs.popleft() for _ in range(min(self.max_batch, len(self._jobs)))]
+                readings = self._readings[:self.max_readings]
+                del self._readings[:self.max_readings]
+                await self._write(jobs, readings)
+            if self._stopping:
+                return
+
+    async def _write(self, jobs: List[Tuple[Job, asyncio.Future]], readings: List[Tuple[dict, asyncio.Future]]):
+        try:
+            async with self.session_factory() as session:
+                started = time.monotonic()
+                await session.connection()
+                if self.observe_pool_wait:
+                    self.observe_pool_wait(time.monotonic() - started)
+                results = [await job(session) for job, _ in jobs]
+                stored = await self._insert_readings(session, [r for r, _ in readings]) if readings else []
+                await session.commit()
+        except Exception as e:
+            if len(jobs) + bool(readings) > 1:
+                # Find the culprit: everything else still gets written
+                for job in jobs:
+                    await self._write([job], [])
+                if readings:
+                    await self._write([], readings)
+                return
+            if not jobs:
+                logger.exception("Dropped %d readings", len(readings))
+                self.readings_dropped += len(readings)
+            for _, future in jobs or readings:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.jobs_written += len(jobs)
+        self.readings_written += sum(stored)
+        self.readings_dropped += len(stored) - sum(stored)
+        for (_, future), result in zip(jobs, results):
+            if not future.done():
+                future.set_result(result)
+        for (_, future), ok in zip(readings, stored):
+            if not future.done():
+                future.set_result(ok)
+
+    async def _insert_readings(self, session: AsyncSession, readings: List[dict]) -> List[bool]:
+        """Insert readings from known devices; returns whether each was stored."""
+        macs = {reading["mac"] for reading in readings}
+        rows = await session.execute(
+            select(Device.mac_address, Device.id).where(Device.mac_address.in_(macs))
+        )
+        devices = {row.mac_address: row.id for row in rows}
+        measurement_rows, stored = [], []
+        for reading in readings:
+            device_id = devices.get(reading["mac"])
+            try:
+                unit = WeightUnit(reading["unit"])
+            except ValueError:
+                device_id = None
+            stored.append(device_id is not None)
+            if device_id is None:
+                continue
+            measurement_rows.append({
+                "device_id": device_id,
+                "weight": reading["weight"],
+                "unit": unit,
+                "is_stable": reading["is_stable"],
+                "battery_level": reading["battery_level"],
+                "timestamp": reading["timestamp"],
+            })
+        if measurement_rows:
+            await session.execute(insert(Measurement), measurement_rows)
+        return stored
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._jobs) + len(self._readings),
+            "batches": self.batches,
+            "jobs_written": self.jobs_written,
+            "readings_written": self.readings_written,
+            "readings_dropped": self.readings_dropped,
+        }
@@ -0,0 +1,38 @@
+"""
+Tests run from backend/ (``cd backend && pytest``) against a throwaway
+SQLite database, so they need neither PostgreSQL nor a .env file.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+_db_dir = tempfile.mkdtemp(prefix="ble-scale-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/test.db")
+os.environ.setdefault("SQL_ECHO", "false")
+os.environ.setdefault("WORKER_LOCK_DIR", _db_dir)
+
+
+@pytest.fixture
+def run_db():
+    """
+    Run a coroutine on a fresh event loop with the tables created; the
+    engine is disposed afterwards, since its connections belong to that loop.
+    """
+    from app.database import get_engine, init_db, reset_engine
+
+    def run(coro_fn):
+        async def main():
+            await init_db()
+            try:
+                return await coro_fn()
+            finally:
+                await get_engine().dispose()
+                reset_engine()
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+
+from app.config import Settings, get_settings
+from app.main import create_app
+
+
+def _settings(tmp_path, name: str) -> Settings:
+    return Settings(database_url=f"sqlite+aiosqlite:///{tmp_path}/{name}.db", sql_echo=False)
+
+
+def test_apps_keep_their_own_state(tmp_path):
+    environment = get_settings()
+    first = create_app(_settings(tmp_path, "first"))
+    second = create_app(_settings(tmp_path, "second"))
+    with TestClient(first) as a, TestClient(second) as b:
+        assert first.state.engine is not second.state.engine
+        assert first.state.product_index is not second.state.product_index
+        assert a.post("/products", json={"name": "Only in first", "price_per_unit": 1.0}).status_code == 200
+        assert [p["name"] for p in a.get("/products/search", params={"q": "only"}).json()] == ["Only in first"]
+        assert b.get("/products").json() == []
+        assert b.get("/products/search", params={"q": "only"}).json() == []
+        assert a.get("/metrics/edge").json()["writer"]["batches"] == 0
+    # Building apps leaves the process-wide settings alone
+    assert get_settings() is environment
+
+
+def test_readings_from_unregistered_devices_are_rejected(tmp_path):
+    with TestClient(create_app(_settings(tmp_path, "readings"))) as client:
+        reading = {"device_mac": "02:FE:00:00:00:01", "weight": 12.5, "unit": "g", "is_stable": True}
+        response = client.post("/measurements", json=reading)
+        assert response.status_code == 404
+        assert "not registered" in response.json()["detail"]
+        assert client.post("/measurements", json={**reading, "unit": "stone"}).status_code == 422
+
+        client.post("/devices", json={"mac_address": reading["device_mac"], "name": "Scale"}).raise_for_status()
+        assert client.post("/measurements", json=reading).json()["status"] == "recorded"
+        stats = client.get("/metrics/edge").json()["writer"]
+        assert (stats["readings_written"], stats["readings_dropped"]) == (1, 1)
+
+
+def test_admission_limits_come_from_settings_and_stay_per_app(tmp_path):
+    strict = create_app(_settings(tmp_path, "strict").model_copy(update={"rate_limit_device_burst": 2}))
+    lenient = create_app(_settings(tmp_path, "lenient"))
+    reading = {"device_mac": "02:FE:00:00:00:02", "weight": 1.0, "unit": "g", "is_stable": True}
+    with TestClient(strict) as a, TestClient(lenient) as b:
+        for client in (a, b):
+            client.post("/devices", json={"mac_address": reading["device_mac"], "name": "Scale"}).raise_for_status()
+        assert [a.post("/measurements", json=reading).status_code for _ in range(3)] == [200, 200, 429]
+        assert [b.post("/measurements", json=reading).status_code for _ in range(3)] == [200, 200, 200]
+        assert a.get("/metrics/admission").json()["throttled"]["device"] == 1
+        assert b.get("/metrics/admission").json()["throttled"]["device"] == 0
+        assert strict.state.load_shedder is not lenient.state.load_shedder
@@ -0,0 +1,105 @@
+import io
+from functools import partial
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import catalog
+from app.catalog import import_catalog
+from app.config import Settings
+from app.database import async_session_maker
+from app.main import create_app
+from app.models.models import Product
+
+CSV = "text/csv"
+NDJSON = "application/x-ndjson"
+
+
+def _client(tmp_path) -> TestClient:
+    return TestClient(create_app(Settings(database_url=f"sqlite+aiosqlite:///{tmp_path}/catalog.db", sql_echo=False)))
+
+
+def _import(client, body: str, content_type: str, **params):
+    return client.post("/products/import", content=body.encode(), headers={"Content-Type": content_type},
+                       params=params)
+
+
+def test_csv_import_inserts_then_updates(tmp_path):
+    with _client(tmp_path) as client:
+        first = _import(client, "sku,name,price_per_unit,category\n"
+                                "APL,Apple,2.50,Fruit\n"
+                                "PEA,Pear,3.10,\n", CSV)
+        assert first.json() == {"inserted": 2, "updated": 0, "rejected": 0, "errors": []}
+
+        second = _import(client, "﻿sku,name,price_per_unit,unit\n"
+                                 "APL,Green apple,2.75,kg\n"
+                                 "PLM,Plum,-1,kg\n"
+                                 "FIG,Fig,6.00,g,extra\n"
+                                 "KIW,Kiwi,4.20,g\n", CSV).json()
+        assert (second["inserted"], second["updated"], second["rejected"]) == (1, 1, 2)
+        assert [(e["line"], e["sku"]) for e in second["errors"]] == [(3, "PLM"), (4, None)]
+        assert second["errors"][0]["error"].startswith("price_per_unit:")
+        assert second["errors"][1]["error"] == "More fields than the header"
+
+        products = {p["sku"]: p for p in client.get("/products").json()}
+        assert sorted(products) == ["APL", "KIW", "PEA"]
+        assert (products["APL"]["name"], products["APL"]["price_per_unit"]) == ("Green apple", 2.75)
+        # A row replaces the whole product: the omitted category goes back to its default
+        assert products["APL"]["category"] is None
+        assert products["KIW"]["unit"] == "g"
+        assert [p["sku"] for p in client.get("/products/search", params={"q": "green"}).json()] == ["APL"]
+
+
+def test_ndjson_import_reports_bad_lines(tmp_path):
+    body = "\n".join([
+        '{"sku": "BAN", "name": "Banana", "price_per_unit": 1.2}',
+        '',
+        '{"sku": "CHE", "name": "Cherry", "price_per_unit": 9.5,',
+        '["not", "an", "object"]',
+        '{"sku": "DAT", "price_per_unit": 7}',
+        '{"sku": "BAN", "name": "Banana", "price_per_unit": 1.3, "is_active": false}',
+    ])
+    with _client(tmp_path) as client:
+        summary = _import(client, body, "text/plain", format="ndjson").json()
+        assert (summary["inserted"], summary["updated"], summary["rejected"]) == (1, 1, 3)
+        assert [(e["line"], e["sku"]) for e in summary["errors"]] == [(3, None), (4, None), (5, "DAT")]
+        assert summary["errors"][0]["error"].startswith("Invalid JSON:")
+        assert summary["errors"][1]["error"] == "Expected a JSON object"
+        assert summary["errors"][2]["error"].startswith("name:")
+
+        assert _import(client, '{"sku": "EGG", "name": "Egg", "price_per_unit": 0.3}\n', NDJSON).json()["inserted"] == 1
+        # The later BAN row deactivated it, so only the egg is listed
+        assert [p["sku"] for p in client.get("/products").json()] == ["EGG"]
+
+
+def test_chunked_upsert_counts(run_db):
+    rows = ["sku,name,price_per_unit"] + [f"CAT-CHUNK-{i % 5},Chunk {i},{i}" for i in range(12)]
+    rows.insert(4, "CAT-CHUNK-X,,1")
+
+    async def scenario():
+        async with async_session_maker() as session:
+            spooled = io.BytesIO("\n".join(rows).encode())
+            summary = await import_catalog(session, spooled, "csv", chunk_size=2)
+            products = (await session.scalars(
+                select(Product).where(Product.sku.like("CAT-CHUNK-%")).order_by(Product.sku)
+            )).all()
+            return summary, [(p.sku, p.name) for p in products]
+
+    summary, products = run_db(scenario)
+    # Five SKUs, each seen first in one chunk and updated by the later ones
+    assert (summary["inserted"], summary["updated"], summary["rejected"]) == (5, 7, 1)
+    assert summary["errors"][0]["line"] == 5
+    assert products == [(f"CAT-CHUNK-{i}", f"Chunk {i + 10 if i < 2 else i + 5}") for i in range(5)]
+
+
+def test_rejected_uploads(tmp_path, monkeypatch):
+    with _client(tmp_path) as client:
+        response = _import(client, "sku,name,price_per_unit\n", "application/json")
+        assert response.status_code == 400
+        assert "text/csv" in response.json()["detail"]
+        assert _import(client, "sku,name,price_per_unit\n", CSV, format="xml").status_code == 400
+
+        monkeypatch.setattr("app.main.spool", partial(catalog.spool, max_bytes=64))
+        response = _import(client, "sku,name,price_per_unit\n" + "BIG,Big,1\n" * 20, CSV)
+        assert response.status_code == 413
+        assert client.get("/products").json() == []
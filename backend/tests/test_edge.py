@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.database import async_session_maker
+from app.edge import EdgeUploader, EdgeUploadError
+from app.models.models import Base, EdgeUploadState, Product, SyncReceipt, Transaction, TransactionItem
+from app.writer import WriteQueue
+
+
+async def _sale(session, product_id: int, number: str):
+    tx = Transaction(transaction_number=number, total_amount=1.25, created_at=datetime.utcnow())
+    session.add(tx)
+    await session.flush()
+    session.add(TransactionItem(transaction_id=tx.id, product_id=product_id, weight=500, unit_price=2.5, total_price=1.25))
+
+
+def test_stores_cannot_overwrite_each_others_sales(run_db, tmp_path):
+    async def scenario():
+        async with async_session_maker() as local:
+            product = Product(name="Edge apple", sku="EDGE-APPLE", price_per_unit=2.5)
+            local.add(product)
+            await local.flush()
+            # Upload only what this test writes
+            top = await local.scalar(select(func.max(Transaction.id)))
+            state = await local.get(EdgeUploadState, "transactions")
+            if state is None:
+                local.add(EdgeUploadState(kind="transactions", last_id=top or 0))
+            else:
+                state.last_id = top or 0
+            await _sale(local, product.id, "TXEDGE00000000000001")
+            await local.commit()
+            product_id = product.id
+
+        writer = WriteQueue(async_session_maker)
+        writer_task = asyncio.create_task(writer.run())
+        store = EdgeUploader(async_session_maker, writer, f"sqlite+aiosqlite:///{tmp_path}/central.db", store_id="store-a")
+        try:
+            async with store.central_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with store.central_factory() as central:
+                central.add(Product(name="Edge apple", sku="EDGE-APPLE", price_per_unit=2.5))
+                await central.commit()
+
+            assert await store.upload_transactions() == 1
+            assert store.uploaded["transactions"] == 1
+
+            # The watermark update was lost: the retry is a no-op
+            await writer.submit(_rewind(product_id))
+            assert await store.upload_transactions() == 1
+            assert store.skipped["transactions"] == 1
+
+            # Another store issuing the same number fails loudly instead of dropping the sale
+            other = EdgeUploader(async_session_maker, writer, str(store.central_engine.url), store_id="store-b")
+            await writer.submit(_rewind(product_id))
+            with pytest.raises(EdgeUploadError, match="WORKER_ID"):
+                await other.upload_transactions()
+            await other.close()
+
+            async with store.central_factory() as central:
+                assert await central.scalar(select(func.count(Transaction.id))) == 1
+                assert await central.scalar(select(func.count(SyncReceipt.id))) == 1
+        finally:
+            await store.close()
+            writer.stop()
+            await writer_task
+
+    run_db(scenario)
+
+
+def _rewind(product_id: int):
+    """Job moving the transaction watermark back before this test's sale."""
+    async def job(session):
+        number = await session.scalar(
+            select(func.min(TransactionItem.transaction_id)).where(TransactionItem.product_id == product_id)
+        )
+        state = await session.get(EdgeUploadState, "transactions")
+        state.last_id = number - 1
+    return job
+
+
+def test_upload_needs_a_store_id(tmp_path):
+    with pytest.raises(RuntimeError, match="EDGE_STORE_ID"):
+        EdgeUploader(async_session_maker, None, f"sqlite+aiosqlite:///{tmp_path}/central.db", store_id=None)
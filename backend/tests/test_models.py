@@ -0,0 +1,32 @@
+import pytest
+from pydantic import ValidationError
+
+from app.main import SyncBundle, TransactionCreate
+
+
+def test_transaction_needs_items():
+    with pytest.raises(ValidationError, match="items"):
+        TransactionCreate(items=[])
+
+
+@pytest.mark.parametrize("weight", [0, -12.5])
+def test_item_weight_must_be_positive(weight):
+    with pytest.raises(ValidationError, match="weight"):
+        TransactionCreate(items=[{"product_id": 1, "weight": weight}])
+
+
+def test_valid_transaction():
+    order = TransactionCreate(items=[{"product_id": 1, "weight": 250}])
+    assert order.items[0].weight == 250
+    assert order.payment_method == "cash"
+
+
+def test_sync_bundle_applies_the_same_rules():
+    with pytest.raises(ValidationError) as excinfo:
+        SyncBundle.model_validate({"client_id": "tablet", "transactions": [
+            {"idempotency_key": "a", "items": [{"product_id": 1, "weight": 100}]},
+            {"idempotency_key": "b", "items": []},
+            {"idempotency_key": "c", "items": [{"product_id": 1, "weight": 0}]},
+        ]})
+    locations = {error["loc"][:2] for error in excinfo.value.errors()}
+    assert locations == {("transactions", 1), ("transactions", 2)}
@@ -0,0 +1,124 @@
+import asyncio
+
+from app.ratelimit import LoadShedder, TokenBucketLimiter, acquire_all
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_throttles():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=10, burst=3, clock=clock)
+    assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a") == 0.1
+    assert limiter.throttled == 1
+    # Other keys have their own bucket
+    assert limiter.acquire("b") == 0.0
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=10, burst=3, clock=clock)
+    for _ in range(3):
+        limiter.acquire("a")
+    clock.now += 0.1
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") > 0
+    clock.now += 60
+    assert [limiter.acquire("a") for _ in range(4)][-1] > 0
+
+
+def test_idle_buckets_are_evicted():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=10, burst=3, idle_seconds=5, clock=clock)
+    limiter.acquire("a")
+    clock.now += 6
+    limiter.acquire("b")
+    assert len(limiter) == 1
+
+
+def test_max_keys_bounds_tracked_buckets():
+    limiter = TokenBucketLimiter(rate=10, burst=3, max_keys=2, clock=FakeClock())
+    for key in "abcd":
+        limiter.acquire(key)
+    assert len(limiter) == 2
+
+
+def test_wait_does_not_take_tokens():
+    limiter = TokenBucketLimiter(rate=10, burst=1, clock=FakeClock())
+    assert limiter.wait("a") == 0.0
+    assert limiter.wait("a") == 0.0
+    assert limiter.acquire("a") == 0.0
+    assert limiter.wait("a") == 0.1
+
+
+def test_acquire_all_consumes_nothing_when_one_bucket_rejects():
+    clock = FakeClock()
+    clients = TokenBucketLimiter(rate=10, burst=5, clock=clock)
+    devices = TokenBucketLimiter(rate=1, burst=1, clock=clock)
+    assert acquire_all((clients, "10.0.0.1"), (devices, "AA")) == 0.0
+    for _ in range(3):
+        assert acquire_all((clients, "10.0.0.1"), (devices, "AA")) == 1.0
+    assert devices.throttled == 3
+    assert clients.throttled == 0
+    # The client bucket only paid for the admitted request
+    for _ in range(4):
+        assert clients.acquire("10.0.0.1") == 0.0
+
+
+def test_acquire_all_returns_longest_wait():
+    clock = FakeClock()
+    fast = TokenBucketLimiter(rate=10, burst=1, clock=clock)
+    slow = TokenBucketLimiter(rate=1, burst=1, clock=clock)
+    fast.acquire("k")
+    slow.acquire("k")
+    assert acquire_all((fast, "k"), (slow, "k")) == 1.0
+    assert fast.throttled == slow.throttled == 1
+
+
+def test_shedder_counts_concurrent_awaiting_slots():
+    shedder = LoadShedder(max_in_flight=3)
+    release = asyncio.Event()
+    peak = []
+
+    async def request():
+        with shedder.slot():
+            peak.append(shedder.in_flight)
+            await release.wait()
+
+    async def main():
+        tasks = [asyncio.create_task(request()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert shedder.in_flight == 3
+        assert shedder.check() == ("queue_full", 1.0)
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert max(peak) == 3
+    assert shedder.in_flight == 0
+    assert shedder.check() is None
+
+
+def test_shedder_counts_queue_depth():
+    shedder = LoadShedder(max_in_flight=2)
+    shedder.queue_depth = lambda: 2
+    assert shedder.check()[0] == "queue_full"
+
+
+def test_shedder_sheds_on_recent_pool_wait_only():
+    clock = FakeClock()
+    shedder = LoadShedder(max_pool_wait=0.5, stale_after=5, clock=clock)
+    shedder.observe_pool_wait(0.9)
+    assert shedder.check() == ("pool_wait", 1.0)
+    clock.now += 6
+    assert shedder.check() is None
+    # A fresh sample after a stale one replaces the average outright
+    shedder.observe_pool_wait(0.1)
+    assert shedder.pool_wait == 0.1
+    assert shedder.shed["pool_wait"] == 1
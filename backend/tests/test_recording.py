@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import pytest
+
+from app.recording import MeasurementRecorder
+from app.stream_format import FILE_HEADER, FILE_MAGIC, RECORD, open_for_append
+
+# emulator/tests/test_stream_log.py pins the same bytes for the emulator's copy of the format
+HEADER_BYTES = b"SCLLOG1\x00\x1c\x00\x00\x00\x00\x00\x00\x00"
+RECORD_BYTES = bytes.fromhex("e803000000000000aabbccddee010000" "53434c45" "00002041" "01015000")
+
+
+def read_records(path):
+    with open(path, "rb") as f:
+        data = f.read()[FILE_HEADER.size:]
+    return [RECORD.unpack_from(data, offset) for offset in range(0, len(data), RECORD.size)]
+
+
+def record_some(path, count, **kwargs):
+    async def scenario():
+        recorder = MeasurementRecorder(path, **kwargs)
+        for i in range(count):
+            recorder.record("AA:BB:CC:DD:EE:01", float(i), "kg", True, 80)
+        recorder.record("not-a-mac", 1.0, "g", False, None)
+        await recorder.close()
+        return recorder
+    return asyncio.run(scenario())
+
+
+def test_records_are_written_on_close(tmp_path):
+    path = str(tmp_path / "capture.scl")
+    recorder = record_some(path, 10)
+    records = read_records(path)
+    assert len(records) == recorder.recorded == 10
+    assert recorder.skipped == 1
+    assert records[3][4] == 3.0        # weight
+    assert records[3][5] == 1          # kg
+
+
+def test_flushes_happen_off_the_request_path(tmp_path):
+    path = str(tmp_path / "capture.scl")
+
+    async def scenario():
+        recorder = MeasurementRecorder(path, flush_records=4)
+        for i in range(4):
+            recorder.record("AA:BB:CC:DD:EE:01", float(i), "g", True, 80)
+        # Due, but written by a task in a thread, not inside record()
+        written_inline = os.path.getsize(path) > FILE_HEADER.size
+        await recorder.close()
+        return written_inline
+
+    assert not asyncio.run(scenario())
+    assert len(read_records(path)) == 4
+
+
+def test_reopening_continues_after_the_last_timestamp(tmp_path):
+    path = str(tmp_path / "capture.scl")
+    record_some(path, 5)
+    last = read_records(path)[-1][0]
+    with open(path, "ab") as f:
+        f.write(b"\0" * (RECORD.size // 2))   # A record cut short by a crash
+    log, last_t_us = open_for_append(path)
+    log.close()
+    assert last_t_us == last
+    assert (os.path.getsize(path) - FILE_HEADER.size) % RECORD.size == 0
+
+    recorder = record_some(path, 3)
+    timestamps = [record[0] for record in read_records(path)]
+    assert len(timestamps) == 8
+    assert timestamps == sorted(timestamps)
+    assert recorder.last_t_us >= last
+
+
+def test_refuses_other_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"definitely not a stream log")
+    with pytest.raises(ValueError, match="not a scale stream log"):
+        open_for_append(str(path))
+
+
+def test_layout_matches_the_emulator():
+    assert FILE_HEADER.pack(FILE_MAGIC, RECORD.size, 0) == HEADER_BYTES
+    mac = bytes.fromhex("AABBCCDDEE01")
+    assert RECORD.pack(1000, mac, 0, b"SCLE", 10.0, 1, 1, 80, 0) == RECORD_BYTES
@@ -0,0 +1,108 @@
+import itertools
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from app.database import UnsupportedDatabaseError, async_session_maker, check_dialect
+from app.models.models import Product, SalesRollupState, Transaction, TransactionItem
+from app.reports import backfill_chunk, record_sales, sales_report
+
+# Every sale here is in 2001, so reports over that year see only this module's data
+EPOCH = datetime(2001, 3, 4, 0, 0)
+
+WINDOWS = [
+    # Whole days, whole hours at the ends, partial hours at the very ends
+    (EPOCH + timedelta(hours=9, minutes=17), EPOCH + timedelta(days=2, hours=3, minutes=45)),
+    (EPOCH + timedelta(hours=1), EPOCH + timedelta(days=1)),
+    (EPOCH + timedelta(hours=5, minutes=59, seconds=30), EPOCH + timedelta(hours=6, minutes=0, seconds=30)),
+    (EPOCH + timedelta(days=1, minutes=1), EPOCH + timedelta(days=3)),
+    (datetime(2001, 1, 1), datetime(2002, 1, 1)),
+]
+
+_numbers = itertools.count()
+
+
+def test_unsupported_dialect_is_refused():
+    with pytest.raises(UnsupportedDatabaseError, match="mysql"):
+        check_dialect(SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+
+
+async def _sell(session, products, count: int, summarize: bool, offset_minutes: int):
+    """Insert `count` sales spread over three days; add them to the summaries if `summarize`."""
+    sold = []
+    for i in range(count):
+        created_at = EPOCH + timedelta(minutes=offset_minutes + i * 37, seconds=i % 60)
+        lines = [
+            {"product_id": products[(i + k) % len(products)], "weight": 100.0 + i + k,
+             "unit_price": 2.5, "total_price": round(0.25 + i * 0.1 + k, 2)}
+            for k in range(1 + i % 3)
+        ]
+        tx_id = (await session.execute(insert(Transaction).returning(Transaction.id), {
+            "transaction_number": f"TXREPORT{next(_numbers):012d}",
+            "total_amount": sum(line["total_price"] for line in lines),
+            "created_by_id": None,
+            "created_at": created_at,
+        })).scalar_one()
+        for line in lines:
+            line["transaction_id"] = tx_id
+        await session.execute(insert(TransactionItem), lines)
+        sold.append({"created_at": created_at, "created_by_id": None, "items": lines})
+    if summarize:
+        await record_sales(session, sold)
+
+
+async def _assert_summaries_match(session):
+    for group_by, period in [(("product",), "day"), (("category",), "hour"),
+                             (("product", "operator"), "none"), ((), "day")]:
+        for start, end in WINDOWS:
+            raw = await sales_report(session, group_by, period, start, end, use_summary=False)
+            summarized = await sales_report(session, group_by, period, start, end)
+            assert summarized == raw, (group_by, period, start, end)
+
+
+def test_summaries_match_raw_tables_across_backfill(run_db):
+    async def scenario():
+        async with async_session_maker() as session:
+            products = []
+            for i, category in enumerate(["Fruit", "Fruit", "Vegetables"]):
+                product = Product(name=f"Report {i}", sku=f"REPORT-{i}", price_per_unit=2.5, category=category)
+                session.add(product)
+                await session.flush()
+                products.append(product.id)
+
+            state = await session.get(SalesRollupState, 1)
+            if state is None:
+                state = SalesRollupState(id=1, backfill_below_id=1)
+                session.add(state)
+            original_below = state.backfill_below_id
+
+            # History from before the summaries existed, then live sales
+            await _sell(session, products, 60, summarize=False, offset_minutes=0)
+            await session.flush()
+            first_item, last_history = (await session.execute(
+                select(func.min(TransactionItem.id), func.max(TransactionItem.id))
+                .where(TransactionItem.product_id.in_(products))
+            )).one()
+            state.backfill_below_id = last_history + 1
+            await session.commit()
+            await _sell(session, products, 60, summarize=True, offset_minutes=11)
+            await session.commit()
+
+            try:
+                await _assert_summaries_match(session)
+                # Part-way through the backfill, then all of this module's history
+                while (below := (await session.get(SalesRollupState, 1)).backfill_below_id) > first_item:
+                    await backfill_chunk(session, min(25, below - first_item))
+                    session.expire_all()
+                    await _assert_summaries_match(session)
+            finally:
+                state = await session.get(SalesRollupState, 1)
+                state.backfill_below_id = original_below
+                await session.commit()
+
+            report = await sales_report(session, (), "none", *WINDOWS[-1])
+            assert report[0]["items"] == sum(1 + i % 3 for i in range(60)) * 2
+
+    run_db(scenario)
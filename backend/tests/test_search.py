@@ -0,0 +1,132 @@
+import asyncio
+
+from app.search import ProductSearchIndex
+
+
+def product(pid: int, name: str, sku: str = None, category: str = "Fruits", active: bool = True) -> dict:
+    return {
+        "id": pid, "name": name, "sku": sku or f"SKU{pid:05d}", "price_per_unit": 1.0, "unit": "kg",
+        "category": category, "icon": None, "color": None, "is_active": active,
+    }
+
+
+def catalog(count: int = 3000):
+    words = ["apple", "apricot", "banana", "basil", "cherry", "chili"]
+    return [product(pid, f"{words[pid % 6].title()} {'Organic' if pid % 5 else 'Fresh'} {pid}")
+            for pid in range(1, count + 1)]
+
+
+def index(count: int = 3000) -> ProductSearchIndex:
+    idx = ProductSearchIndex()
+    idx.upsert_many(catalog(count))
+    idx.add_sales({pid: 3000 - pid for pid in range(1, count + 1)})
+    return idx
+
+
+def names(results):
+    return [p["name"] for p in results]
+
+
+def test_leading_matches_rank_first_then_popularity():
+    idx = ProductSearchIndex()
+    idx.upsert_many([product(1, "Green Apple"), product(2, "Apple Juice"), product(3, "Apple Pie")])
+    idx.add_sales({3: 50})
+    assert names(idx.search("app")) == ["Apple Pie", "Apple Juice", "Green Apple"]
+
+
+def test_multi_word_and_fuzzy_queries():
+    idx = index()
+    results = idx.search("fresh ban", 100)
+    assert results and all("Fresh" in p["name"] and "Banana" in p["name"] for p in results)
+    # Repeating the finished word reuses its cached id set
+    assert idx.search("fresh bana", 100) == results
+    assert "Banana" in idx.search("bananna", 5)[0]["name"]
+
+
+def test_top_lists_built_in_thread_match_warm():
+    warmed, threaded = index(), index()
+    warmed.warm()
+    assert asyncio.run(threaded.warm_in_thread())
+    assert threaded._top == warmed._top
+    for query in ("a", "ch", "organic ch", "SKU00"):
+        assert threaded.search(query, 50) == warmed.search(query, 50)
+
+
+def test_thread_build_is_dropped_if_the_index_changes_meanwhile():
+    idx = index()
+
+    async def race():
+        build = asyncio.create_task(idx.warm_in_thread())
+        await asyncio.sleep(0)
+        idx.upsert(product(9999, "Apple Late"))
+        return await build
+
+    assert not asyncio.run(race())
+    # Lists are then built on demand, from the current index
+    assert idx.search("apple late")[0]["id"] == 9999
+
+
+def test_changes_only_rewarm_their_own_prefixes():
+    idx = index()
+    idx.warm()
+    lists = dict(idx._top)
+    idx._warm_stale()
+    assert idx._top == lists  # Nothing changed: nothing rebuilt
+
+    idx.upsert(product(5000, "Zucchini Organic"))
+    idx.add_sales({2999: 100_000})
+    idx._warm_stale()
+    fresh = index()
+    fresh.upsert(product(5000, "Zucchini Organic"))
+    fresh.add_sales({2999: 100_000})
+    fresh.warm()
+    for query in ("a", "ch", "organic", "z", "zucchini"):
+        assert idx.search(query, 100) == fresh.search(query, 100)
+    assert idx.search("organic", 1)[0]["id"] == 2999
+
+
+def test_inactive_products_are_removed():
+    idx = index(100)
+    idx.upsert(product(1, "Apricot Organic 1", active=False))
+    assert 1 not in {p["id"] for p in idx.search("apricot", 100)}
+    assert len(idx) == 99
+
+
+def test_refresh_pulls_changes_and_popularity_counts_sales(run_db):
+    from datetime import datetime
+
+    from sqlalchemy import select
+
+    from app.database import async_session_maker
+    from app.models.models import Product, ProductPopularity, SalesDaily
+    from app.search import refresh_popularity
+
+    async def scenario():
+        idx = ProductSearchIndex()
+        async with async_session_maker() as session:
+            session.add(Product(name="Quince Search", sku="SRCH-1", price_per_unit=3.0))
+            await session.commit()
+            await idx.refresh(session)
+            found = names(idx.search("quince"))
+            generation = idx._generation
+            await idx.refresh(session)
+            unchanged = idx._generation == generation
+
+            product_id = await session.scalar(select(Product.id).where(Product.sku == "SRCH-1"))
+            day = datetime(2024, 1, 1)
+            session.add_all([
+                SalesDaily(day=day, product_id=product_id, operator_id=0, items=3),
+                SalesDaily(day=day, product_id=product_id, operator_id=7, items=2),
+            ])
+            await session.commit()
+            await refresh_popularity(session)
+            await refresh_popularity(session)
+            items = await session.scalar(
+                select(ProductPopularity.items).where(ProductPopularity.product_id == product_id)
+            )
+        return found, unchanged, items
+
+    found, unchanged, items = run_db(scenario)
+    assert found == ["Quince Search"]
+    assert unchanged
+    assert items == 5
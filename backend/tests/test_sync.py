@@ -0,0 +1,143 @@
+import asyncio
+import gzip
+import itertools
+from datetime import datetime
+
+import pytest
+
+from app.database import async_session_maker
+from app.main import SyncBundle
+from app.models.models import Device, Measurement, Product, Transaction
+from app.reports import sales_report
+from app.sync import BundleError, apply_bundle, decode_bundle, read_body
+
+_numbers = itertools.count()
+
+
+def next_number() -> str:
+    return f"TXTEST{next(_numbers):014d}"
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def test_decode_identity_and_gzip():
+    body = b'{"client_id": "c"}'
+    assert decode_bundle(body, None) == body
+    assert decode_bundle(gzip.compress(body), "gzip") == body
+    assert decode_bundle(gzip.compress(body), " X-GZIP ") == body
+
+
+def test_decode_rejects_bad_gzip():
+    with pytest.raises(BundleError, match="Invalid gzip"):
+        decode_bundle(b"not gzip", "gzip")
+    with pytest.raises(BundleError, match="Truncated"):
+        decode_bundle(gzip.compress(b"x" * 1000)[:20], "gzip")
+
+
+def test_decode_caps_decompressed_size():
+    bomb = gzip.compress(b"\0" * 100_000)
+    with pytest.raises(BundleError) as excinfo:
+        decode_bundle(bomb, "gzip", max_bytes=10_000)
+    assert excinfo.value.too_large
+    assert decode_bundle(bomb, "gzip", max_bytes=100_000) == b"\0" * 100_000
+
+
+def test_decode_unsupported_encoding():
+    with pytest.raises(BundleError) as excinfo:
+        decode_bundle(b"", "br")
+    assert excinfo.value.unsupported
+
+
+def test_read_body_caps_raw_bytes():
+    assert asyncio.run(read_body(chunks(b"ab", b"cd"), max_bytes=4)) == b"abcd"
+    with pytest.raises(BundleError) as excinfo:
+        asyncio.run(read_body(chunks(b"ab", b"cd", b"e"), max_bytes=4))
+    assert excinfo.value.too_large
+
+
+async def _catalog(sku: str, mac: str) -> int:
+    async with async_session_maker() as session:
+        product = Product(name="Apples", sku=sku, price_per_unit=2.0)
+        session.add_all([product, Device(mac_address=mac, name="Scale")])
+        await session.commit()
+        return product.id
+
+
+async def _apply(bundle: dict):
+    bundle = SyncBundle.model_validate(bundle)
+    async with async_session_maker() as session:
+        results = await apply_bundle(session, bundle.client_id, bundle.transactions, bundle.measurements,
+                                     next_number)
+        await session.commit()
+    return results
+
+
+def test_partial_rejection_keeps_valid_items(run_db):
+    async def scenario():
+        product_id = await _catalog("SYNC-1", "SY:NC:00:00:00:01")
+        return await _apply({
+            "client_id": "tablet-1",
+            "transactions": [
+                {"idempotency_key": "t1", "items": [{"product_id": product_id, "weight": 500}]},
+                {"idempotency_key": "t2", "items": [{"product_id": 999_999, "weight": 500}]},
+            ],
+            "measurements": [
+                {"idempotency_key": "m1", "device_mac": "SY:NC:00:00:00:01", "weight": 1.0, "unit": "kg"},
+                {"idempotency_key": "m2", "device_mac": "SY:NC:FF:FF:FF:FF", "weight": 1.0},
+                {"idempotency_key": "m3", "device_mac": "SY:NC:00:00:00:01", "weight": 1.0, "unit": "st"},
+            ],
+        })
+
+    results = run_db(scenario)
+    assert [r["status"] for r in results] == ["applied", "rejected", "applied", "rejected", "rejected"]
+    assert "999999" in results[1]["error"]
+    assert "Unknown device" in results[3]["error"]
+    assert "Unknown unit" in results[4]["error"]
+    assert results[0]["id"] and results[2]["id"]
+
+
+def test_duplicates_within_and_across_bundles(run_db):
+    async def scenario():
+        product_id = await _catalog("SYNC-2", "SY:NC:00:00:00:02")
+        sale = {"idempotency_key": "sale-1", "items": [{"product_id": product_id, "weight": 250}]}
+        first = await _apply({"client_id": "tablet-2", "transactions": [sale, sale]})
+        retry = await _apply({"client_id": "tablet-2", "transactions": [sale]})
+        # The same key from another client is a different sale
+        other = await _apply({"client_id": "tablet-3", "transactions": [sale]})
+        return first, retry, other
+
+    first, retry, other = run_db(scenario)
+    assert [r["status"] for r in first] == ["applied", "duplicate"]
+    assert first[1]["id"] == first[0]["id"]
+    assert retry[0]["status"] == "duplicate"
+    assert retry[0]["id"] == first[0]["id"]
+    assert other[0]["status"] == "applied"
+    assert other[0]["id"] != first[0]["id"]
+
+
+def test_offset_timestamps_are_stored_as_utc(run_db):
+    async def scenario():
+        product_id = await _catalog("SYNC-3", "SY:NC:00:00:00:03")
+        results = await _apply({
+            "client_id": "tablet-4",
+            "transactions": [{"idempotency_key": "t-offset", "created_at": "2003-06-01T10:30:00+05:00",
+                              "items": [{"product_id": product_id, "weight": 500}]}],
+            "measurements": [{"idempotency_key": "m-offset", "device_mac": "SY:NC:00:00:00:03", "weight": 1.0,
+                              "timestamp": "2003-06-01T10:30:00-02:00"}],
+        })
+        async with async_session_maker() as session:
+            tx = await session.get(Transaction, results[0]["id"])
+            measurement = await session.get(Measurement, results[1]["id"])
+            window = (datetime(2003, 6, 1), datetime(2003, 6, 2))
+            raw = await sales_report(session, ("product",), "hour", *window, use_summary=False)
+            summarized = await sales_report(session, ("product",), "hour", *window)
+        return tx.created_at, measurement.timestamp, raw, summarized
+
+    created_at, timestamp, raw, summarized = run_db(scenario)
+    assert created_at == datetime(2003, 6, 1, 5, 30)
+    assert timestamp == datetime(2003, 6, 1, 12, 30)
+    assert summarized == raw
+    assert [row["period"] for row in raw] == [datetime(2003, 6, 1, 5)]
@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+from sqlalchemy import event
+
+from app.config import Settings
+from app.main import create_app
+from app.txnumber import TransactionNumberAllocator
+
+NOW = 1_700_000_000.5
+
+
+def _settings(tmp_path, name: str = "sales") -> Settings:
+    return Settings(database_url=f"sqlite+aiosqlite:///{tmp_path}/{name}.db", sql_echo=False)
+
+
+async def _serving(app, scenario):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client)
+
+
+async def _product(client) -> int:
+    response = await client.post("/products", json={"name": "Pears", "price_per_unit": 3.0})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def _sale(product_id: int) -> dict:
+    return {"items": [{"product_id": product_id, "weight": 750}], "payment_method": "cash"}
+
+
+def test_concurrent_sales_get_unique_numbers(tmp_path):
+    async def scenario(client):
+        product_id = await _product(client)
+        responses = await asyncio.gather(*(
+            client.post("/transactions", json=_sale(product_id)) for _ in range(200)
+        ))
+        listed = (await client.get("/transactions", params={"limit": 500})).json()
+        return responses, listed
+
+    responses, listed = asyncio.run(_serving(create_app(_settings(tmp_path)), scenario))
+    assert [r.status_code for r in responses] == [200] * 200
+    numbers = [r.json()["transaction_number"] for r in responses]
+    assert len(set(numbers)) == 200
+    assert sorted(t["transaction_number"] for t in listed) == sorted(numbers)
+
+
+def test_processes_sharing_a_worker_id_retry_taken_numbers(tmp_path):
+    """Two apps on one database, misconfigured with the same worker id."""
+    first, second = create_app(_settings(tmp_path)), create_app(_settings(tmp_path))
+
+    async def scenario():
+        async with first.router.lifespan_context(first), second.router.lifespan_context(second):
+            for app in (first, second):
+                app.state.tx_numbers = TransactionNumberAllocator(5, clock=lambda: NOW)
+            clients = [
+                httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+                for app in (first, second)
+            ]
+            product_id = await _product(clients[0])
+            responses = []
+            for i in range(20):
+                responses.append(await clients[i % 2].post("/transactions", json=_sale(product_id)))
+            for client in clients:
+                await client.aclose()
+            return responses
+
+    responses = asyncio.run(scenario())
+    assert [r.status_code for r in responses] == [200] * 20
+    numbers = [r.json()["transaction_number"] for r in responses]
+    assert len(set(numbers)) == 20
+
+
+def test_statement_count_does_not_grow_with_the_basket(tmp_path):
+    app = create_app(_settings(tmp_path, "statements"))
+
+    async def scenario(client):
+        product_ids = [await _product(client) for _ in range(5)]
+        statements = []
+        event.listen(app.state.engine.sync_engine, "before_cursor_execute",
+                     lambda *args: statements.append(1))
+        counts = []
+        for size in (1, 10, 100, 500):
+            body = {"items": [{"product_id": product_ids[i % 5], "weight": 250.0} for i in range(size)]}
+            statements.clear()
+            created = (await client.post("/transactions", json=body)).json()
+            writes = len(statements)
+            statements.clear()
+            detail = (await client.get(f"/transactions/{created['id']}")).json()
+            assert len(detail["items"]) == size
+            counts.append((writes, len(statements)))
+        return counts
+
+    counts = asyncio.run(_serving(app, scenario))
+    assert len(set(counts)) == 1, counts
@@ -0,0 +1,103 @@
+import fcntl
+import threading
+
+import pytest
+
+from app.txnumber import (
+    SEQUENCE_PER_SECOND,
+    TransactionNumberAllocator,
+    number_second,
+    release_worker_id,
+    resolve_worker_id,
+)
+
+NOW = 1_700_000_000.5
+
+
+def test_numbers_encode_second_worker_and_sequence():
+    allocator = TransactionNumberAllocator(7, clock=lambda: NOW)
+    first, second = allocator.next(), allocator.next()
+    assert first == "TX231114221320070000"
+    assert second == "TX231114221320070001"
+    assert number_second(first) == int(NOW)
+
+
+def test_threads_sharing_one_allocator_never_repeat():
+    allocator = TransactionNumberAllocator(0, clock=lambda: NOW)
+    outputs = [[] for _ in range(8)]
+
+    def allocate(out):
+        out.extend(allocator.next() for _ in range(5000))
+
+    threads = [threading.Thread(target=allocate, args=(out,)) for out in outputs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    numbers = [n for out in outputs for n in out]
+    # 40k numbers in one frozen second: four seconds borrowed, none repeated
+    assert len(set(numbers)) == len(numbers) == 40_000
+
+
+def test_restart_within_the_same_second_resumes_after_issued_numbers():
+    before = TransactionNumberAllocator(3, clock=lambda: NOW)
+    issued = [before.next() for _ in range(10)]
+    after = TransactionNumberAllocator(3, clock=lambda: NOW, issued_until=number_second(max(issued)))
+    reissued = [after.next() for _ in range(10)]
+    assert not set(issued) & set(reissued)
+    assert min(reissued) > max(issued)
+
+
+def test_restart_after_borrowing_future_seconds():
+    before = TransactionNumberAllocator(3, clock=lambda: NOW)
+    issued = [before.next() for _ in range(3 * SEQUENCE_PER_SECOND)]
+    assert number_second(max(issued)) == int(NOW) + 2
+    after = TransactionNumberAllocator(3, clock=lambda: NOW + 1, issued_until=number_second(max(issued)))
+    assert after.next() > max(issued)
+
+
+def test_number_second_ignores_foreign_numbers():
+    assert number_second(None) == 0
+    assert number_second("TX-LEGACY-000001") == 0
+    assert number_second("TX99999999999900000X") == 0
+
+
+def test_shared_database_needs_worker_id():
+    with pytest.raises(RuntimeError, match="WORKER_ID"):
+        resolve_worker_id(None, single_host=False)
+    worker_id = resolve_worker_id(42, single_host=False)
+    release_worker_id(worker_id)
+    assert worker_id == 42
+
+
+def test_siblings_with_the_same_worker_id_get_their_own_ids(monkeypatch, tmp_path):
+    monkeypatch.setenv("WORKER_LOCK_DIR", str(tmp_path))
+    # A sibling process already holds the first id of the range
+    sibling = open(tmp_path / "ble-scale-worker-40.lock", "w")
+    fcntl.flock(sibling, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    try:
+        claimed = [resolve_worker_id(40, 3) for _ in range(2)]
+        assert claimed == [41, 42]
+        with pytest.raises(RuntimeError, match="WORKER_PROCESSES"):
+            resolve_worker_id(40, 3)
+        release_worker_id(41)
+        assert resolve_worker_id(40, 3) == 41
+    finally:
+        sibling.close()
+        for worker_id in (41, 42):
+            release_worker_id(worker_id)
+
+
+def test_worker_range_must_fit():
+    with pytest.raises(RuntimeError, match="WORKER_PROCESSES"):
+        resolve_worker_id(98, 4)
+
+
+def test_lock_file_ids_are_unique_until_released():
+    first = resolve_worker_id(None, single_host=True)
+    second = resolve_worker_id(None, single_host=True)
+    assert first != second
+    release_worker_id(first)
+    assert resolve_worker_id(None, single_host=True) == first
+    release_worker_id(first)
+    release_worker_id(second)
@@ -0,0 +1,60 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.database import async_session_maker
+from app.models.models import Device, Measurement
+from app.writer import WriteQueue
+
+
+def test_readings_are_committed_before_add_reading_returns(run_db):
+    waits = []
+
+    async def scenario():
+        async with async_session_maker() as session:
+            session.add(Device(mac_address="AA:00:00:00:00:01", name="Scale"))
+            await session.commit()
+        writer = WriteQueue(async_session_maker, observe_pool_wait=waits.append)
+        task = asyncio.create_task(writer.run())
+        stored = await asyncio.gather(
+            writer.add_reading("AA:00:00:00:00:01", 1.5, "kg", True, 90),
+            writer.add_reading("AA:00:00:00:00:01", 1.6, "kg", True, 90),
+            writer.add_reading("FF:00:00:00:00:00", 1.0, "kg", True, None),
+            writer.add_reading("AA:00:00:00:00:01", 1.0, "stone", True, None),
+        )
+        async with async_session_maker() as session:
+            count = await session.scalar(
+                select(func.count()).select_from(Measurement)
+                .join(Device).where(Device.mac_address == "AA:00:00:00:00:01")
+            )
+        writer.stop()
+        await task
+        return stored, count, writer.stats()
+
+    stored, count, stats = run_db(scenario)
+    assert stored == [True, True, False, False]
+    assert count == 2
+    assert stats["batches"] == 1
+    assert stats["readings_dropped"] == 2
+    assert len(waits) == 1
+
+
+def test_failed_job_only_fails_its_caller(run_db):
+    async def ok(session):
+        return "ok"
+
+    async def broken(session):
+        raise RuntimeError("bad job")
+
+    async def scenario():
+        writer = WriteQueue(async_session_maker)
+        task = asyncio.create_task(writer.run())
+        results = await asyncio.gather(writer.submit(ok), writer.submit(broken), writer.submit(ok),
+                                       return_exceptions=True)
+        writer.stop()
+        await task
+        return results
+
+    first, second, third = run_db(scenario)
+    assert first == third == "ok"
+    assert isinstance(second, RuntimeError)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-reading and per-request hot paths.
+
+Times each operation timeit-style (GC off, loop count calibrated to about
+--target-ms per repeat, --repeat repeats; the median is the figure to
+compare, min and spread show how noisy the run was) and then runs it under
+tracemalloc for the peak bytes one call allocates and the bytes still held
+after a thousand (which should be ~0).
+
+    validate    MeasurementCreate / TransactionCreate from JSON
+    serialize   List[ProductResponse] from ORM rows to JSON, as the route does
+    jwt         create_access_token and jwt.decode
+    emulator    ble_emulator_tcp.ScaleEmulator.to_json,
+                ble_emulator.ScaleEmulator.get_weight_packet (needs bless),
+                scale_protocol.pack_weight
+    transfer    verify_transfer on a valid code and on an unknown one
+
+Usage:
+    python benchmarks/bench_hot_paths.py --save baseline.json
+    python benchmarks/bench_hot_paths.py --compare baseline.json [--threshold 15]
+    python benchmarks/bench_hot_paths.py --only jwt,transfer
+
+--compare exits non-zero if any benchmark's median and minimum are both
+more than --threshold percent slower than in the baseline.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "emulator"))
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='ble-scale-bench-')}/bench.db")
+
+from fastapi import HTTPException  # noqa: E402
+from jose import jwt  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app import main  # noqa: E402
+from app.models.models import Product  # noqa: E402
+
+import ble_emulator_tcp  # noqa: E402
+from scale_protocol import pack_weight  # noqa: E402
+
+try:
+    with contextlib.redirect_stdout(io.StringIO()):
+        import ble_emulator
+except (ImportError, SystemExit):     # Exits when bless is missing
+    ble_emulator = None
+
+
+def drive(coro):
+    """Run a coroutine that never suspends without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("coroutine suspended")
+
+
+def build_benchmarks():
+    """name -> (group, zero-argument callable)."""
+    benchmarks = {}
+
+    measurement = json.dumps({
+        "device_mac": "02:4C:54:00:01:2A", "weight": 523.4, "unit": "g",
+        "is_stable": True, "battery_level": 87,
+    })
+    transaction = json.dumps({
+        "items": [{"product_id": i, "weight": 250.0 + i} for i in range(1, 6)],
+        "payment_method": "card",
+    })
+    benchmarks["MeasurementCreate.validate_json"] = (
+        "validate", lambda: main.MeasurementCreate.model_validate_json(measurement))
+    benchmarks["TransactionCreate.validate_json (5 items)"] = (
+        "validate", lambda: main.TransactionCreate.model_validate_json(transaction))
+
+    products = [
+        Product(id=i, name=f"Product {i}", sku=f"SKU{i:05d}", price_per_unit=1.5 + i % 7, unit="kg",
+                category="Produce", icon=None, color="#4CAF50", is_active=True)
+        for i in range(1, 101)
+    ]
+    product_list = TypeAdapter(List[main.ProductResponse])
+    benchmarks["List[ProductResponse] (100 rows)"] = (
+        "serialize", lambda: product_list.dump_json(product_list.validate_python(products, from_attributes=True)))
+
+    token = main.create_access_token({"sub": "operator@shop.test"})
+    benchmarks["create_access_token"] = (
+        "jwt", lambda: main.create_access_token({"sub": "operator@shop.test"}))
+    settings = main.get_settings()
+    benchmarks["jwt.decode"] = (
+        "jwt", lambda: jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm]))
+
+    tcp_scale = ble_emulator_tcp.ScaleEmulator()
+    tcp_scale.weight = 523.4
+    benchmarks["ScaleEmulator.to_json"] = ("emulator", tcp_scale.to_json)
+    if ble_emulator is not None:
+        ble_scale = ble_emulator.ScaleEmulator()
+        ble_scale.weight = 523.4
+        benchmarks["ScaleEmulator.get_weight_packet"] = ("emulator", ble_scale.get_weight_packet)
+    benchmarks["scale_protocol.pack_weight"] = ("emulator", lambda: pack_weight(523.4, 0, True, 87, 0))
+
+    mac = "02:4C:54:00:01:2A"
+    verify = main.TransferVerifyRequest(transfer_code="123456", new_owner_id=2, device_mac=mac)
+    unknown = main.TransferVerifyRequest(transfer_code="000000", new_owner_id=2, device_mac=mac)
+    expires = main.datetime.utcnow() + main.timedelta(minutes=5)
+
+    def verify_valid():
+        main.transfer_tokens["123456"] = {"device_mac": mac, "owner_id": 1, "expires_at": expires, "used": False}
+        return drive(main.verify_transfer(verify))
+
+    def verify_unknown():
+        try:
+            drive(main.verify_transfer(unknown))
+        except HTTPException:
+            pass
+
+    benchmarks["verify_transfer (valid)"] = ("transfer", verify_valid)
+    benchmarks["verify_transfer (unknown code)"] = ("transfer", verify_unknown)
+    return benchmarks
+
+
+def time_it(fn, repeat: int, target_ms: float) -> dict:
+    """Per-call nanoseconds over `repeat` calibrated runs."""
+    loops = 1
+    while True:
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter_ns() - started
+        if elapsed >= target_ms * 1e6 / 5 or loops >= 1 << 24:
+            break
+        loops *= 2
+    loops = max(1, int(loops * target_ms * 1e6 / max(elapsed, 1)))
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for _ in range(loops):
+                fn()
+            runs.append((time.perf_counter_ns() - started) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "loops": loops,
+        "median_ns": round(statistics.median(runs), 1),
+        "min_ns": round(min(runs), 1),
+        "spread_pct": round((max(runs) - min(runs)) / statistics.median(runs) * 100, 1),
+    }
+
+
+def allocations(fn, calls: int = 1000) -> dict:
+    """Peak bytes allocated during one call, and bytes still held after many."""
+    fn()    # Warm caches so one-off allocations are not counted
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(21):
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        base, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            fn()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes_per_call": int(statistics.median(peaks)),
+        "retained_bytes_per_call": round(max(0, current - base) / calls, 1),
+    }
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["benchmarks"]
+    ok = True
+    print(f"\nvs {baseline_path}, threshold {threshold:g}%")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"  {name:<44} (not in baseline)")
+            continue
+        change = (result["median_ns"] - old["median_ns"]) / old["median_ns"] * 100
+        # The fastest repeat must have slowed down too, so one noisy run cannot fail the check
+        min_change = (result["min_ns"] - old["min_ns"]) / old["min_ns"] * 100
+        flag = "SLOWER" if change > threshold and min_change > threshold else ""
+        ok &= not flag
+        print(f"  {name:<44} {old['median_ns']:>10.0f} -> {result['median_ns']:>10.0f} ns ({change:+6.1f}%) {flag}")
+    return ok
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--target-ms", type=float, default=200.0, help="Duration of each repeat")
+    parser.add_argument("--only", help="Comma-separated groups: validate,serialize,jwt,emulator,transfer")
+    parser.add_argument("--save", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline results file")
+    parser.add_argument("--threshold", type=float, default=15.0, help="Slowdown threshold in percent")
+    args = parser.parse_args()
+
+    groups = set(args.only.split(",")) if args.only else None
+    benchmarks = {
+        name: fn for name, (group, fn) in build_benchmarks().items()
+        if groups is None or group in groups
+    }
+    if ble_emulator is None and (groups is None or "emulator" in groups):
+        print("(ScaleEmulator.get_weight_packet skipped: ble_emulator needs bless)\n")
+
+    print(f"{'benchmark':<44} {'median ns':>10} {'min ns':>10} {'spread':>7} {'peak B':>8} {'kept B':>7}")
+    results = {}
+    for name, fn in benchmarks.items():
+        result = {**time_it(fn, args.repeat, args.target_ms), **allocations(fn)}
+        results[name] = result
+        print(f"{name:<44} {result['median_ns']:>10.0f} {result['min_ns']:>10.0f} "
+              f"{result['spread_pct']:>6.1f}% {result['peak_bytes_per_call']:>8} {result['retained_bytes_per_call']:>7.1f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "benchmarks": results}, f, indent=2)
+        print(f"\nResults written to {args.save}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
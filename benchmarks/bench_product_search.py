@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Product search index: lookup latency at catalog scale.
+
+Builds the in-memory index over a synthetic catalog (default 50k products
+with skewed sales) and times type-ahead queries as a cashier would issue
+them, one keystroke at a time, reporting percentiles per query shape.
+
+Usage:
+    python benchmarks/bench_product_search.py [--products 50000] [--rounds 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app.search import ProductSearchIndex  # noqa: E402
+
+WORDS = (
+    "apple orange banana mango grape lemon lime cherry peach plum pear melon kiwi papaya "
+    "tomato potato onion garlic carrot pepper chili ginger spinach lettuce cabbage "
+    "rice flour sugar salt lentil bean pea almond walnut cashew raisin date fig "
+    "beef lamb chicken fish shrimp cheese butter yogurt honey olive tea coffee"
+).split()
+ADJECTIVES = "red green yellow organic fresh dried local sweet sour baby large small".split()
+VARIANTS = "250g 500g 1kg 2kg 5kg bulk pack tray loose premium".split()
+SYLLABLES = "ka lo mi ra su te no va zi be do fu ga hi ju ke li mo na pe ri sa to".split()
+CATEGORIES = "Fruits Vegetables Grains Nuts Meat Dairy Spices Drinks Bakery".split()
+
+
+def make_catalog(count: int, rng: random.Random):
+    brands = sorted({"".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).title() for _ in range(3000)})
+    for i in range(count):
+        name = " ".join((
+            rng.choice(brands), rng.choice(ADJECTIVES).title(),
+            rng.choice(WORDS).title(), rng.choice(VARIANTS),
+        ))
+        yield {
+            "id": i + 1,
+            "name": name,
+            "sku": f"{name[:3].upper()}{i:06d}",
+            "price_per_unit": round(rng.uniform(0.5, 40), 2),
+            "unit": "kg",
+            "category": rng.choice(CATEGORIES),
+            "icon": None,
+            "color": None,
+            "is_active": True,
+        }
+
+
+def keystrokes(word: str):
+    return [word[:n] for n in range(1, len(word) + 1)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    catalog = list(make_catalog(args.products, rng))
+    sales = {pid: int(10_000 / pid) + 1 for pid in range(1, args.products + 1)}  # Zipf-like
+
+    tracemalloc.start()
+    sized = ProductSearchIndex()
+    sized.upsert_many(catalog)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sized
+
+    index = ProductSearchIndex()
+    started = time.perf_counter()
+    index.upsert_many(catalog)
+    index.add_sales(sales)
+    index.warm()
+    build = time.perf_counter() - started
+
+    queries = {
+        "name keystrokes": [q for w in rng.sample(WORDS, 10) for q in keystrokes(w)],
+        "sku prefix": [p["sku"][:n] for p in rng.sample(catalog, 10) for n in (3, 5, 7)],
+        "two words": [f"{rng.choice(ADJECTIVES)} {rng.choice(WORDS)[:3]}" for _ in range(30)],
+        "long word": [w for w in WORDS if len(w) >= 6][:20],
+        "typo (fuzzy)": ["bananna", "tomatoe", "cashw", "yoghurt", "chilli", "oranges"],
+    }
+
+    print(f"catalog: {len(index):,} products, built in {build:.2f}s, "
+          f"index holds {memory / 1e6:.1f} MB")
+    print(f"{'query shape':<16} {'n':>5} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+    for shape, items in queries.items():
+        timings = []
+        for _ in range(args.rounds):
+            for query in items:
+                t0 = time.perf_counter()
+                index.search(query, 20)
+                timings.append((time.perf_counter() - t0) * 1e6)
+        print(f"{shape:<16} {len(timings):>5} {statistics.median(timings):>9.1f} "
+              f"{percentile(timings, 99):>9.1f} {max(timings):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
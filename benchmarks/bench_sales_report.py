@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Sales reports: summary tables vs. raw aggregation over transaction items.
+
+Loads --items transaction items (default 10M, ~4 per transaction) spread
+over --days days into a throwaway SQLite database as pre-existing history,
+then times GET /reports/sales query shapes three ways: straight from the
+raw tables, with half the history backfilled into the summaries (the rest
+read raw), and fully backfilled. Every summary answer is checked against
+the raw one; exits non-zero on any mismatch.
+
+Usage:
+    python benchmarks/bench_sales_report.py [--items 10000000] [--days 365]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+_db_dir = tempfile.mkdtemp(prefix="ble-scale-bench-")
+_db_path = os.path.join(_db_dir, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_path}"
+
+from app.database import async_session_maker, engine, init_db  # noqa: E402
+from app.models.models import SalesRollupState  # noqa: E402
+from app.reports import backfill_chunk, init_sales_rollup, sales_report  # noqa: E402
+
+PRODUCTS = 300
+OPERATORS = 12
+CATEGORIES = ("Produce", "Meat", "Cheese", "Bakery", "Bulk", "Deli")
+FMT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def load_history(items: int, days: int, seed: int):
+    """Bulk-load products, users and `items` sale lines with the stdlib driver."""
+    rng = random.Random(seed)
+    db = sqlite3.connect(_db_path)
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    db.executemany(
+        "INSERT INTO users (id, email, hashed_password, role, is_active) VALUES (?, ?, 'x', 'OPERATOR', 1)",
+        [(i, f"operator{i}@shop.test") for i in range(1, OPERATORS + 1)],
+    )
+    prices = [round(rng.uniform(0.5, 40.0), 2) for _ in range(PRODUCTS)]
+    db.executemany(
+        "INSERT INTO products (id, name, sku, price_per_unit, unit, category, is_active) "
+        "VALUES (?, ?, ?, ?, 'KILOGRAMS', ?, 1)",
+        [(i + 1, f"Product {i}", f"SKU{i:05d}", prices[i], CATEGORIES[i % len(CATEGORIES)])
+         for i in range(PRODUCTS)],
+    )
+
+    start = datetime.utcnow() - timedelta(days=days)
+    span = days * 86400
+    transactions = items // 4
+    step = span / transactions
+
+    def tx_rows():
+        for t in range(1, transactions + 1):
+            created = start + timedelta(seconds=t * step)
+            yield (t, f"B{t:012d}", 0.0, "cash", rng.randint(1, OPERATORS), created.strftime(FMT))
+
+    def item_rows():
+        item_id = 0
+        for t in range(1, transactions + 1):
+            for _ in range(4 if t <= transactions - 1 else items - item_id):
+                item_id += 1
+                product = rng.randrange(PRODUCTS)
+                weight = round(rng.uniform(50, 2500), 1)
+                yield (item_id, t, product + 1, weight, prices[product],
+                       round(weight / 1000 * prices[product], 2))
+
+    db.executemany(
+        "INSERT INTO transactions (id, transaction_number, total_amount, payment_method, created_by_id, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)", tx_rows(),
+    )
+    db.executemany(
+        "INSERT INTO transaction_items (id, transaction_id, product_id, weight, unit_price, total_price) "
+        "VALUES (?, ?, ?, ?, ?, ?)", item_rows(),
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+    return start
+
+
+def shapes(start: datetime, days: int):
+    now = start + timedelta(days=days)
+    last_week = now - timedelta(days=7, minutes=17)
+    return [
+        ("all time by product", ["product"], "none", None, None),
+        ("all time by category/day", ["category"], "day", None, None),
+        ("last 7 days by operator/hour", ["operator"], "hour", last_week, now),
+        ("last 7 days by product/day", ["product"], "day", last_week, now),
+        ("one month totals", [], "none", now - timedelta(days=45, minutes=3), now - timedelta(days=15, minutes=41)),
+    ]
+
+
+def same(a, b):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if {k: v for k, v in x.items() if k not in ("revenue", "weight_g")} != \
+                {k: v for k, v in y.items() if k not in ("revenue", "weight_g")}:
+            return False
+        if abs(x["revenue"] - y["revenue"]) > 0.05 or abs(x["weight_g"] - y["weight_g"]) > 1.0:
+            return False
+    return True
+
+
+async def timed_report(shape, use_summary):
+    _, group_by, period, start, end = shape
+    async with async_session_maker() as session:
+        started = time.perf_counter()
+        rows = await sales_report(session, group_by, period, start, end, use_summary=use_summary)
+        return rows, time.perf_counter() - started
+
+
+async def backfill_until(fraction_left: float, total: int, chunk: int):
+    started = time.perf_counter()
+    while True:
+        async with async_session_maker() as session:
+            state = await session.get(SalesRollupState, 1)
+            if state.backfill_below_id <= max(1, int(total * fraction_left)):
+                break
+            await backfill_chunk(session, chunk)
+    return time.perf_counter() - started
+
+
+async def run(args):
+    engine.echo = False
+    await init_db()
+    started = time.perf_counter()
+    history_start = load_history(args.items, args.days, args.seed)
+    print(f"Loaded {args.items:,} items over {args.days} days in {time.perf_counter() - started:.1f}s")
+    async with async_session_maker() as session:
+        await init_sales_rollup(session)
+
+    cases = shapes(history_start, args.days)
+    raw = {}
+    for shape in cases:
+        raw[shape[0]] = await timed_report(shape, use_summary=False)
+
+    results = {}
+    half_time = await backfill_until(0.5, args.items, args.chunk)
+    for shape in cases:
+        results[(shape[0], "half")] = await timed_report(shape, use_summary=True)
+    full_time = half_time + await backfill_until(0.0, args.items, args.chunk)
+    for shape in cases:
+        results[(shape[0], "full")] = await timed_report(shape, use_summary=True)
+    print(f"Backfill: {full_time:.1f}s for {args.items:,} items ({args.items / full_time:,.0f} items/s)\n")
+
+    failed = False
+    print(f"{'query':<32} {'rows':>6} {'raw ms':>9} {'half ms':>9} {'summary ms':>11} {'speedup':>8}")
+    for shape in cases:
+        name = shape[0]
+        raw_rows, raw_s = raw[name]
+        half_rows, half_s = results[(name, "half")]
+        full_rows, full_s = results[(name, "full")]
+        ok = same(raw_rows, half_rows) and same(raw_rows, full_rows)
+        failed |= not ok
+        print(f"{name:<32} {len(raw_rows):>6} {raw_s * 1000:>9.1f} {half_s * 1000:>9.1f} "
+              f"{full_s * 1000:>11.1f} {raw_s / full_s:>7.0f}x{'' if ok else '  MISMATCH'}")
+    if failed:
+        print("FAIL: summary reports differ from raw aggregation")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--chunk", type=int, default=500_000, help="Backfill ids per DB transaction")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
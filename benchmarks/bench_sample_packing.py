@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+High-rate BLE mode: notifications per second and packing round trip.
+
+Streams a synthetic 50-100 Hz checkweigher signal through SampleBatcher at
+common MTUs, unpacks every notification and checks that timestamps, weights
+and stability flags come back exactly. Exits non-zero on any mismatch.
+
+Usage:
+    python benchmarks/bench_sample_packing.py [--seconds 60]
+"""
+
+import argparse
+import math
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "emulator"))
+
+from scale_protocol import SampleBatcher, unpack_samples  # noqa: E402
+
+MTUS = (23, 185, 247, 517)
+RATES = (50, 80, 100)
+
+
+def signal(seconds: float, rate: int):
+    """(t_ms, weight, stable) for items crossing a checkweigher every 0.6 s."""
+    step = 1000.0 / rate
+    for n in range(int(seconds * rate)):
+        t_ms = int(n * step) + 4_294_960_000    # Starts just before the uint32 wrap
+        phase = (n * step) % 600
+        weight = 0.0 if phase > 450 else 250.0 * (1 - math.exp(-phase / 40))
+        yield t_ms, weight, phase > 200
+
+
+def run(seconds: float, rate: int, mtu: int):
+    batcher = SampleBatcher(mtu)
+    expected = list(signal(seconds, rate))
+    packets = []
+    started = time.perf_counter()
+    for t_ms, weight, stable in expected:
+        packets.extend(batcher.add(t_ms, weight, stable, 0, 90, 0))
+        if batcher.due(t_ms):
+            packets.append(batcher.flush(0, 90, 0))
+    tail = batcher.flush(0, 90, 0)
+    if tail:
+        packets.append(tail)
+    pack_time = time.perf_counter() - started
+
+    received = [s for packet in packets for s in unpack_samples(packet)["samples"]]
+    ok = len(received) == len(expected) and all(
+        got[0] == want[0] & 0xFFFFFFFF
+        and got[1] == struct.unpack("<f", struct.pack("<f", want[1]))[0]
+        and got[2] == want[2]
+        for got, want in zip(received, expected)
+    )
+    largest = max(len(p) for p in packets)
+    return len(packets) / seconds, largest, pack_time / len(expected) * 1e6, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'rate Hz':>7} {'MTU':>5} {'notif/s':>8} {'vs 1:1':>7} {'max bytes':>9} {'us/sample':>9}  round trip")
+    for rate in RATES:
+        for mtu in MTUS:
+            per_second, largest, cost, ok = run(args.seconds, rate, mtu)
+            failed |= not ok or largest > mtu - 3
+            print(f"{rate:>7} {mtu:>5} {per_second:>8.1f} {rate / per_second:>6.1f}x "
+                  f"{largest:>9} {cost:>9.2f}  {'ok' if ok else 'MISMATCH'}")
+    if failed:
+        print("FAIL: packets lost samples or exceeded the MTU")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
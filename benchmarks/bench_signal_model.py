@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+HX711 signal model: throughput, settling behaviour and reproducibility.
+
+Runs the vectorized model for several fleet sizes, reports how much of a
+core one second of simulated sampling costs, measures how long the firmware
+filter takes to report a stable reading after a load is placed, and checks
+that two runs with the same seed produce identical samples.
+
+Usage:
+    python benchmarks/bench_signal_model.py [--sample-rate 80] [--seconds 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "emulator"))
+
+from hx711_model import HX711SignalModel  # noqa: E402
+
+SIZES = (100, 1000, 10_000)
+
+
+def scripted_run(count: int, seed: int, sample_rate: float, seconds: float):
+    """Tare, place loads spread over the range, and sample for `seconds`."""
+    model = HX711SignalModel(count, seed=seed, sample_rate=sample_rate)
+    model.run(int(sample_rate))
+    model.tare(np.arange(count))
+    model.run(int(sample_rate))
+    loads = np.random.default_rng(seed).uniform(50.0, 4500.0, count)
+    model.set_load(np.arange(count), loads)
+    started = time.perf_counter()
+    block = model.run(int(sample_rate * seconds))
+    return block, loads, time.perf_counter() - started
+
+
+def settle_times(block, sample_rate: float):
+    """Time from placing the load until the first stable reading, per scale (ms)."""
+    stable = block.stable
+    unstable_seen = np.maximum.accumulate(~stable, axis=1)
+    settled = stable & unstable_seen
+    first = np.where(settled.any(axis=1), settled.argmax(axis=1), -1)
+    return first[first >= 0] * 1000.0 / sample_rate, int((first < 0).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sample-rate", type=float, default=80.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'scales':>7} {'samples/s':>11} {'core %':>7} {'settle p50 ms':>14} {'p95 ms':>8} "
+          f"{'never':>6} {'uncal. err g':>14}")
+    for count in SIZES:
+        block, loads, elapsed = scripted_run(count, args.seed, args.sample_rate, args.seconds)
+        settle, never = settle_times(block, args.sample_rate)
+        error = np.abs(block.weight[:, -1] - loads).mean()
+        print(f"{count:>7} {block.weight.size / elapsed:>11,.0f} {elapsed / args.seconds * 100:>6.1f}% "
+              f"{np.percentile(settle, 50):>14.0f} {np.percentile(settle, 95):>8.0f} {never:>6} "
+              f"{error:>14.2f}")
+
+    first, _, _ = scripted_run(500, args.seed, args.sample_rate, 2.0)
+    second, _, _ = scripted_run(500, args.seed, args.sample_rate, 2.0)
+    if not (np.array_equal(first.raw, second.raw) and np.array_equal(first.weight, second.weight)):
+        print("FAIL: same seed produced different samples")
+        sys.exit(1)
+    print("same seed, same samples: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Cold start: import time and time to first response, in fresh processes.
+
+Each run starts a new interpreter that imports app.main, runs the
+lifespan against a new throwaway SQLite database and sends GET /health,
+then POST /auth/login (the first request to need the JWT library), all
+in-process. Reported per phase, as median and min over --runs:
+
+    import        from app.main import app
+    startup       lifespan up to the point it yields (tables, caches, tasks)
+    first health  GET /health, the first response
+    first login   POST /auth/login
+    process       interpreter launch to exit, timed by this script
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--importtime 15]
+    python benchmarks/bench_startup.py --save startup.json
+    python benchmarks/bench_startup.py --compare startup.json [--threshold 20]
+
+--compare exits non-zero if the import, startup or first-response median
+and minimum are both more than --threshold percent slower than the baseline.
+--importtime N lists the N slowest imports made by ``import app.main``
+(python -X importtime).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+PHASES = ("import", "startup", "first health", "first login", "process")
+GATED = ("import", "startup", "first health")
+
+
+def child():
+    """One cold start; prints phase timings in ms as JSON."""
+    started = time.perf_counter()
+    sys.path.insert(0, BACKEND)
+    from app.main import app
+    imported = time.perf_counter()
+    if "--import-only" in sys.argv:
+        return
+
+    import asyncio
+    import httpx
+
+    async def serve():
+        timings = {}
+        async with app.router.lifespan_context(app):
+            timings["startup"] = time.perf_counter()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                (await client.get("/health")).raise_for_status()
+                timings["first health"] = time.perf_counter()
+                (await client.post("/auth/login", data={"username": "bench@shop.test", "password": "x"})).raise_for_status()
+                timings["first login"] = time.perf_counter()
+        return timings
+
+    timings = asyncio.run(serve())
+    print(json.dumps({
+        "import": (imported - started) * 1000,
+        "startup": (timings["startup"] - imported) * 1000,
+        "first health": (timings["first health"] - timings["startup"]) * 1000,
+        "first login": (timings["first login"] - timings["first health"]) * 1000,
+    }))
+
+
+def run_once(extra_args=(), child_args=()) -> tuple:
+    """(phase timings in ms, stderr) of one child process."""
+    db_dir = tempfile.mkdtemp(prefix="ble-scale-bench-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite+aiosqlite:///{db_dir}/startup.db",
+        SQL_ECHO="false",
+        WORKER_LOCK_DIR=db_dir,
+    )
+    try:
+        started = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, *extra_args, os.path.abspath(__file__), "--child", *child_args],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+    if "--import-only" in child_args:
+        return {}, out.stderr
+    return {**json.loads(out.stdout.strip().splitlines()[-1]), "process": elapsed}, out.stderr
+
+
+def slowest_imports(count: int):
+    _, stderr = run_once(("-X", "importtime"), ("--import-only",))
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Indented two spaces per nesting level; keep top-level imports only
+        # so nested modules are not counted twice
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative_us), int(self_us), name.strip()))
+    print(f"\n{'slowest top-level imports':<40} {'cumulative ms':>14} {'self ms':>8}")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:count]:
+        print(f"{name:<40} {cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}")
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["phases"]
+    ok = True
+    print(f"\nvs {baseline_path}, threshold {threshold:g}%")
+    for phase in PHASES:
+        old, new = baseline.get(phase), results[phase]
+        if old is None:
+            continue
+        change = (new["median_ms"] - old["median_ms"]) / old["median_ms"] * 100
+        min_change = (new["min_ms"] - old["min_ms"]) / old["min_ms"] * 100
+        flag = "SLOWER" if phase in GATED and change > threshold and min_change > threshold else ""
+        ok &= not flag
+        print(f"  {phase:<14} {old['median_ms']:>8.1f} -> {new['median_ms']:>8.1f} ms ({change:+6.1f}%) {flag}")
+    return ok
+
+
+def main():
+    if "--child" in sys.argv:
+        child()
+        return
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="List the N slowest imports")
+    parser.add_argument("--save", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline results file")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Slowdown threshold in percent")
+    args = parser.parse_args()
+
+    run_once()  # Warm the OS page cache and .pyc files; not counted
+    runs = [run_once()[0] for _ in range(args.runs)]
+    results = {
+        phase: {
+            "median_ms": round(statistics.median(run[phase] for run in runs), 1),
+            "min_ms": round(min(run[phase] for run in runs), 1),
+        }
+        for phase in PHASES
+    }
+    print(f"{'phase':<14} {'median ms':>10} {'min ms':>8}   ({args.runs} runs)")
+    for phase, result in results.items():
+        print(f"{phase:<14} {result['median_ms']:>10.1f} {result['min_ms']:>8.1f}")
+
+    if args.importtime:
+        slowest_imports(args.importtime)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "runs": args.runs, "phases": results}, f, indent=2)
+        print(f"\nResults written to {args.save}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
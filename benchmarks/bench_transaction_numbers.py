@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Transaction number allocation under concurrency.
+
+Simulates several backend workers (distinct worker ids) each serving many
+concurrent checkout tasks, allocates 100k numbers in total and fails if
+any number repeats or a worker's numbers stop being time-ordered.
+
+Then checks two cases the per-worker run cannot see, failing on any
+repeat: --threads threads sharing one allocator (a threadpool inside one
+worker), and a worker restarted within the same second, after having
+borrowed seconds ahead of the clock, seeded with its newest number.
+
+Usage:
+    python benchmarks/bench_transaction_numbers.py [--total 100000] [--workers 8] [--tasks 64] [--threads 8]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app.txnumber import SEQUENCE_PER_SECOND, TransactionNumberAllocator, number_second  # noqa: E402
+
+
+async def checkout_task(allocator: TransactionNumberAllocator, count: int, out: list):
+    for i in range(count):
+        out.append(allocator.next())
+        if i % 64 == 0:
+            await asyncio.sleep(0)  # interleave with the other tasks
+
+
+def run_worker(worker_id: int, total: int, tasks: int, out: list):
+    allocator = TransactionNumberAllocator(worker_id)
+    per_task = [total // tasks + (1 if i < total % tasks else 0) for i in range(tasks)]
+
+    async def main():
+        await asyncio.gather(*(checkout_task(allocator, n, out) for n in per_task))
+
+    asyncio.run(main())
+
+
+def shared_allocator(total: int, threads: int) -> int:
+    """Duplicates among `total` numbers from `threads` threads sharing one allocator."""
+    allocator = TransactionNumberAllocator(0)
+    outputs = [[] for _ in range(threads)]
+    workers = [
+        threading.Thread(target=lambda out: out.extend(allocator.next() for _ in range(total // threads)),
+                         args=(out,))
+        for out in outputs
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    numbers = [n for out in outputs for n in out]
+    return len(numbers) - len(set(numbers))
+
+
+def restart_same_second() -> int:
+    """Duplicates when a worker restarts within the second it last used."""
+    frozen = lambda: 1_700_000_000.5  # noqa: E731
+    before = TransactionNumberAllocator(3, clock=frozen)
+    # Exhaust the current second and borrow two more
+    issued = [before.next() for _ in range(3 * SEQUENCE_PER_SECOND)]
+    after = TransactionNumberAllocator(3, clock=frozen, issued_until=number_second(max(issued)))
+    reissued = [after.next() for _ in range(SEQUENCE_PER_SECOND)]
+    return len(set(issued) & set(reissued))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--total", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=64, help="async tasks per worker")
+    parser.add_argument("--threads", type=int, default=8, help="threads sharing one allocator")
+    args = parser.parse_args()
+
+    outputs = [[] for _ in range(args.workers)]
+    per_worker = [args.total // args.workers + (1 if i < args.total % args.workers else 0)
+                  for i in range(args.workers)]
+    threads = [
+        threading.Thread(target=run_worker, args=(wid, per_worker[wid], args.tasks, outputs[wid]))
+        for wid in range(args.workers)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    numbers = [n for out in outputs for n in out]
+    duplicates = len(numbers) - len(set(numbers))
+    unordered = sum(out != sorted(out) for out in outputs)
+    bad_length = sum(len(n) != 20 for n in numbers)
+
+    print(f"allocated:   {len(numbers):,} numbers in {elapsed:.3f}s "
+          f"({len(numbers) / elapsed:,.0f}/s)")
+    print(f"duplicates:  {duplicates}")
+    print(f"unordered:   {unordered} worker(s)")
+    print(f"bad length:  {bad_length}")
+    print(f"sample:      {numbers[0]} .. {numbers[-1]}")
+
+    shared_duplicates = shared_allocator(args.total, args.threads)
+    restart_duplicates = restart_same_second()
+    print(f"shared:      {shared_duplicates} duplicates across {args.threads} threads on one allocator")
+    print(f"restart:     {restart_duplicates} reissued after a restart within the same second")
+
+    if duplicates or unordered or bad_length or len(numbers) != args.total:
+        sys.exit(1)
+    if shared_duplicates or restart_duplicates:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
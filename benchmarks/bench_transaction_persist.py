@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Transaction persistence: statement count and latency vs. basket size.
+
+Drives POST /transactions and GET /transactions/{id} in-process against a
+throwaway SQLite database and counts the SQL statements each request
+executes. Exits non-zero if the count changes with the number of items.
+
+Usage:
+    python benchmarks/bench_transaction_persist.py [--sizes 1,10,100,1000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+_db_dir = tempfile.mkdtemp(prefix="ble-scale-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/bench.db")
+os.environ.setdefault("SQL_ECHO", "false")
+os.environ.setdefault("WORKER_LOCK_DIR", _db_dir)
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.models.models import Product  # noqa: E402
+
+
+class StatementCounter:
+    def __init__(self, sync_engine):
+        self.count = 0
+        event.listen(sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+async def measure(client, counter, method, path, **kwargs):
+    counter.count = 0
+    started = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    return response.json(), counter.count, elapsed
+
+
+async def run(sizes):
+    async with app.router.lifespan_context(app):
+        async with app.state.session_factory() as session:
+            await session.execute(insert(Product), [
+                {"name": f"Product {i}", "sku": f"SKU{i:05d}", "price_per_unit": 1.0 + i % 7}
+                for i in range(max(sizes))
+            ])
+            await session.commit()
+
+        counter = StatementCounter(app.state.engine.sync_engine)
+        transport = httpx.ASGITransport(app=app)
+        results = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for size in sizes:
+                body = {"items": [{"product_id": i + 1, "weight": 250.0} for i in range(size)]}
+                created, writes, t_write = await measure(
+                    client, counter, "POST", "/transactions", json=body)
+                detail, reads, t_read = await measure(
+                    client, counter, "GET", f"/transactions/{created['id']}")
+                assert len(detail["items"]) == size
+                results.append((size, writes, t_write, reads, t_read))
+
+    print(f"{'items':>6} {'POST stmts':>10} {'POST ms':>9} {'GET stmts':>10} {'GET ms':>8}")
+    for size, writes, t_write, reads, t_read in results:
+        print(f"{size:>6} {writes:>10} {t_write * 1000:>9.2f} {reads:>10} {t_read * 1000:>8.2f}")
+
+    write_counts = {r[1] for r in results}
+    read_counts = {r[3] for r in results}
+    if len(write_counts) != 1 or len(read_counts) != 1:
+        print("FAIL: statement count depends on item count")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    args = parser.parse_args()
+    asyncio.run(run([int(s) for s in args.sizes.split(",")]))
+
+
+if __name__ == "__main__":
+    main()
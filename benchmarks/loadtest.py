@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: throughput and latency percentiles per endpoint.
+
+Drives a weighted mix of scale measurement ingestion, POS transactions,
+product listing, logins and transfer flows (initiate + verify) either
+in-process through ASGI against a throwaway SQLite database, or against a
+running server with --url.
+
+Closed loop by default (--concurrency workers back to back). With --rate
+the load is open loop: Poisson arrivals at that many operations per second,
+at most --concurrency in flight, and latency measured from each operation's
+scheduled start so a slow server cannot hide its queueing delay. Arrivals
+that find every slot busy are counted as missed.
+
+Usage:
+    python benchmarks/loadtest.py --duration 20 --concurrency 32
+    python benchmarks/loadtest.py --url http://localhost:8000 --rate 500 --json run.json
+    python benchmarks/loadtest.py --mix measurement=80,transaction=20 --compare run.json
+
+--compare exits non-zero if any endpoint's p95 is more than --threshold
+percent slower than in the baseline, or total throughput drops by as much.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+DEFAULT_MIX = "measurement=60,transaction=15,products=15,login=5,transfer=5"
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+class Recorder:
+    """Latencies and status counts per endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.missed = 0
+        self.recording = False
+
+    def add(self, endpoint, status, seconds):
+        if self.recording:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "throughput": round(len(values) / elapsed, 2),
+                "ok": sum(n for s, n in statuses.items() if isinstance(s, int) and s < 400),
+                "statuses": {str(s): n for s, n in sorted(statuses.items(), key=str)},
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        everything = sorted(v for values in self.latencies.values() for v in values)
+        total = {
+            "requests": len(everything),
+            "throughput": round(len(everything) / elapsed, 2),
+            "p50_ms": round(percentile(everything, 50) * 1000, 3),
+            "p95_ms": round(percentile(everything, 95) * 1000, 3),
+            "p99_ms": round(percentile(everything, 99) * 1000, 3),
+            "max_ms": round(everything[-1] * 1000, 3) if everything else 0.0,
+            "missed_arrivals": self.missed,
+        }
+        return endpoints, total
+
+
+class Workload:
+    """The operations in the mix; each issues one or more requests."""
+
+    def __init__(self, client, recorder, rng, scales, product_ids):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.macs = [f"02:4C:54:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}" for i in range(scales)]
+        self.product_ids = product_ids
+        self.owners = 0
+
+    async def request(self, endpoint, method, path, started=None, **kwargs):
+        started = time.perf_counter() if started is None else started
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.recorder.add(endpoint, status, time.perf_counter() - started)
+        return response
+
+    async def measurement(self, started):
+        await self.request("POST /measurements", "POST", "/measurements", started, json={
+            "device_mac": self.rng.choice(self.macs),
+            "weight": round(self.rng.uniform(0, 5000), 1),
+            "unit": "g",
+            "is_stable": self.rng.random() < 0.8,
+            "battery_level": self.rng.randint(5, 100),
+        })
+
+    async def transaction(self, started):
+        items = [
+            {"product_id": self.rng.choice(self.product_ids), "weight": round(self.rng.uniform(50, 2000), 1)}
+            for _ in range(self.rng.randint(1, 8))
+        ]
+        await self.request("POST /transactions", "POST", "/transactions", started,
+                           json={"items": items, "payment_method": self.rng.choice(["cash", "card"])})
+
+    async def products(self, started):
+        await self.request("GET /products", "GET", "/products", started)
+
+    async def login(self, started):
+        await self.request("POST /auth/login", "POST", "/auth/login", started,
+                           data={"username": f"operator{self.rng.randint(1, 50)}@shop.test", "password": "secret"})
+
+    async def transfer(self, started):
+        self.owners += 1
+        owner = self.owners
+        mac = self.rng.choice(self.macs)
+        response = await self.request("POST /transfers/initiate", "POST", "/transfers/initiate", started,
+                                      json={"device_mac": mac, "owner_id": owner})
+        if response is not None and response.status_code == 200:
+            code = response.json()["transfer_code"]
+            await self.request("POST /transfers/verify", "POST", "/transfers/verify",
+                               json={"transfer_code": code, "new_owner_id": owner + 1_000_000, "device_mac": mac})
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("measurement", "transaction", "products", "login", "transfer"):
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def seed_products(client, count):
+    """Make sure the catalog has products to sell; returns their ids."""
+    response = await client.get("/products")
+    response.raise_for_status()
+    ids = [p["id"] for p in response.json()]
+    for i in range(len(ids), count):
+        response = await client.post("/products", json={
+            "name": f"Load test product {i}", "sku": f"LOAD{i:05d}", "price_per_unit": 1.0 + i % 9,
+        })
+        response.raise_for_status()
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def register_scales(client, macs, concurrency):
+    """Register every scale, so /measurements stores readings instead of rejecting them."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def register(mac):
+        async with slots:
+            response = await client.post("/devices", json={"mac_address": mac, "name": f"Load test scale {mac}"})
+        if response.status_code != 400:     # 400: registered by an earlier run
+            response.raise_for_status()
+
+    await asyncio.gather(*(register(mac) for mac in macs))
+
+
+async def closed_loop(workload, ops, weights, concurrency, deadline):
+    async def worker():
+        while time.perf_counter() < deadline:
+            op = workload.rng.choices(ops, weights)[0]
+            await getattr(workload, op)(time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(workload, ops, weights, concurrency, rate, deadline):
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def run(op, scheduled):
+        try:
+            await getattr(workload, op)(scheduled)
+        finally:
+            slots.release()
+
+    scheduled = time.perf_counter()
+    while scheduled < deadline:
+        scheduled += workload.rng.expovariate(rate)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if slots.locked():
+            workload.recorder.missed += workload.recorder.recording
+            continue
+        await slots.acquire()
+        task = asyncio.create_task(run(workload.rng.choices(ops, weights)[0], scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def drive(client, args):
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    product_ids = await seed_products(client, args.products)
+    workload = Workload(client, recorder, rng, args.scales, product_ids)
+    await register_scales(client, workload.macs, args.concurrency)
+    mix = parse_mix(args.mix)
+    ops, weights = list(mix), list(mix.values())
+
+    async def phase(seconds):
+        deadline = time.perf_counter() + seconds
+        if args.rate:
+            await open_loop(workload, ops, weights, args.concurrency, args.rate, deadline)
+        else:
+            await closed_loop(workload, ops, weights, args.concurrency, deadline)
+
+    if args.warmup:
+        await phase(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    await phase(args.duration)
+    return recorder.summary(time.perf_counter() - started)
+
+
+async def run_in_process(args):
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            return await drive(client, args)
+
+
+async def run_remote(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30.0) as client:
+        return await drive(client, args)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(endpoints, total):
+    print(f"{'endpoint':<26} {'reqs':>7} {'req/s':>8} {'ok':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}  statuses")
+    for name, e in endpoints.items():
+        statuses = " ".join(f"{s}:{n}" for s, n in e["statuses"].items())
+        print(f"{name:<26} {e['requests']:>7} {e['throughput']:>8.1f} {e['ok']:>7} {e['p50_ms']:>8.2f} "
+              f"{e['p95_ms']:>8.2f} {e['p99_ms']:>8.2f} {e['max_ms']:>8.2f}  {statuses}")
+    print(f"{'total':<26} {total['requests']:>7} {total['throughput']:>8.1f} {'':>7} {total['p50_ms']:>8.2f} "
+          f"{total['p95_ms']:>8.2f} {total['p99_ms']:>8.2f} {total['max_ms']:>8.2f}")
+    if total["missed_arrivals"]:
+        print(f"missed arrivals (every slot busy): {total['missed_arrivals']}")
+
+
+def compare(result, baseline_path, threshold):
+    """Print p95/throughput changes against a baseline; return True if nothing regressed."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    print(f"\nvs {baseline_path} (commit {baseline['meta'].get('commit')}), threshold {threshold:g}%")
+    differing = [
+        key for key in ("mix", "rate", "concurrency", "duration", "url")
+        if baseline["meta"]["args"].get(key) != result["meta"]["args"].get(key)
+    ]
+    if differing:
+        print(f"  warning: baseline was run with different {', '.join(differing)}")
+    for name, e in result["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if not old or not old["p95_ms"]:
+            continue
+        change = (e["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        flag = "REGRESSION" if change > threshold else ""
+        ok &= not flag
+        print(f"  {name:<26} p95 {old['p95_ms']:>8.2f} -> {e['p95_ms']:>8.2f} ms ({change:+6.1f}%) {flag}")
+    old_rate, new_rate = baseline["total"]["throughput"], result["total"]["throughput"]
+    if old_rate:
+        change = (new_rate - old_rate) / old_rate * 100
+        flag = "REGRESSION" if change < -threshold else ""
+        ok &= not flag
+        print(f"  {'throughput':<26}     {old_rate:>8.1f} -> {new_rate:>8.1f} req/s ({change:+6.1f}%) {flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="Target server (default: the app in-process on a temp SQLite DB)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds first")
+    parser.add_argument("--concurrency", type=int, default=16, help="Workers, or max in flight with --rate")
+    parser.add_argument("--rate", type=float, default=0.0, help="Open-loop arrivals per second (0 = closed loop)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--scales", type=int, default=500, help="Distinct device MACs")
+    parser.add_argument("--products", type=int, default=50, help="Catalog size to ensure")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    if args.url:
+        target = args.url
+        endpoints, total = asyncio.run(run_remote(args))
+    else:
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+        db_dir = tempfile.mkdtemp(prefix="ble-scale-load-")
+        os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{db_dir}/load.db")
+        os.environ.setdefault("SQL_ECHO", "false")
+        # Every in-process request comes from one client address
+        os.environ.setdefault("RATE_LIMIT_CLIENT_PER_SEC", "1000000")
+        os.environ.setdefault("RATE_LIMIT_CLIENT_BURST", "1000000")
+        target = os.environ["DATABASE_URL"]
+        endpoints, total = asyncio.run(run_in_process(args))
+
+    print_report(endpoints, total)
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": target,
+            "args": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+        },
+        "endpoints": endpoints,
+        "total": total,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if args.compare and not compare(result, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
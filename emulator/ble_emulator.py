@@ -6,6 +6,7 @@ Run this on your laptop to test the Flutter app with real BLE.
 Usage:
     pip install bleak bless
     python ble_emulator.py
+    python ble_emulator.py --scenario scenarios/checkout.json --speed 10 --no-console
 
 Controls:
     w <grams>  - Set weight (e.g., "w 500")
@@ -14,6 +15,18 @@ Controls:
     s          - Toggle stability
     q          - Quit
 
+Notification modes (write to the Settings characteristic, '<BfHBH'):
+    mode 0     - Periodic: every reading at 10 Hz (default)
+    mode 1     - On change: only when weight moves beyond the deadband (g) or
+                 stability/battery/error changes, plus a heartbeat (ms)
+    mode 2     - High rate: sample at the given rate (Hz) and pack several
+                 samples with time deltas into one 'SCLM' notification sized
+                 to the MTU the central reports (see scale_protocol.py)
+
+Scenarios (see scenario.py) are driven through the control API on
+http://127.0.0.1:8766 and ws://127.0.0.1:8767. A "disconnect" event mutes
+notifications for its duration; POST /shutdown stops the emulator cleanly.
+
 Requirements:
     - Windows 10+ / macOS / Linux with Bluetooth adapter
     - bleak and bless Python packages
@@ -27,8 +40,10 @@ user_site = os.path.join(os.environ.get('APPDATA', ''), 'Python', 'Python312', '
 if os.path.exists(user_site) and user_site not in sys.path:
     sys.path.insert(0, user_site)
 
+import argparse
 import asyncio
 import struct
+import threading
 from typing import Any
 
 try:
@@ -40,6 +55,12 @@ except ImportError as e:
     print("❌ Missing 'bless' package. Install with: pip install bless")
     sys.exit(1)
 
+from change_filter import ChangeFilter
+from scenario import ControlServer, ScaleTarget, ScenarioError, ScenarioRunner, load_scenario
+from scale_protocol import (
+    MODE_HIGH_RATE, MODE_ON_CHANGE, MODE_PERIODIC, SampleBatcher, pack_settings, unpack_settings,
+)
+
 # Match ESP32 firmware UUIDs
 SERVICE_UUID = "4a4e0001-6746-4b4e-8164-656e67696e65"
 WEIGHT_CHAR_UUID = "4a4e0002-6746-4b4e-8164-656e67696e65"
@@ -62,6 +83,11 @@ class ScaleEmulator:
         self.unit = 0               # 0=grams, 1=kg, 2=lb, 3=oz
         self.error_code = 0         # 0 = no error
         
+    def reading(self) -> tuple:
+        """(display weight, stable, battery, error) as compared in on-change mode."""
+        display_weight = (self.weight - self.tare_offset) * self.calibration
+        return (round(display_weight, 1), self.is_stable, self.battery_level, self.error_code)
+
     def get_weight_packet(self) -> bytes:
         """Create weight data packet matching ESP32 format."""
         display_weight = (self.weight - self.tare_offset) * self.calibration
@@ -104,6 +130,10 @@ class BLEScaleServer:
         self.server: BlessServer = None
         self.scale = ScaleEmulator()
         self.running = False
+        self.settings = unpack_settings(bytes([MODE_PERIODIC]))
+        self.change_filter = None   # ChangeFilter in on-change mode
+        self.batcher = None         # SampleBatcher in high-rate mode
+        self.muted_until = 0.0      # Loop time until which notifications are dropped
         
     async def start(self):
         """Start the BLE server."""
@@ -150,6 +180,15 @@ class BLEScaleServer:
             GATTAttributePermissions.readable
         )
         
+        # Settings Characteristic (Read + Write): notification mode
+        await self.server.add_new_characteristic(
+            SERVICE_UUID,
+            SETTINGS_CHAR_UUID,
+            GATTCharacteristicProperties.read | GATTCharacteristicProperties.write,
+            self.settings_packet(),
+            GATTAttributePermissions.readable | GATTAttributePermissions.writeable
+        )
+
         # Start advertising
         await self.server.start()
         self.running = True
@@ -184,6 +223,8 @@ class BLEScaleServer:
             return bytearray(self.scale.get_weight_packet())
         elif uuid == BATTERY_CHAR_UUID.lower():
             return bytearray([self.scale.battery_level])
+        elif uuid == SETTINGS_CHAR_UUID.lower():
+            return bytearray(self.settings_packet())
             
         return bytearray()
     
@@ -198,29 +239,104 @@ class BLEScaleServer:
                 # First byte is command, next 4 are float32 weight
                 known_weight = struct.unpack('<f', bytes(value[1:5]))[0]
                 self.scale.calibrate(known_weight)
-                
+        elif uuid == SETTINGS_CHAR_UUID.lower():
+            try:
+                self.apply_settings(unpack_settings(value))
+            except ValueError as e:
+                print(f"⚠️  Ignoring settings write: {e}")
+
+    def settings_packet(self) -> bytes:
+        """Current settings plus the supported-modes mask, as read by the central."""
+        return pack_settings(**self.settings, advertise=True)
+
+    def apply_settings(self, settings: dict):
+        """
+        Switch notification mode: periodic (10 Hz), on change (deadband and
+        heartbeat), or high rate (several samples per notification, sized to
+        the MTU the central reports).
+        """
+        mode = settings["mode"]
+        if mode == MODE_PERIODIC:
+            self.change_filter = self.batcher = None
+            print("📡 Notifications: periodic (10 Hz)")
+        elif mode == MODE_ON_CHANGE:
+            self.change_filter = ChangeFilter(settings["deadband"], settings["heartbeat"])
+            self.batcher = None
+            print(f"📡 Notifications: on change (deadband {self.change_filter.deadband:.1f}g, "
+                  f"heartbeat {self.change_filter.heartbeat:.1f}s)")
+        elif mode == MODE_HIGH_RATE:
+            if not 1 <= settings["sample_rate"] <= 200:
+                raise ValueError(f"Sample rate {settings['sample_rate']} Hz out of range (1-200)")
+            if not 23 <= settings["mtu"] <= 517:
+                raise ValueError(f"MTU {settings['mtu']} out of range (23-517)")
+            self.change_filter = None
+            self.batcher = SampleBatcher(settings["mtu"])
+            print(f"📡 Notifications: high rate ({settings['sample_rate']} Hz, "
+                  f"{self.batcher.capacity} samples per notification at MTU {settings['mtu']})")
+        else:
+            raise ValueError(f"Unknown notification mode: {mode}")
+        self.settings = settings
+
+    def notify(self, packet: bytes):
+        """Publish a packet on the weight characteristic."""
+        self.server.get_characteristic(WEIGHT_CHAR_UUID).value = bytearray(packet)
+        self.server.update_value(SERVICE_UUID, WEIGHT_CHAR_UUID)
+
+    def sample(self, now: float):
+        """Take one high-rate sample; notify when a packet is full or overdue."""
+        batcher = self.batcher
+        scale = self.scale
+        t_ms = int(now * 1000)
+        weight, stable, battery, error = scale.reading()
+        for packet in batcher.add(t_ms, weight, stable, scale.unit, battery, error):
+            self.notify(packet)
+        if batcher.due(t_ms):
+            self.notify(batcher.flush(scale.unit, battery, error))
+
     async def notify_weight(self):
-        """Send weight notifications."""
+        """Send weight notifications in the current mode."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
         while self.running:
             try:
-                if self.server:
-                    self.server.update_value(
-                        SERVICE_UUID,
-                        WEIGHT_CHAR_UUID
-                    )
+                if self.server and loop.time() >= self.muted_until:
+                    if self.batcher is not None:
+                        self.sample(next_tick)
+                    elif self.change_filter is None or self.change_filter.should_send(
+                        self.scale.reading(), loop.time()
+                    ):
+                        self.notify(self.scale.get_weight_packet())
             except Exception:
                 pass
-            await asyncio.sleep(0.1)  # 10 Hz updates
 
+            # 10 Hz updates, or the sample rate in high-rate mode
+            interval = 1.0 / self.settings["sample_rate"] if self.batcher is not None else 0.1
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -0.5:
+                next_tick = loop.time()     # Stalled: resume without a burst
+            await asyncio.sleep(max(0.0, delay))
+
+    def mute(self, seconds: float):
+        """Simulate a radio dropout: no notifications for `seconds` (real time)."""
+        self.muted_until = asyncio.get_running_loop().time() + seconds
+        print(f"📴 Notifications muted for {seconds:g}s")
+
+
+def _read_stdin(loop: asyncio.AbstractEventLoop, lines: asyncio.Queue):
+    """Feed stdin lines to the event loop (daemon thread, so it never blocks exit)."""
+    for line in sys.stdin:
+        loop.call_soon_threadsafe(lines.put_nowait, line)
 
-async def input_handler(server: BLEScaleServer):
+
+async def input_handler(server: BLEScaleServer, stop: asyncio.Event):
     """Handle user input for controlling the emulator."""
-    loop = asyncio.get_event_loop()
+    lines = asyncio.Queue()
+    threading.Thread(target=_read_stdin, args=(asyncio.get_running_loop(), lines), daemon=True).start()
     
     while server.running:
         try:
-            # Read input in a non-blocking way
-            line = await loop.run_in_executor(None, sys.stdin.readline)
+            line = await lines.get()
             line = line.strip().lower()
             
             if not line:
@@ -230,7 +346,7 @@ async def input_handler(server: BLEScaleServer):
             cmd = parts[0]
             
             if cmd == 'q':
-                await server.stop()
+                stop.set()
                 break
             elif cmd == 'w' and len(parts) > 1:
                 try:
@@ -259,21 +375,66 @@ async def input_handler(server: BLEScaleServer):
 
 async def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="BLE scale emulator")
+    parser.add_argument("--scenario", help="Scenario file (JSON, or YAML with PyYAML) to run at startup")
+    parser.add_argument("--speed", type=float, help="Override the scenario speed (0 = as fast as possible)")
+    parser.add_argument("--control-host", default="127.0.0.1")
+    parser.add_argument("--control-port", type=int, default=8766, help="HTTP control API port")
+    parser.add_argument("--control-ws-port", type=int, default=8767, help="WebSocket control API port")
+    parser.add_argument("--no-control", action="store_true", help="Disable the control API")
+    parser.add_argument("--no-console", action="store_true", help="Do not read commands from stdin")
+    parser.add_argument("--exit-on-end", action="store_true", help="Shut down when the scenario finishes")
+    args = parser.parse_args()
+
     server = BLEScaleServer()
+    stop = asyncio.Event()
+
+    def disconnect(seconds: float):
+        speed = runner.clock.speed
+        server.mute(seconds / speed if speed > 0 else 0.0)
+
+    runner = ScenarioRunner(ScaleTarget(server.scale, disconnect), on_shutdown=stop.set)
+    if args.scenario:
+        try:
+            scenario = load_scenario(args.scenario)
+        except (OSError, ScenarioError, ValueError) as e:
+            print(f"❌ Cannot load scenario: {e}")
+            return
+        if args.speed is not None:
+            scenario["speed"] = args.speed
+        runner.load(scenario)
+    control = None if args.no_control else ControlServer(
+        runner, args.control_host, args.control_port, args.control_ws_port
+    )
     
+    tasks = []
     try:
         await server.start()
+        if control:
+            await control.start()
         
-        # Run notification loop and input handler
-        await asyncio.gather(
-            server.notify_weight(),
-            input_handler(server)
-        )
+        # Run notification loop and input handler until asked to stop
+        tasks.append(asyncio.create_task(server.notify_weight()))
+        if not args.no_console:
+            tasks.append(asyncio.create_task(input_handler(server, stop)))
+        waiters = [asyncio.create_task(stop.wait())]
+        if args.scenario:
+            runner.start()
+            if args.exit_on_end:
+                waiters.append(runner.task)
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        tasks.extend(waiters)
     except KeyboardInterrupt:
-        await server.stop()
+        pass
     except Exception as e:
         print(f"❌ Error: {e}")
         print("\n💡 Make sure Bluetooth is enabled and you have admin/root access.")
+    finally:
+        runner.stop_task()
+        for task in tasks:
+            task.cancel()
+        if control:
+            await control.stop()
         await server.stop()
 
 
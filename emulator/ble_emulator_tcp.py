@@ -5,22 +5,33 @@ Simulates ESP32 Scale - Flutter app connects via WebSocket.
 
 Usage:
     python ble_emulator_tcp.py
+    python ble_emulator_tcp.py --scenario scenarios/checkout.json --speed 10 --no-console
 
 Controls:
     w <grams>  - Set weight (e.g., "w 500")
     t          - Tare (zero)
     b <level>  - Set battery level (e.g., "b 75")
     s          - Toggle stability
+    c          - Client send stats
     q          - Quit
 
-The Flutter app connects to ws://localhost:8765
+The Flutter app connects to ws://localhost:8765 (every reading at 10 Hz).
+Connect to ws://localhost:8765/?mode=on_change&deadband=0.5&heartbeat=5 to
+receive a reading only when it changes, plus a heartbeat while idle.
+
+Scenarios (see scenario.py) are driven through the control API on
+http://127.0.0.1:8766 and ws://127.0.0.1:8767; POST /shutdown stops the
+emulator cleanly.
 """
 
+import argparse
 import asyncio
 import json
 import struct
 import sys
 import threading
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
 
 try:
     import websockets
@@ -30,6 +41,9 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "websockets"])
     import websockets
 
+from change_filter import DEFAULT_DEADBAND, DEFAULT_HEARTBEAT, ChangeFilter
+from scenario import ControlServer, ScaleTarget, ScenarioError, ScenarioRunner, load_scenario
+
 
 class ScaleEmulator:
     """Simulates ESP32 Scale behavior."""
@@ -42,12 +56,16 @@ class ScaleEmulator:
         self.is_stable = True       # Weight stability
         self.unit = "g"             # Unit: g, kg, lb, oz
         self.error_code = 0         # 0 = no error
-        self.clients = set()        # Connected WebSocket clients
+        self.clients = {}           # Connected WebSocket -> ClientChannel
         
     def get_display_weight(self) -> float:
         """Get weight after tare and calibration."""
         return (self.weight - self.tare_offset) * self.calibration
         
+    def reading(self) -> tuple:
+        """(display weight, stable, battery, error) as compared by on-change clients."""
+        return (round(self.get_display_weight(), 1), self.is_stable, self.battery_level, self.error_code)
+
     def to_json(self) -> str:
         """Create JSON data packet."""
         return json.dumps({
@@ -80,13 +98,129 @@ class ScaleEmulator:
         print(f"📦 Weight: {self.weight:.1f}g → Display: {display:.1f}g")
 
 
+class ClientChannel:
+    """
+    Outgoing frames for one client: a bounded queue drained by its own writer task.
+
+    The broadcast only appends to the queue, so a slow client never delays the
+    tick. When the writer falls behind it sends just the newest frame and counts
+    the skipped ones as coalesced; if the queue fills while a send is stuck, the
+    oldest frames are dropped. Replies to commands (acks and errors) have their
+    own queue: they are sent in order, ahead of readings, and never coalesced.
+    A client stuck in one send for STALL_TIMEOUT seconds is disconnected.
+    """
+
+    MAX_QUEUE = 16
+    MAX_REPLIES = 256
+    STALL_TIMEOUT = 10.0
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.queue = deque()
+        self.replies = deque()
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.filter = None          # ChangeFilter in on-change mode, None for periodic
+        self.task = asyncio.create_task(self._writer())
+
+    def push(self, message: str):
+        """Queue a frame without waiting."""
+        if len(self.queue) >= self.MAX_QUEUE:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(message)
+        self.ready.set()
+
+    def reply(self, message: str):
+        """Queue a reply to a command; only a client that never reads loses any."""
+        if len(self.replies) >= self.MAX_REPLIES:
+            self.replies.popleft()
+            self.dropped += 1
+        self.replies.append(message)
+        self.ready.set()
+
+    async def _send(self, message: str):
+        await asyncio.wait_for(self.websocket.send(message), self.STALL_TIMEOUT)
+        self.sent += 1
+
+    async def _writer(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.replies:
+                    await self._send(self.replies.popleft())
+                if not self.queue:
+                    continue
+                message = self.queue.pop()
+                self.coalesced += len(self.queue)
+                self.queue.clear()
+                await self._send(message)
+        except asyncio.TimeoutError:
+            print(f"🐢 Client stalled, disconnecting: {self.websocket.remote_address}")
+            self.websocket.transport.abort()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def subscribe(self, params: dict):
+        """
+        Apply subscribe parameters: mode ("periodic" or "on_change"), plus
+        deadband (grams) and heartbeat (seconds) for on-change mode.
+        """
+        mode = params.get("mode", "periodic")
+        if mode == "periodic":
+            self.filter = None
+        elif mode == "on_change":
+            self.filter = ChangeFilter(
+                float(params.get("deadband", DEFAULT_DEADBAND)),
+                float(params.get("heartbeat", DEFAULT_HEARTBEAT)),
+            )
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+
+    def offer(self, reading: tuple, message: str, now: float):
+        """Queue a tick's reading unless this client's filter suppresses it."""
+        if self.filter is None or self.filter.should_send(reading, now):
+            self.push(message)
+
+    def close(self):
+        self.task.cancel()
+
+    def stats(self) -> str:
+        suppressed = self.filter.suppressed if self.filter else 0
+        return (f"sent={self.sent} suppressed={suppressed} coalesced={self.coalesced} "
+                f"dropped={self.dropped} queued={len(self.queue) + len(self.replies)}")
+
+
 # Global emulator instance
 scale = ScaleEmulator()
+tick_stats = {"ticks": 0, "max_late_ms": 0.0}
+offline_until = 0.0                 # loop time until which connections are refused
+shutdown_event = None               # Set (from any thread) to stop the emulator
+scenario_runner = None
 
 
 async def handler(websocket):
-    """Handle WebSocket connections."""
-    scale.clients.add(websocket)
+    """
+    Handle WebSocket connections.
+
+    Clients choose their update mode when connecting, e.g.
+    ws://localhost:8765/?mode=on_change&deadband=1&heartbeat=5, or later with
+    {"command": "subscribe", "mode": "on_change", "deadband": 1, "heartbeat": 5}.
+    """
+    if asyncio.get_running_loop().time() < offline_until:
+        await websocket.close(1013, "scale offline")
+        return
+    channel = ClientChannel(websocket)
+    request = getattr(websocket, "request", None)
+    path = request.path if request is not None else websocket.path
+    try:
+        channel.subscribe(dict(parse_qsl(urlsplit(path).query)))
+    except ValueError as e:
+        channel.reply(json.dumps({"type": "error", "message": str(e)}))
+    scale.clients[websocket] = channel
     client_addr = websocket.remote_address
     print(f"📱 Client connected: {client_addr}")
     
@@ -102,30 +236,73 @@ async def handler(websocket):
                     scale.calibrate(data.get("weight", 100))
                 elif cmd == "set_weight":
                     scale.set_weight(data.get("weight", 0))
+                elif cmd == "subscribe":
+                    channel.subscribe(data)
                     
                 # Send acknowledgment
-                await websocket.send(scale.to_json())
+                channel.reply(scale.to_json())
                 
             except json.JSONDecodeError:
                 pass
+            except (TypeError, ValueError) as e:
+                channel.reply(json.dumps({"type": "error", "message": str(e)}))
                 
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
-        scale.clients.discard(websocket)
-        print(f"📱 Client disconnected: {client_addr}")
+        scale.clients.pop(websocket, None)
+        channel.close()
+        print(f"📱 Client disconnected: {client_addr} ({channel.stats()})")
 
 
-async def broadcast_weight():
-    """Send weight updates to all connected clients."""
+async def broadcast_weight(interval: float = 0.1):
+    """
+    Offer a weight update to every connected client at a fixed 10 Hz.
+    Periodic clients get every tick; on-change clients only what passes their filter.
+    """
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
     while True:
         if scale.clients:
-            message = scale.to_json()
-            await asyncio.gather(
-                *[client.send(message) for client in scale.clients],
-                return_exceptions=True
-            )
-        await asyncio.sleep(0.1)  # 10 Hz updates
+            reading = scale.reading()
+            message = scale.to_json()   # Encoded once per tick
+            now = loop.time()
+            for channel in list(scale.clients.values()):
+                channel.offer(reading, message, now)
+        tick_stats["ticks"] += 1
+
+        next_tick += interval
+        delay = next_tick - loop.time()
+        if delay < 0:
+            tick_stats["max_late_ms"] = max(tick_stats["max_late_ms"], -delay * 1000)
+            next_tick = loop.time()
+            delay = 0
+        await asyncio.sleep(delay)
+
+
+def print_client_stats():
+    """Print per-client send statistics."""
+    print(f"📊 {len(scale.clients)} clients, {tick_stats['ticks']} ticks, "
+          f"max tick lateness {tick_stats['max_late_ms']:.1f} ms")
+    for websocket, channel in list(scale.clients.items()):
+        print(f"   {websocket.remote_address}: {channel.stats()}")
+
+
+def disconnect_clients(seconds: float):
+    """Drop every client and refuse new connections for `seconds` of scenario time."""
+    global offline_until
+    speed = scenario_runner.clock.speed if scenario_runner else 1.0
+    real_seconds = seconds / speed if speed > 0 else 0.0
+    offline_until = asyncio.get_running_loop().time() + real_seconds
+    print(f"📴 Disconnecting {len(scale.clients)} clients for {seconds:g}s")
+    for websocket in list(scale.clients):
+        asyncio.create_task(websocket.close(1001, "scale disconnected"))
+
+
+def request_shutdown():
+    """Stop the emulator; safe to call from the console thread."""
+    loop, event = shutdown_event
+    loop.call_soon_threadsafe(event.set)
 
 
 def input_thread():
@@ -141,6 +318,7 @@ def input_thread():
 ║    t          - Tare (zero)                          ║
 ║    b <level>  - Set battery (e.g., b 75)             ║
 ║    s          - Toggle stability                     ║
+║    c          - Client send stats                    ║
 ║    q          - Quit                                 ║
 ╚══════════════════════════════════════════════════════╝
 """)
@@ -156,8 +334,8 @@ def input_thread():
             
             if cmd == 'q':
                 print("\n👋 Shutting down...")
-                import os
-                os._exit(0)
+                request_shutdown()
+                break
             elif cmd == 'w' and len(parts) > 1:
                 try:
                     weight = float(parts[1])
@@ -176,8 +354,10 @@ def input_thread():
             elif cmd == 's':
                 scale.is_stable = not scale.is_stable
                 print(f"📊 Stability: {'Stable' if scale.is_stable else 'Unstable'}")
+            elif cmd == 'c':
+                print_client_stats()
             else:
-                print("❓ Commands: w <grams>, t, b <level>, s, q")
+                print("❓ Commands: w <grams>, t, b <level>, s, c, q")
                 
         except EOFError:
             break
@@ -187,14 +367,63 @@ def input_thread():
 
 async def main():
     """Main entry point."""
+    global shutdown_event, scenario_runner
+    parser = argparse.ArgumentParser(description="BLE scale emulator (WebSocket mode)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", help="Scenario file (JSON, or YAML with PyYAML) to run at startup")
+    parser.add_argument("--speed", type=float, help="Override the scenario speed (0 = as fast as possible)")
+    parser.add_argument("--control-host", default="127.0.0.1")
+    parser.add_argument("--control-port", type=int, default=8766, help="HTTP control API port")
+    parser.add_argument("--control-ws-port", type=int, default=8767, help="WebSocket control API port")
+    parser.add_argument("--no-control", action="store_true", help="Disable the control API")
+    parser.add_argument("--no-console", action="store_true", help="Do not read commands from stdin")
+    parser.add_argument("--exit-on-end", action="store_true", help="Shut down when the scenario finishes")
+    args = parser.parse_args()
+
+    stop = asyncio.Event()
+    shutdown_event = (asyncio.get_running_loop(), stop)
+    scenario_runner = ScenarioRunner(ScaleTarget(scale, disconnect_clients), on_shutdown=stop.set)
+    if args.scenario:
+        try:
+            scenario = load_scenario(args.scenario)
+        except (OSError, ScenarioError, ValueError) as e:
+            print(f"❌ Cannot load scenario: {e}")
+            return
+        if args.speed is not None:
+            scenario["speed"] = args.speed
+        scenario_runner.load(scenario)
+
+    control = None
+    if not args.no_control:
+        control = ControlServer(scenario_runner, args.control_host, args.control_port, args.control_ws_port)
+        await control.start()
+
     # Start input handler in background thread
-    threading.Thread(target=input_thread, daemon=True).start()
-    
+    if not args.no_console:
+        threading.Thread(target=input_thread, daemon=True).start()
+
     # Start WebSocket server
-    print("🚀 Starting WebSocket server on ws://localhost:8765")
-    
-    async with websockets.serve(handler, "0.0.0.0", 8765):
-        await broadcast_weight()
+    print(f"🚀 Starting WebSocket server on ws://localhost:{args.port}")
+
+    async with websockets.serve(handler, "0.0.0.0", args.port):
+        broadcaster = asyncio.create_task(broadcast_weight())
+        if args.scenario:
+            scenario_runner.start()
+            print(f"🎬 Running scenario '{scenario_runner.scenario['name']}' at {scenario_runner.clock.speed:g}x")
+        waiters = [asyncio.create_task(stop.wait())]
+        if args.exit_on_end and scenario_runner.task:
+            waiters.append(scenario_runner.task)
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+
+        scenario_runner.stop_task()
+        broadcaster.cancel()
+        for task in waiters:
+            task.cancel()
+        for websocket in list(scale.clients):
+            await websocket.close(1001, "emulator shutting down")
+    if control:
+        await control.stop()
+    print("👋 Bye!")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+"""
+On-change notification filter shared by the emulators.
+
+In on-change mode a reading is sent only when the weight moves beyond a
+deadband from the last reading sent, when stability, battery or error
+changes, or when the heartbeat interval passes with nothing to report.
+An idle scale then costs one frame per heartbeat instead of ten per second.
+"""
+
+from scale_protocol import DEFAULT_DEADBAND, DEFAULT_HEARTBEAT
+
+
+class ChangeFilter:
+    """Decides, per subscriber, whether a reading is worth sending."""
+
+    def __init__(self, deadband: float = DEFAULT_DEADBAND, heartbeat: float = DEFAULT_HEARTBEAT):
+        self.deadband = max(0.0, float(deadband))
+        self.heartbeat = max(0.1, float(heartbeat))
+        self.last = None            # (weight, stable, battery, error) last sent
+        self.last_sent_at = None
+        self.sent = 0
+        self.suppressed = 0
+
+    def should_send(self, reading: tuple, now: float) -> bool:
+        """`reading` is (weight, stable, battery, error); `now` in seconds."""
+        last = self.last
+        if (
+            last is None
+            or abs(reading[0] - last[0]) > self.deadband
+            or reading[1:] != last[1:]
+            or now - self.last_sent_at >= self.heartbeat
+        ):
+            self.last = reading
+            self.last_sent_at = now
+            self.sent += 1
+            return True
+        self.suppressed += 1
+        return False
+
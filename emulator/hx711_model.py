@@ -0,0 +1,245 @@
+"""
+HX711 load cell signal model, vectorized over many scales.
+
+Reproduces what firmware/src/hx711_driver.h sees and does, for N scales at
+once with NumPy:
+
+    load cell   settling transient after a load is placed (damped ringing),
+                temperature drift of zero and span
+    HX711       Gaussian noise, occasional spikes, 24-bit quantization
+    firmware    get_units() with offset and calibration factor, clamping to
+                MIN/MAX_WEIGHT_G (overload error), Kalman filter (KALMAN_Q,
+                KALMAN_R), moving average (MOVING_AVG_SIZE) and stability
+                detection (STABILITY_THRESHOLD_G over STABILITY_SAMPLES,
+                held for 200 ms)
+
+All randomness comes from one seeded Generator, so the same seed and the
+same sequence of calls give identical samples.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+# firmware/src/config.h
+DEFAULT_CALIBRATION_FACTOR = 420.0      # Counts per gram
+KALMAN_Q = 0.01
+KALMAN_R = 0.1
+MOVING_AVG_SIZE = 10
+STABILITY_THRESHOLD_G = 0.5
+STABILITY_SAMPLES = 10
+STABILITY_HOLD_MS = 200                 # hx711_driver.h updateStability()
+MAX_WEIGHT_G = 5000.0
+MIN_WEIGHT_G = -50.0
+ERROR_NONE = 0
+ERROR_OVERLOAD = 2
+
+ADC_MIN = -(1 << 23)
+ADC_MAX = (1 << 23) - 1
+
+
+@dataclass
+class SampleBlock:
+    """One block of samples: arrays are (scales, samples) unless noted."""
+
+    t_ms: np.ndarray        # (samples,) sample times
+    raw: np.ndarray         # ADC counts (int32)
+    weight: np.ndarray      # Filtered grams (float32), as the firmware reports
+    stable: np.ndarray      # bool
+    error: np.ndarray       # uint8 error codes
+
+
+class HX711SignalModel:
+    """
+    N simulated load cells and their firmware filter state.
+
+    Loads change through set_load(); run() produces the next block of
+    samples for every scale at `sample_rate` Hz.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        seed: int = 0,
+        sample_rate: float = 80.0,
+        calibration_factor: float = DEFAULT_CALIBRATION_FACTOR,
+        noise_counts: float = 40.0,
+        spike_probability: float = 0.002,
+        spike_counts: float = 8000.0,
+        zero_drift_counts_per_c: float = 15.0,
+        span_drift_ppm_per_c: float = 20.0,
+        temperature_swing_c: float = 3.0,
+        temperature_period_s: float = 3600.0,
+        settle_seconds: float = 0.15,
+        ring_hz: tuple = (6.0, 12.0),
+    ):
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        self.sample_rate = sample_rate
+        self.dt_ms = 1000.0 / sample_rate
+        self.noise_counts = noise_counts
+        self.spike_probability = spike_probability
+        self.spike_counts = spike_counts
+        self.zero_drift = zero_drift_counts_per_c
+        self.span_drift = span_drift_ppm_per_c * 1e-6
+        self.temperature_swing = temperature_swing_c
+        self.temperature_period_ms = temperature_period_s * 1000.0
+        self.settle_ms = settle_seconds * 1000.0
+        self.samples_taken = 0
+        self.clock_ms = 0.0
+
+        rng = self.rng
+        # Load cell and HX711 (per-unit spread around nominal)
+        self.true_factor = calibration_factor * rng.normal(1.0, 0.01, count)
+        self.zero_counts = rng.normal(0.0, 2000.0, count)
+        self.temperature_phase = rng.uniform(0.0, 2 * np.pi, count)
+        self.ring_omega = 2 * np.pi * rng.uniform(*ring_hz, count) / 1000.0   # rad/ms
+
+        # Applied load and the transient towards it
+        self.target = np.zeros(count)
+        self.settle_from = np.zeros(count)
+        self.settle_start_ms = np.full(count, -1e12)
+
+        # Firmware state (hx711_driver.h)
+        self.offset = self.zero_counts.copy()
+        self.factor = np.full(count, float(calibration_factor))
+        self.kalman_x = np.zeros(count)
+        self.kalman_p = np.ones(count)
+        self.avg_buffer = np.zeros((count, MOVING_AVG_SIZE))
+        self.avg_sum = np.zeros(count)
+        self.avg_count = np.zeros(count, dtype=np.int64)
+        self.avg_index = 0
+        self.history = np.zeros((count, STABILITY_SAMPLES))
+        self.history_index = 0
+        self.stable_since = np.full(count, -1.0)
+        self.weight = np.zeros(count)
+        self.stable = np.zeros(count, dtype=bool)
+        self.error = np.zeros(count, dtype=np.uint8)
+
+    @property
+    def now_ms(self) -> float:
+        return self.samples_taken * self.dt_ms
+
+    def set_load(self, indices, grams):
+        """Place (or remove) loads; each scale rings towards its new load."""
+        indices = np.asarray(indices, dtype=np.intp)
+        now = self.now_ms
+        self.settle_from[indices] = self._applied(now)[indices]
+        self.settle_start_ms[indices] = now
+        self.target[indices] = grams
+
+    def _applied(self, t_ms):
+        """Force on each cell (grams) at time `t_ms`, including the transient."""
+        elapsed = t_ms - self.settle_start_ms
+        decay = np.exp(-np.minimum(elapsed / self.settle_ms, 50.0))
+        return self.target + (self.settle_from - self.target) * decay * np.cos(self.ring_omega * elapsed)
+
+    def _raw_counts(self, t_ms) -> np.ndarray:
+        """Quantized ADC readings for every scale at times `t_ms` -> (scales, samples)."""
+        t = t_ms[None, :]
+        elapsed = t - self.settle_start_ms[:, None]
+        decay = np.exp(-np.minimum(elapsed / self.settle_ms, 50.0))
+        load = self.target[:, None] + (self.settle_from - self.target)[:, None] * decay * np.cos(
+            self.ring_omega[:, None] * elapsed
+        )
+        temperature = self.temperature_swing * np.sin(
+            2 * np.pi * t / self.temperature_period_ms + self.temperature_phase[:, None]
+        )
+        counts = (
+            self.zero_counts[:, None]
+            + self.zero_drift * temperature
+            + load * self.true_factor[:, None] * (1.0 + self.span_drift * temperature)
+            + self.rng.normal(0.0, self.noise_counts, load.shape)
+        )
+        spikes = self.rng.random(load.shape) < self.spike_probability
+        if spikes.any():
+            counts[spikes] += self.rng.choice((-1.0, 1.0), spikes.sum()) * self.rng.uniform(
+                0.25, 1.0, spikes.sum()
+            ) * self.spike_counts
+        return np.clip(np.rint(counts), ADC_MIN, ADC_MAX).astype(np.int32)
+
+    def run(self, samples: int) -> SampleBlock:
+        """Produce the next `samples` readings for every scale."""
+        t_ms = (self.samples_taken + np.arange(samples)) * self.dt_ms
+        raw = self._raw_counts(t_ms)
+        weight = np.empty((self.count, samples), dtype=np.float32)
+        stable = np.empty((self.count, samples), dtype=bool)
+        error = np.empty((self.count, samples), dtype=np.uint8)
+
+        for n in range(samples):
+            weight[:, n], stable[:, n], error[:, n] = self._firmware_step(raw[:, n], t_ms[n])
+
+        self.samples_taken += samples
+        return SampleBlock(t_ms=t_ms, raw=raw, weight=weight, stable=stable, error=error)
+
+    def advance(self, seconds: float) -> Optional[SampleBlock]:
+        """Run the samples that fall within the next `seconds` of model time."""
+        self.clock_ms = max(self.clock_ms, self.now_ms) + seconds * 1000.0
+        samples = int(self.clock_ms / self.dt_ms + 1e-9) - self.samples_taken
+        return self.run(samples) if samples > 0 else None
+
+    def _firmware_step(self, raw: np.ndarray, t_ms: float):
+        """HX711Driver::readWeight() for every scale on one sample."""
+        units = (raw - self.offset) / self.factor
+
+        overload = units > MAX_WEIGHT_G
+        under = ~overload & (units < MIN_WEIGHT_G)
+        units = np.where(overload, MAX_WEIGHT_G, np.where(under, 0.0, units))
+        # Below the minimum the firmware leaves errorCode as it was
+        self.error = np.where(overload, ERROR_OVERLOAD, np.where(under, self.error, ERROR_NONE)).astype(np.uint8)
+
+        # KalmanFilter::update
+        p = self.kalman_p + KALMAN_Q
+        k = p / (p + KALMAN_R)
+        self.kalman_x += k * (units - self.kalman_x)
+        self.kalman_p = (1.0 - k) * p
+
+        # MovingAverage<MOVING_AVG_SIZE>::add
+        slot = self.avg_index
+        self.avg_sum += self.kalman_x - self.avg_buffer[:, slot]
+        self.avg_buffer[:, slot] = self.kalman_x
+        self.avg_index = (slot + 1) % MOVING_AVG_SIZE
+        np.minimum(self.avg_count + 1, MOVING_AVG_SIZE, out=self.avg_count)
+        smooth = self.avg_sum / self.avg_count
+
+        # updateStability
+        self.history[:, self.history_index] = smooth
+        self.history_index = (self.history_index + 1) % STABILITY_SAMPLES
+        steady = np.ptp(self.history, axis=1) <= STABILITY_THRESHOLD_G
+        starting = steady & ~self.stable & (self.stable_since < 0)
+        self.stable_since[starting] = t_ms
+        became = steady & ~self.stable & ~starting & (t_ms - self.stable_since > STABILITY_HOLD_MS)
+        self.stable |= became
+        self.stable &= steady
+        self.stable_since[~steady] = -1.0
+
+        self.weight = smooth
+        return smooth, self.stable, self.error
+
+    def tare(self, indices):
+        """HX711Driver::tare(): new offset from 10 averaged readings, filters reset."""
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        t_ms = self.now_ms + np.arange(10) * self.dt_ms
+        self.offset[indices] = self._raw_counts(t_ms)[indices].mean(axis=1)
+        self._reset_filters(indices, 0.0)
+        self.history[indices] = 0.0
+        self.stable[indices] = False
+        self.stable_since[indices] = -1.0
+
+    def calibrate(self, indices, known_weight: float):
+        """HX711Driver::calibrate(): factor from 20 averaged readings of a known mass."""
+        if known_weight <= 0:
+            return
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        t_ms = self.now_ms + np.arange(20) * self.dt_ms
+        self.factor[indices] = (self._raw_counts(t_ms)[indices].mean(axis=1) - self.offset[indices]) / known_weight
+        self._reset_filters(indices, known_weight)
+
+    def _reset_filters(self, indices, value: float):
+        self.kalman_x[indices] = value
+        self.kalman_p[indices] = 1.0
+        self.avg_buffer[indices] = 0.0
+        self.avg_sum[indices] = 0.0
+        self.avg_count[indices] = 0
+        self.weight[indices] = value
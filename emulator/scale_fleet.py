@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+BLE Scale Emulator (Fleet Mode)
+Simulates a whole market of scales in one asyncio process for capacity planning.
+
+Every scale has its own MAC, weight trajectory (load placed, settles, removed),
+battery drain and report rate. Per-scale state lives in NumPy arrays and the
+whole fleet advances in one vectorized tick, so a single core can drive 10k+
+scales.
+
+Usage:
+    python scale_fleet.py --scales 5000 --sink http --url http://localhost:8000
+    python scale_fleet.py --scales 500 --sink ws --port 8765
+    python scale_fleet.py --scales 20000 --sink none --duration 30
+    python scale_fleet.py --scales 2000 --signal hx711 --sink ws
+    python scale_fleet.py --scales 1000 --record capture.scl --duration 60
+
+Sinks:
+    http  - POST each reading to the backend's /measurements endpoint
+    ws    - serve each scale at ws://<host>:<port>/scales/<index or MAC>
+    none  - drive the simulation only (measures tick cost)
+
+Signals:
+    ideal - loads settle on a smooth exponential, readings are exact
+    hx711 - readings come from the HX711 model (noise, spikes, drift, ringing)
+            filtered like the firmware does, stability included
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from typing import Optional, Sequence
+
+import numpy as np
+
+from hx711_model import HX711SignalModel
+
+
+def fleet_mac(index: int) -> str:
+    """Locally administered MAC for fleet scale `index`."""
+    return "02:FE:%02X:%02X:%02X:%02X" % tuple((index >> shift) & 0xFF for shift in (24, 16, 8, 0))
+
+
+class ScaleFleet:
+    """State of N simulated scales, held column-wise in NumPy arrays."""
+
+    SETTLE_SECONDS = 0.3        # Time constant of the load settling curve
+    STABLE_BAND = 0.5           # Grams from target that count as stable
+
+    def __init__(
+        self,
+        count: int,
+        seed: int = 0,
+        rate_hz: tuple = (1.0, 10.0),
+        idle_seconds: float = 8.0,
+        loaded_seconds: float = 4.0,
+        drain_per_hour: tuple = (0.5, 3.0),
+        signal: Optional[HX711SignalModel] = None,
+    ):
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        self.idle_seconds = idle_seconds
+        self.loaded_seconds = loaded_seconds
+        self.now = 0.0
+        self.signal = signal        # Optional HX711SignalModel for realistic readings
+
+        self.macs = [fleet_mac(i) for i in range(count)]
+        self.mac_index = {mac: i for i, mac in enumerate(self.macs)}
+        self.mac_raw = np.array([bytes.fromhex(mac.replace(":", "")) for mac in self.macs], dtype="S6")
+
+        self.weight = np.zeros(count)
+        self.target = np.zeros(count)
+        self.tare_offset = np.zeros(count)
+        self.battery = self.rng.uniform(40.0, 100.0, count)
+        self.drain = self.rng.uniform(*drain_per_hour, count) / 3600.0
+        self.interval = 1.0 / self.rng.uniform(*rate_hz, count)
+        self.next_report = self.rng.uniform(0.0, self.interval)
+        self.next_change = self.rng.exponential(idle_seconds, count)
+
+    def tick(self, now: float) -> np.ndarray:
+        """Advance every scale to `now` (seconds) and return indices due to report."""
+        dt = now - self.now
+        if dt <= 0:
+            return np.empty(0, dtype=np.intp)
+        self.now = now
+
+        # Place or remove loads on scales whose idle/loaded period ended
+        flip = np.flatnonzero(self.next_change <= now)
+        if flip.size:
+            loaded = self.target[flip] > 0
+            self.target[flip] = np.where(
+                loaded, 0.0, np.round(self.rng.lognormal(6.0, 1.0, flip.size), 1)
+            )
+            self.next_change[flip] = now + self.rng.exponential(
+                np.where(loaded, self.idle_seconds, self.loaded_seconds)
+            )
+            if self.signal is not None:
+                self.signal.set_load(flip, self.target[flip])
+
+        if self.signal is not None:
+            self.signal.advance(dt)
+        else:
+            self.weight += (self.target - self.weight) * (1.0 - math.exp(-dt / self.SETTLE_SECONDS))
+        self.battery -= self.drain * dt
+        np.maximum(self.battery, 0.0, out=self.battery)
+
+        due = np.flatnonzero(self.next_report <= now)
+        # Reschedule from the slot that fired, but never into the past after a stall
+        self.next_report[due] = np.maximum(self.next_report[due] + self.interval[due], now)
+        return due
+
+    def tare(self, index: int):
+        if self.signal is not None:
+            self.signal.tare(index)
+        else:
+            self.tare_offset[index] = self.weight[index]
+
+    def snapshot(self, indices: np.ndarray) -> tuple:
+        """(display weight, stable, battery, error) arrays for `indices`."""
+        if self.signal is not None:
+            display = np.round(self.signal.weight[indices], 1)
+            stable = self.signal.stable[indices]
+            error = self.signal.error[indices]
+        else:
+            display = np.round(self.weight[indices] - self.tare_offset[indices], 1)
+            stable = np.abs(self.weight[indices] - self.target[indices]) < self.STABLE_BAND
+            error = np.zeros(indices.size, dtype=np.uint8)
+        return display, stable, self.battery[indices].astype(np.int64), error
+
+    def readings(self, indices: np.ndarray):
+        """Yield (index, mac, display weight, stable, battery, error) for `indices`."""
+        display, stable, battery, error = self.snapshot(indices)
+        macs = self.macs
+        for index, weight, is_stable, level, code in zip(
+            indices.tolist(), display.tolist(), stable.tolist(), battery.tolist(), error.tolist()
+        ):
+            yield index, macs[index], weight, is_stable, level, code
+
+
+class NullSink:
+    """Discard readings; used to measure the simulation on its own."""
+
+    def __init__(self):
+        self.stats = Counter()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, fleet: ScaleFleet, due: np.ndarray):
+        self.stats["sent"] += due.size
+
+
+class HttpSink:
+    """
+    POST readings to the backend's /measurements endpoint.
+
+    Readings go through a bounded queue drained by a fixed pool of workers,
+    so a slow backend drops readings (counted) instead of growing memory.
+    The backend rejects readings from unregistered devices, so `macs` are
+    registered through POST /devices on start.
+    """
+
+    def __init__(self, base_url: str, concurrency: int = 64, queue_size: int = 10_000,
+                 macs: Sequence[str] = ()):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.macs = list(macs)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = Counter()
+        self.client = None
+        self.workers = []
+
+    async def start(self):
+        import httpx
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=self.concurrency),
+            timeout=10.0,
+        )
+        await self.register(self.macs)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def register(self, macs: Sequence[str]):
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def register_one(mac: str):
+            async with slots:
+                response = await self.client.post("/devices", json={"mac_address": mac, "name": f"Fleet scale {mac}"})
+            if response.status_code < 300:
+                self.stats["registered"] += 1
+            elif response.status_code != 400:     # 400: already registered
+                response.raise_for_status()
+
+        await asyncio.gather(*(register_one(mac) for mac in macs))
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.client:
+            await self.client.aclose()
+
+    def publish(self, fleet: ScaleFleet, due: np.ndarray):
+        for _, mac, weight, stable, battery, _ in fleet.readings(due):
+            self.enqueue({
+                "device_mac": mac,
+                "weight": weight,
+                "unit": "g",
+                "is_stable": stable,
+                "battery_level": battery,
+            })
+
+    def enqueue(self, body: dict):
+        """Queue one /measurements body; counted as dropped if the queue is full."""
+        try:
+            self.queue.put_nowait(body)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    async def _worker(self):
+        while True:
+            body = await self.queue.get()
+            try:
+                response = await self.client.post("/measurements", json=body)
+                if response.status_code < 300:
+                    self.stats["sent"] += 1
+                elif response.status_code == 404:
+                    self.stats["unregistered"] += 1
+                elif response.status_code == 429:
+                    self.stats["throttled"] += 1
+                elif response.status_code == 503:
+                    self.stats["shed"] += 1
+                else:
+                    self.stats[f"http_{response.status_code}"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+            finally:
+                self.queue.task_done()
+
+
+class WebSocketSink:
+    """
+    Serve each scale on its own WebSocket path: /scales/<index> or /scales/<MAC>.
+
+    Clients receive the same JSON packet as ble_emulator_tcp.py and may send
+    {"command": "tare"}. Only scales with subscribers are encoded; a client
+    still busy with the previous frame skips the new one (counted as dropped).
+    """
+
+    def __init__(self, fleet: ScaleFleet, host: str = "0.0.0.0", port: int = 8765):
+        self.fleet = fleet
+        self.host = host
+        self.port = port
+        self.subscribers = {}       # scale index -> set of websockets
+        self.busy = set()
+        self.stats = Counter()
+        self.server = None
+
+    async def start(self):
+        import websockets
+
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        print(f"🚀 Fleet WebSocket server on ws://{self.host}:{self.port}/scales/<index|mac>")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def _resolve(self, path: str):
+        parts = path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "scales":
+            return None
+        key = parts[1]
+        if key.isdigit():
+            index = int(key)
+            return index if index < self.fleet.count else None
+        return self.fleet.mac_index.get(key.upper())
+
+    async def _handler(self, websocket):
+        request = getattr(websocket, "request", None)
+        path = request.path if request is not None else websocket.path
+        index = self._resolve(path)
+        if index is None:
+            await websocket.close(code=4404, reason="Unknown scale")
+            return
+
+        self.subscribers.setdefault(index, set()).add(websocket)
+        try:
+            async for message in websocket:
+                try:
+                    if json.loads(message).get("command") == "tare":
+                        self.fleet.tare(index)
+                except (json.JSONDecodeError, AttributeError):
+                    pass
+        except Exception:
+            pass
+        finally:
+            clients = self.subscribers.get(index)
+            if clients is not None:
+                clients.discard(websocket)
+                if not clients:
+                    del self.subscribers[index]
+
+    def publish(self, fleet: ScaleFleet, due: np.ndarray):
+        if not self.subscribers:
+            return
+        watched = np.fromiter(self.subscribers, dtype=np.intp, count=len(self.subscribers))
+        for index, mac, weight, stable, battery, error in fleet.readings(np.intersect1d(due, watched)):
+            message = json.dumps({
+                "type": "weight",
+                "mac": mac,
+                "weight": weight,
+                "unit": "g",
+                "stable": stable,
+                "battery": battery,
+                "error": error,
+            })
+            for websocket in self.subscribers[index]:
+                if websocket in self.busy:
+                    self.stats["dropped"] += 1
+                    continue
+                self.busy.add(websocket)
+                task = asyncio.ensure_future(websocket.send(message))
+                task.add_done_callback(lambda t, ws=websocket: self._sent(t, ws))
+
+    def _sent(self, task: asyncio.Future, websocket):
+        self.busy.discard(websocket)
+        if task.cancelled() or task.exception() is not None:
+            self.stats["failed"] += 1
+        else:
+            self.stats["sent"] += 1
+
+
+async def run_fleet(fleet: ScaleFleet, sink, tick: float = 0.05, duration: float = None,
+                    report_every: float = 5.0, recorder=None):
+    """
+    Tick the fleet at a fixed rate, publishing due readings, until `duration`
+    elapses. Readings are also appended to `recorder` (a StreamRecorder) if given.
+    """
+    loop = asyncio.get_running_loop()
+    await sink.start()
+    start = loop.time()
+    next_tick = start
+    next_report = report_every
+    produced = 0
+    tick_costs = []
+    try:
+        while True:
+            now = loop.time() - start
+            if duration is not None and now >= duration:
+                break
+
+            t0 = time.perf_counter()
+            due = fleet.tick(now)
+            sink.publish(fleet, due)
+            if recorder is not None and due.size:
+                recorder.append_many(fleet.mac_raw[due], *fleet.snapshot(due))
+            tick_costs.append(time.perf_counter() - t0)
+            produced += due.size
+
+            if now >= next_report:
+                tick_costs.sort()
+                p99 = tick_costs[min(len(tick_costs) - 1, int(len(tick_costs) * 0.99))]
+                print(f"📊 t={now:6.1f}s  {produced / report_every:9.0f} readings/s  "
+                      f"tick p99 {p99 * 1000:6.2f} ms  {dict(sink.stats)}")
+                produced = 0
+                tick_costs.clear()
+                next_report += report_every
+
+            next_tick += tick
+            delay = next_tick - loop.time()
+            if delay < 0:
+                next_tick = loop.time()     # Fell behind: don't burst to catch up
+                delay = 0
+            await asyncio.sleep(delay)
+    finally:
+        await sink.stop()
+        if recorder is not None:
+            recorder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of BLE scales")
+    parser.add_argument("--scales", type=int, default=1000)
+    parser.add_argument("--rate", default="1,10", help="Report rate range in Hz (min,max)")
+    parser.add_argument("--sink", choices=("http", "ws", "none"), default="none")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend base URL (http sink)")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address (ws sink)")
+    parser.add_argument("--port", type=int, default=8765, help="Port (ws sink)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Parallel requests (http sink)")
+    parser.add_argument("--tick", type=float, default=0.05, help="Simulation tick in seconds")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after N seconds")
+    parser.add_argument("--signal", choices=("ideal", "hx711"), default="ideal")
+    parser.add_argument("--sample-rate", type=float, default=10.0, help="HX711 sample rate in Hz (hx711 signal)")
+    parser.add_argument("--record", default=None, help="Append readings to this stream log")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    low, high = (float(v) for v in args.rate.split(","))
+    signal = None
+    if args.signal == "hx711":
+        signal = HX711SignalModel(args.scales, seed=args.seed + 1, sample_rate=args.sample_rate)
+    fleet = ScaleFleet(args.scales, seed=args.seed, rate_hz=(low, high), signal=signal)
+    if args.sink == "http":
+        sink = HttpSink(args.url, concurrency=args.concurrency, macs=fleet.macs)
+    elif args.sink == "ws":
+        sink = WebSocketSink(fleet, args.host, args.port)
+    else:
+        sink = NullSink()
+
+    recorder = None
+    if args.record:
+        from stream_log import StreamRecorder
+
+        recorder = StreamRecorder(args.record)
+
+    print(f"🚀 Simulating {args.scales} scales at {low:g}-{high:g} Hz ({args.signal} signal, {args.sink} sink)")
+    asyncio.run(run_fleet(fleet, sink, tick=args.tick, duration=args.duration, recorder=recorder))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n👋 Bye!")
@@ -0,0 +1,166 @@
+"""
+Scale wire formats shared by the emulators and tools.
+
+Nothing here touches Bluetooth, so packets can be built and checked on any
+machine.
+
+Weight packet (one reading, 12 bytes, as sent by the firmware):
+    '<4sfBBBB'  b'SCLE', weight (g, float32), unit, stable, battery, error
+
+Multi-sample packet (high-rate mode, sized to the negotiated MTU):
+    '<4sIBBBB'  b'SCLM', first sample time (ms, uint32, wraps), count,
+                unit, battery, error
+    count x '<HfB'  delta from previous sample (ms), weight (g), stable
+
+Settings characteristic:
+    '<BfHBH'    mode, deadband (g), heartbeat (ms), sample rate (Hz), MTU
+    Reads append a bitmask of the modes the device supports.
+"""
+
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+WEIGHT_PACKET = struct.Struct("<4sfBBBB")
+WEIGHT_MAGIC = b"SCLE"
+
+MULTI_HEADER = struct.Struct("<4sIBBBB")
+MULTI_SAMPLE = struct.Struct("<HfB")
+MULTI_MAGIC = b"SCLM"
+MAX_DELTA_MS = 0xFFFF
+
+ATT_OVERHEAD = 3            # Opcode + handle in every notification
+DEFAULT_MTU = 23            # BLE minimum until the central negotiates more
+
+MODE_PERIODIC = 0
+MODE_ON_CHANGE = 1
+MODE_HIGH_RATE = 2
+SUPPORTED_MODES = (1 << MODE_PERIODIC) | (1 << MODE_ON_CHANGE) | (1 << MODE_HIGH_RATE)
+
+DEFAULT_DEADBAND = 0.5      # Grams
+DEFAULT_HEARTBEAT = 5.0     # Seconds
+DEFAULT_SAMPLE_RATE = 80    # Hz (HX711 at RATE pin high)
+
+SETTINGS = struct.Struct("<BfHBH")
+
+Sample = Tuple[int, float, bool]    # (time ms, weight g, stable)
+
+
+def pack_weight(weight: float, unit: int, stable: bool, battery: int, error: int) -> bytes:
+    return WEIGHT_PACKET.pack(WEIGHT_MAGIC, weight, unit, 1 if stable else 0, battery, error)
+
+
+def unpack_weight(packet: bytes) -> dict:
+    if len(packet) != WEIGHT_PACKET.size:
+        raise ValueError(f"Weight packet is {len(packet)} bytes, not {WEIGHT_PACKET.size}")
+    magic, weight, unit, stable, battery, error = WEIGHT_PACKET.unpack(packet)
+    if magic != WEIGHT_MAGIC:
+        raise ValueError(f"Not a weight packet: {magic!r}")
+    return {"weight": weight, "unit": unit, "stable": bool(stable), "battery": battery, "error": error}
+
+
+def samples_per_notification(mtu: int) -> int:
+    """How many samples fit in one notification at this ATT MTU (at least 1)."""
+    return max(1, (mtu - ATT_OVERHEAD - MULTI_HEADER.size) // MULTI_SAMPLE.size)
+
+
+def pack_samples(samples: List[Sample], unit: int, battery: int, error: int) -> bytes:
+    """
+    Pack consecutive samples into one notification. Gaps between samples
+    must fit in 16 bits of milliseconds; SampleBatcher guarantees that.
+    """
+    if not samples or len(samples) > 255:
+        raise ValueError("A packet holds 1 to 255 samples")
+    parts = [MULTI_HEADER.pack(MULTI_MAGIC, samples[0][0] & 0xFFFFFFFF, len(samples), unit, battery, error)]
+    previous = samples[0][0]
+    for t_ms, weight, stable in samples:
+        delta = t_ms - previous
+        if not 0 <= delta <= MAX_DELTA_MS:
+            raise ValueError(f"Sample gap of {delta} ms does not fit in a packet")
+        parts.append(MULTI_SAMPLE.pack(delta, weight, 1 if stable else 0))
+        previous = t_ms
+    return b"".join(parts)
+
+
+def unpack_samples(packet: bytes) -> dict:
+    """Inverse of pack_samples; sample times are absolute (ms, modulo 2**32)."""
+    if len(packet) < MULTI_HEADER.size:
+        raise ValueError("Packet is shorter than a multi-sample header")
+    magic, t_ms, count, unit, battery, error = MULTI_HEADER.unpack_from(packet)
+    if magic != MULTI_MAGIC:
+        raise ValueError(f"Not a multi-sample packet: {magic!r}")
+    if len(packet) != MULTI_HEADER.size + count * MULTI_SAMPLE.size:
+        raise ValueError("Packet length does not match its sample count")
+    samples = []
+    for delta, weight, stable in MULTI_SAMPLE.iter_unpack(packet[MULTI_HEADER.size:]):
+        t_ms = (t_ms + delta) & 0xFFFFFFFF
+        samples.append((t_ms, weight, bool(stable)))
+    return {"unit": unit, "battery": battery, "error": error, "samples": samples}
+
+
+class SampleBatcher:
+    """
+    Buffer samples and emit a packet when the notification is full or the
+    oldest buffered sample has waited `max_latency_ms` (default: one
+    period of the 10 Hz periodic mode, so latency is never worse).
+    """
+
+    def __init__(self, mtu: int = DEFAULT_MTU, max_latency_ms: int = 100):
+        self.capacity = min(255, samples_per_notification(mtu))
+        self.max_latency_ms = max_latency_ms
+        self.samples: List[Sample] = []
+
+    def add(self, t_ms: int, weight: float, stable: bool, unit: int, battery: int, error: int) -> List[bytes]:
+        """Buffer one sample; return the packets (0, 1 or 2) that are now ready."""
+        ready = []
+        if self.samples and t_ms - self.samples[-1][0] > MAX_DELTA_MS:
+            ready.append(self.flush(unit, battery, error))
+        self.samples.append((t_ms, weight, stable))
+        if len(self.samples) >= self.capacity:
+            ready.append(self.flush(unit, battery, error))
+        return ready
+
+    def due(self, now_ms: int) -> bool:
+        return bool(self.samples) and now_ms - self.samples[0][0] >= self.max_latency_ms
+
+    def flush(self, unit: int, battery: int, error: int) -> Optional[bytes]:
+        if not self.samples:
+            return None
+        packet = pack_samples(self.samples, unit, battery, error)
+        self.samples = []
+        return packet
+
+
+def pack_settings(
+    mode: int,
+    deadband: float = DEFAULT_DEADBAND,
+    heartbeat: float = DEFAULT_HEARTBEAT,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    mtu: int = DEFAULT_MTU,
+    advertise: bool = False,
+) -> bytes:
+    """Encode notification settings; `advertise` appends the supported-modes mask (reads)."""
+    packet = SETTINGS.pack(mode, deadband, int(round(heartbeat * 1000)), sample_rate, mtu)
+    return packet + bytes([SUPPORTED_MODES]) if advertise else packet
+
+
+def unpack_settings(value: Iterable[int]) -> dict:
+    """
+    Decode a settings write. Shorter writes are accepted: just the mode
+    byte, or mode/deadband/heartbeat; missing fields take defaults.
+    """
+    value = bytes(value)
+    if not value:
+        raise ValueError("Empty settings payload")
+    settings = {
+        "mode": value[0],
+        "deadband": DEFAULT_DEADBAND,
+        "heartbeat": DEFAULT_HEARTBEAT,
+        "sample_rate": DEFAULT_SAMPLE_RATE,
+        "mtu": DEFAULT_MTU,
+    }
+    if len(value) >= 7:
+        _, settings["deadband"], heartbeat_ms = struct.unpack_from("<BfH", value)
+        settings["heartbeat"] = heartbeat_ms / 1000.0
+    if len(value) >= SETTINGS.size:
+        settings["sample_rate"], settings["mtu"] = struct.unpack_from("<BH", value, 7)
+    return settings
@@ -0,0 +1,432 @@
+"""
+Deterministic scenario engine for the emulators.
+
+A scenario is a declarative timeline (JSON, or YAML if PyYAML is installed)
+of events applied to a scale at exact times on a virtual clock, which can
+run faster than real time (or jump straight from event to event):
+
+    {
+      "name": "checkout",
+      "speed": 10,
+      "events": [
+        {"at": 0.0, "action": "tare"},
+        {"at": 1.0, "action": "load", "grams": 523.4},
+        {"at": 1.2, "action": "stable", "stable": false},
+        {"at": 2.0, "action": "stable", "stable": true},
+        {"at": 5.0, "action": "battery", "level": 15},
+        {"at": 6.0, "action": "disconnect", "seconds": 3},
+        {"at": 9.5, "action": "error", "code": 2},
+        {"at": 10.0, "action": "calibrate", "grams": 500},
+        {"at": 12.0, "action": "end"}
+      ]
+    }
+
+Test harnesses drive it through ControlServer: HTTP (GET /status, POST
+/<command> with a JSON body) or WebSocket ({"command": ..., ...} messages).
+Commands: status, load, start, pause, resume, speed, apply, shutdown.
+"""
+
+import asyncio
+import json
+import math
+from typing import Callable, List, Optional
+
+
+class ScenarioError(ValueError):
+    """Raised for an invalid scenario or control command."""
+
+
+def _number(low: float, high: float = math.inf, integer: bool = False):
+    """Field check: a finite number (an int if `integer`) in [low, high]."""
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ScenarioError(f"expected a number, got {value!r}")
+        if integer and value != int(value):
+            raise ScenarioError(f"expected a whole number, got {value!r}")
+        if not low <= value <= high:
+            raise ScenarioError(f"{value!r} is outside {low:g}..{high:g}")
+        return int(value) if integer else float(value)
+    return check
+
+
+def _flag(value):
+    if not isinstance(value, bool):
+        raise ScenarioError(f"expected true or false, got {value!r}")
+    return value
+
+
+_non_negative = _number(0)
+
+ACTIONS = {
+    # action: {required field: check}
+    "load": {"grams": _number(0)},
+    "unload": {},
+    "tare": {},
+    "calibrate": {"grams": _number(0.001)},
+    "battery": {"level": _number(0, 100, integer=True)},
+    "stable": {"stable": _flag},
+    "error": {"code": _number(0, 255, integer=True)},     # One byte in the packet
+    "disconnect": {"seconds": _non_negative},
+    "end": {},
+}
+
+
+def parse_event(raw: dict, at_required: bool = True) -> dict:
+    if not isinstance(raw, dict):
+        raise ScenarioError(f"Event must be an object: {raw!r}")
+    action = raw.get("action")
+    if action not in ACTIONS:
+        raise ScenarioError(f"Unknown action {action!r} (expected one of {', '.join(ACTIONS)})")
+    missing = [field for field in ACTIONS[action] if field not in raw]
+    if missing:
+        raise ScenarioError(f"{action} event is missing {', '.join(missing)}")
+    event = dict(raw)
+    for field, check in ACTIONS[action].items():
+        try:
+            event[field] = check(raw[field])
+        except ScenarioError as e:
+            raise ScenarioError(f"{action} event has an invalid {field}: {e}")
+    if at_required or "at" in raw:
+        try:
+            event["at"] = _non_negative(raw["at"])
+        except (KeyError, ScenarioError):
+            raise ScenarioError(f"{action} event needs an 'at' time of 0 seconds or more")
+    return event
+
+
+def parse_scenario(data: dict) -> dict:
+    """Validate a scenario and return it with events sorted by time (stable order)."""
+    if not isinstance(data, dict) or not isinstance(data.get("events"), list):
+        raise ScenarioError("A scenario needs an 'events' list")
+    events = [parse_event(raw) for raw in data["events"]]
+    events.sort(key=lambda event: event["at"])
+    try:
+        speed = _non_negative(data.get("speed", 1.0))
+    except ScenarioError:
+        raise ScenarioError("speed must be a number >= 0 (0 runs as fast as possible)")
+    return {"name": data.get("name", "scenario"), "speed": speed, "events": events}
+
+
+def load_scenario(path: str) -> dict:
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ScenarioError("YAML scenarios need PyYAML: pip install pyyaml")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ScenarioError(f"{path} is not valid YAML: {e}")
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ScenarioError(f"{path} is not valid JSON: {e}")
+    return parse_scenario(data)
+
+
+class VirtualClock:
+    """
+    Scenario time in seconds. Advances at `speed` x real time; speed 0 jumps
+    straight to whatever time is awaited next. Pausing freezes it.
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.paused = True
+        self._virtual = 0.0
+        self._real = 0.0
+        self._changed = asyncio.Event()
+
+    def _loop_time(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def now(self) -> float:
+        if self.paused or self.speed == 0:
+            return self._virtual
+        return self._virtual + (self._loop_time() - self._real) * self.speed
+
+    def _rebase(self):
+        self._virtual = self.now()
+        self._real = self._loop_time()
+        self._changed.set()
+
+    def set_speed(self, speed: float):
+        self._rebase()
+        self.speed = speed
+
+    def pause(self):
+        self._rebase()
+        self.paused = True
+
+    def resume(self):
+        self._rebase()
+        self.paused = False
+
+    def reset(self):
+        self._virtual = 0.0
+        self._real = self._loop_time()
+        self._changed.set()
+
+    async def sleep_until(self, t: float):
+        while True:
+            if not self.paused and self.speed == 0:
+                self._virtual = max(self._virtual, t)
+                await asyncio.sleep(0)
+                return
+            now = self.now()
+            if now >= t and not self.paused:
+                return
+            self._changed.clear()
+            timeout = None if self.paused else (t - now) / self.speed
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class ScaleTarget:
+    """
+    Apply scenario events to a ScaleEmulator from either emulator.
+    `disconnect(seconds)` is emulator specific and optional.
+    """
+
+    def __init__(self, scale, disconnect: Optional[Callable[[float], None]] = None):
+        self.scale = scale
+        self.disconnect = disconnect
+
+    def apply(self, event: dict):
+        action = event["action"]
+        scale = self.scale
+        if action == "load":
+            scale.set_weight(float(event["grams"]))
+        elif action == "unload":
+            scale.set_weight(0.0)
+        elif action == "tare":
+            scale.tare()
+        elif action == "calibrate":
+            scale.calibrate(float(event["grams"]))
+        elif action == "battery":
+            scale.battery_level = max(0, min(100, int(event["level"])))
+        elif action == "stable":
+            scale.is_stable = bool(event["stable"])
+        elif action == "error":
+            scale.error_code = int(event["code"])
+        elif action == "disconnect" and self.disconnect:
+            self.disconnect(float(event["seconds"]))
+
+
+class ScenarioRunner:
+    """Runs a scenario against a target and answers control commands."""
+
+    def __init__(self, target, on_shutdown: Optional[Callable[[], None]] = None):
+        self.target = target
+        self.on_shutdown = on_shutdown
+        self.clock = VirtualClock()
+        self.scenario = None
+        self.position = 0
+        self.applied: List[dict] = []
+        self.state = "idle"         # idle, loaded, running, paused, finished, failed
+        self.error: Optional[str] = None
+        self.task = None
+
+    def load(self, scenario: dict):
+        self.stop_task()
+        self.scenario = scenario
+        self.position = 0
+        self.applied = []
+        self.error = None
+        self.clock = VirtualClock(scenario["speed"])
+        self.state = "loaded"
+
+    def start(self):
+        if self.scenario is None:
+            raise ScenarioError("No scenario loaded")
+        if self.state in ("running", "paused"):
+            raise ScenarioError(f"Scenario is already {self.state}")
+        if self.state in ("finished", "failed"):
+            self.load(self.scenario)
+        self.clock.reset()
+        self.clock.resume()
+        self.state = "running"
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        events = self.scenario["events"]
+        try:
+            while self.position < len(events):
+                event = events[self.position]
+                await self.clock.sleep_until(event["at"])
+                self._apply(event, event["at"])     # Logged at its scheduled time
+                self.position += 1
+                if event["action"] == "end":
+                    break
+        except Exception as e:
+            # Nobody awaits the task, so report the failure through status
+            self.clock.pause()
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"💥 Scenario '{self.scenario['name']}' failed at event {self.position}: {self.error}")
+            return
+        self.clock.pause()
+        self.state = "finished"
+        print(f"🎬 Scenario '{self.scenario['name']}' finished at t={self.clock.now():.3f}s")
+
+    def _apply(self, event: dict, at: float):
+        self.target.apply(event)
+        self.applied.append({"at": round(at, 6), **{k: v for k, v in event.items() if k != "at"}})
+
+    def stop_task(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.task = None
+
+    def status(self) -> dict:
+        total = len(self.scenario["events"]) if self.scenario else 0
+        return {
+            "scenario": self.scenario["name"] if self.scenario else None,
+            "state": self.state,
+            "time": round(self.clock.now(), 6),
+            "speed": self.clock.speed,
+            "events_done": self.position,
+            "events_total": total,
+            "applied": len(self.applied),      # Including ad-hoc "apply" commands
+            "last_event": self.applied[-1] if self.applied else None,
+            "error": self.error,
+        }
+
+    def handle(self, command: dict) -> dict:
+        """Execute one control command and return the resulting status."""
+        name = command.get("command")
+        if name == "status":
+            pass
+        elif name == "load":
+            self.load(parse_scenario(command.get("scenario")))
+        elif name == "start":
+            self.start()
+        elif name == "pause":
+            if self.state != "running":
+                raise ScenarioError("Scenario is not running")
+            self.clock.pause()
+            self.state = "paused"
+        elif name == "resume":
+            if self.state != "paused":
+                raise ScenarioError("Scenario is not paused")
+            self.clock.resume()
+            self.state = "running"
+        elif name == "speed":
+            try:
+                speed = _non_negative(command.get("speed"))
+            except ScenarioError:
+                raise ScenarioError("speed must be a number >= 0")
+            self.clock.set_speed(speed)
+        elif name == "apply":
+            self._apply(parse_event(command.get("event"), at_required=False), self.clock.now())
+        elif name == "shutdown":
+            self.stop_task()
+            self.state = "finished" if self.scenario else "idle"
+            if self.on_shutdown:
+                self.on_shutdown()
+        else:
+            raise ScenarioError(f"Unknown command {name!r}")
+        return self.status()
+
+
+class ControlServer:
+    """
+    Control API for a ScenarioRunner: HTTP on `http_port`, WebSocket on
+    `ws_port` (either may be None to disable it).
+    """
+
+    def __init__(self, runner: ScenarioRunner, host: str = "127.0.0.1",
+                 http_port: Optional[int] = 8766, ws_port: Optional[int] = 8767):
+        self.runner = runner
+        self.host = host
+        self.http_port = http_port
+        self.ws_port = ws_port
+        self.servers = []
+
+    def _dispatch(self, command: dict) -> tuple:
+        try:
+            return 200, self.runner.handle(command)
+        except ScenarioError as e:
+            return 400, {"error": str(e)}
+        except (TypeError, ValueError) as e:
+            return 400, {"error": f"Invalid command: {e}"}
+
+    async def start(self):
+        if self.http_port is not None:
+            self.servers.append(await asyncio.start_server(self._http, self.host, self.http_port))
+            print(f"🎛️  Scenario control: http://{self.host}:{self.http_port}/status")
+        if self.ws_port is not None:
+            import websockets
+
+            self.servers.append(await websockets.serve(self._ws, self.host, self.ws_port))
+            print(f"🎛️  Scenario control: ws://{self.host}:{self.ws_port}")
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+    async def _http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+            if len(request_line) < 2:
+                code, payload = 400, {"error": "Bad request"}
+            else:
+                method, path = request_line[0], request_line[1].split("?")[0].strip("/")
+                try:
+                    command = json.loads(body) if body else {}
+                except json.JSONDecodeError:
+                    command = None
+                if not isinstance(command, dict):
+                    code, payload = 400, {"error": "Body must be a JSON object"}
+                elif method == "GET" and path == "status":
+                    code, payload = self._dispatch({"command": "status"})
+                elif method == "POST" and path == "scenario":
+                    code, payload = self._dispatch({"command": "load", "scenario": command})
+                elif method == "POST" and path:
+                    code, payload = self._dispatch({**command, "command": path})
+                else:
+                    code, payload = 404, {"error": "Not found"}
+
+            data = json.dumps(payload).encode()
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}[code]
+            writer.write(
+                f"HTTP/1.1 {code} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _ws(self, websocket):
+        try:
+            async for message in websocket:
+                try:
+                    command = json.loads(message)
+                except json.JSONDecodeError:
+                    command = None
+                if not isinstance(command, dict):
+                    code, payload = 400, {"error": "Message must be a JSON object"}
+                else:
+                    code, payload = self._dispatch(command)
+                await websocket.send(json.dumps({"ok": code == 200, **payload}))
+        except Exception:
+            pass
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Record/replay of scale readings in a compact fixed-record binary log.
+
+Every record is 28 bytes: a microsecond timestamp, the device MAC and the
+12-byte SCLE weight packet exactly as the scale sends it. The replayer
+memory-maps the log, so only the pages being streamed are read, and uses
+a sidecar index (<log>.idx, one entry every INDEX_STRIDE records) to seek
+to a time range. The index can always be rebuilt from the log.
+
+Usage:
+    python stream_log.py info capture.scl
+    python stream_log.py replay capture.scl --to http --url http://localhost:8000 --speed 1
+    python stream_log.py replay capture.scl --to ws --port 8765 --speed 10
+    python stream_log.py replay capture.scl --to none --speed 0 --start 60 --end 120
+
+Recording: scale_fleet.py --record capture.scl, or set MEASUREMENT_RECORD_PATH
+on the backend to capture what /measurements ingests.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import time
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from scale_protocol import WEIGHT_MAGIC
+from stream_format import FILE_HEADER, FILE_MAGIC, RECORD, open_for_append
+
+RECORD_DTYPE = np.dtype([
+    ("t_us", "<i8"),
+    ("mac", "S6"),
+    ("reserved", "<u2"),
+    ("magic", "S4"),
+    ("weight", "<f4"),
+    ("unit", "u1"),
+    ("stable", "u1"),
+    ("battery", "u1"),
+    ("error", "u1"),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+INDEX_MAGIC = b"SCLIDX1\0"
+INDEX_HEADER = struct.Struct("<8sQ")     # magic, records covered
+INDEX_DTYPE = np.dtype([("t_us", "<i8"), ("record", "<i8")])
+INDEX_STRIDE = 4096
+
+
+def mac_bytes(mac: str) -> bytes:
+    """'AA:BB:CC:DD:EE:FF' -> 6 bytes."""
+    raw = bytes.fromhex(mac.replace(":", "").replace("-", ""))
+    if len(raw) != 6:
+        raise ValueError(f"Not a MAC address: {mac}")
+    return raw
+
+
+def mac_text(raw: bytes) -> str:
+    return ":".join(f"{b:02X}" for b in raw.ljust(6, b"\0"))
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+class StreamRecorder:
+    """
+    Append readings to a log. Records are buffered and written in blocks;
+    timestamps are clamped to be non-decreasing so the log stays seekable.
+    """
+
+    def __init__(self, path: str, buffer_records: int = INDEX_STRIDE):
+        self.path = path
+        self.file, self.last_t_us = open_for_append(path)
+        self.buffer = np.zeros(buffer_records, dtype=RECORD_DTYPE)
+        self.buffer["magic"] = WEIGHT_MAGIC
+        self.pending = 0
+        self.records = 0
+
+    def append(self, mac: str, weight: float, stable: bool, battery: int, error: int = 0,
+               unit: int = 0, t_us: Optional[int] = None):
+        """Record one reading."""
+        if self.pending == len(self.buffer):
+            self.flush()
+        t_us = max(now_us() if t_us is None else t_us, self.last_t_us)
+        self.last_t_us = t_us
+        self.buffer[self.pending] = (t_us, mac_bytes(mac), 0, WEIGHT_MAGIC, weight, unit,
+                                     1 if stable else 0, battery, error)
+        self.pending += 1
+
+    def append_packet(self, mac: str, packet: bytes, t_us: Optional[int] = None):
+        """Record a raw 12-byte SCLE packet as received from a scale."""
+        _, weight, unit, stable, battery, error = struct.unpack("<4sfBBBB", packet)
+        self.append(mac, weight, bool(stable), battery, error, unit, t_us)
+
+    def append_many(self, macs: np.ndarray, weights, stable, battery, error, t_us: Optional[int] = None):
+        """Record a batch sharing one timestamp; `macs` is an 'S6' array."""
+        self.flush()
+        t_us = max(now_us() if t_us is None else t_us, self.last_t_us)
+        self.last_t_us = t_us
+        block = np.zeros(len(macs), dtype=RECORD_DTYPE)
+        block["t_us"] = t_us
+        block["mac"] = macs
+        block["magic"] = WEIGHT_MAGIC
+        block["weight"] = weights
+        block["stable"] = stable
+        block["battery"] = battery
+        block["error"] = error
+        self.file.write(block.tobytes())
+        self.records += len(block)
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.buffer[:self.pending].tobytes())
+            self.records += self.pending
+            self.pending = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        update_index(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_log(path: str) -> np.memmap:
+    """Memory-map the complete records of a log (a torn final record is ignored)."""
+    with open(path, "rb") as f:
+        magic, record_size, _ = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != FILE_MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a scale stream log")
+    count = (os.path.getsize(path) - FILE_HEADER.size) // RECORD.size
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=FILE_HEADER.size, shape=(count,))
+
+
+def update_index(path: str, records: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Bring <path>.idx up to date with the log, extending it from where it
+    stopped, and return the index entries.
+    """
+    records = open_log(path) if records is None else records
+    index_path = path + ".idx"
+    entries = np.zeros(0, dtype=INDEX_DTYPE)
+    covered = 0
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as f:
+            magic, covered = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic == INDEX_MAGIC and covered <= len(records):
+                entries = np.frombuffer(f.read(), dtype=INDEX_DTYPE)
+            else:
+                covered = 0
+    if covered == len(records) and len(entries):
+        return entries
+
+    start = len(entries) * INDEX_STRIDE
+    positions = np.arange(start, len(records), INDEX_STRIDE)
+    added = np.zeros(len(positions), dtype=INDEX_DTYPE)
+    added["record"] = positions
+    added["t_us"] = records["t_us"][positions] if len(positions) else []
+    entries = np.concatenate([entries, added])
+
+    tmp = index_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records)))
+        f.write(entries.tobytes())
+    os.replace(tmp, index_path)
+    return entries
+
+
+class StreamReplayer:
+    """Seek and stream records from a memory-mapped log."""
+
+    def __init__(self, path: str):
+        self.records = open_log(path)
+        self.index = update_index(path, self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def seek(self, t_us: int) -> int:
+        """Number of the first record at or after `t_us`."""
+        if not len(self.records):
+            return 0
+        block = max(0, int(np.searchsorted(self.index["t_us"], t_us)) - 1)
+        lo = int(self.index["record"][block]) if len(self.index) else 0
+        hi = min(len(self.records), lo + INDEX_STRIDE)
+        while hi < len(self.records) and self.records["t_us"][hi - 1] < t_us:
+            hi = min(len(self.records), hi + INDEX_STRIDE)
+        return lo + int(np.searchsorted(self.records["t_us"][lo:hi], t_us))
+
+    def window(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> tuple:
+        lo = 0 if start_us is None else self.seek(start_us)
+        hi = len(self.records) if end_us is None else self.seek(end_us)
+        return lo, max(lo, hi)
+
+    async def play(self, emit, start_us: Optional[int] = None, end_us: Optional[int] = None,
+                   speed: float = 1.0, chunk: int = INDEX_STRIDE) -> int:
+        """
+        Pass records in [start, end) to `emit(records)` in time order.
+
+        speed 1 keeps the original spacing, N plays N times faster and 0 as
+        fast as possible. Records that are due together are emitted as one
+        slice, so pacing costs one sleep per group, not per record.
+        """
+        lo, hi = self.window(start_us, end_us)
+        if lo == hi:
+            return 0
+        loop = asyncio.get_running_loop()
+        origin = int(self.records["t_us"][lo])
+        started = loop.time()
+        for chunk_lo in range(lo, hi, chunk):
+            block = self.records[chunk_lo:min(hi, chunk_lo + chunk)]
+            if speed <= 0:
+                emit(block)
+                await asyncio.sleep(0)
+                continue
+            offsets = (block["t_us"] - origin) / 1e6 / speed
+            position = 0
+            while position < len(block):
+                elapsed = loop.time() - started
+                due = int(np.searchsorted(offsets, elapsed, side="right"))
+                if due > position:
+                    emit(block[position:due])
+                    position = due
+                    await asyncio.sleep(0)
+                else:
+                    await asyncio.sleep(offsets[position] - elapsed)
+        return hi - lo
+
+
+class ReplayWebSocketServer:
+    """
+    Serve replayed readings: ws://host:port/scales/<MAC> for one device, or
+    any other path for all of them. A client still busy with its previous
+    frame skips the next one (counted as dropped).
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8765):
+        self.host = host
+        self.port = port
+        self.subscribers = {}       # MAC, or "" for all devices -> set of websockets
+        self.busy = set()
+        self.mac_names = {}         # Raw MAC bytes -> text, cached across records
+        self.stats = Counter()
+        self.server = None
+
+    async def start(self):
+        import websockets
+
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        print(f"🚀 Replay WebSocket server on ws://{self.host}:{self.port}/scales/<mac>")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handler(self, websocket):
+        request = getattr(websocket, "request", None)
+        path = request.path if request is not None else websocket.path
+        parts = path.strip("/").split("/")
+        key = parts[1].upper() if len(parts) == 2 and parts[0] == "scales" else ""
+        self.subscribers.setdefault(key, set()).add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.subscribers[key].discard(websocket)
+
+    def emit(self, records: np.ndarray):
+        everyone = self.subscribers.get("")
+        if not everyone:
+            wanted = [mac_bytes(mac) for mac, clients in self.subscribers.items() if mac and clients]
+            if not wanted:
+                return
+            records = records[np.isin(records["mac"], wanted)]
+        names = self.mac_names
+        for t_us, mac, weight, unit, stable, battery, error in zip(
+            records["t_us"].tolist(), records["mac"].tolist(), records["weight"].tolist(),
+            records["unit"].tolist(), records["stable"].tolist(), records["battery"].tolist(),
+            records["error"].tolist(),
+        ):
+            name = names.get(mac)
+            if name is None:
+                name = names[mac] = mac_text(mac)
+            clients = self.subscribers.get(name)
+            if everyone:
+                clients = everyone | clients if clients else everyone
+            if not clients:
+                continue
+            message = json.dumps({
+                "type": "weight",
+                "mac": name,
+                "timestamp_us": t_us,
+                "weight": round(weight, 1),
+                "unit": unit,
+                "stable": bool(stable),
+                "battery": battery,
+                "error": error,
+            })
+            for websocket in clients:
+                if websocket in self.busy:
+                    self.stats["dropped"] += 1
+                    continue
+                self.busy.add(websocket)
+                task = asyncio.ensure_future(websocket.send(message))
+                task.add_done_callback(lambda t, ws=websocket: self._sent(t, ws))
+
+    def _sent(self, task: asyncio.Future, websocket):
+        self.busy.discard(websocket)
+        if task.cancelled() or task.exception() is not None:
+            self.stats["failed"] += 1
+        else:
+            self.stats["sent"] += 1
+
+
+def http_emitter(sink):
+    """Adapt scale_fleet.HttpSink to replayed records."""
+    units = ("g", "kg", "lb", "oz")
+
+    def emit(records: np.ndarray):
+        for mac, weight, unit, stable, battery in zip(
+            records["mac"].tolist(), records["weight"].tolist(), records["unit"].tolist(),
+            records["stable"].tolist(), records["battery"].tolist(),
+        ):
+            sink.enqueue({
+                "device_mac": mac_text(mac),
+                "weight": round(weight, 1),
+                "unit": units[unit] if unit < len(units) else "g",
+                "is_stable": bool(stable),
+                "battery_level": battery,
+            })
+    return emit
+
+
+def describe(path: str):
+    replayer = StreamReplayer(path)
+    records = replayer.records
+    print(f"📼 {path}: {len(records):,} records, {os.path.getsize(path) / 1e6:.1f} MB, "
+          f"{len(replayer.index)} index entries")
+    if len(records):
+        first, last = int(records["t_us"][0]), int(records["t_us"][-1])
+        devices = len(np.unique(records["mac"][:min(len(records), 1_000_000)]))
+        print(f"   {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first / 1e6))} + "
+              f"{(last - first) / 1e6:.1f}s, {devices} devices (first 1M records)")
+
+
+async def replay(args):
+    replayer = StreamReplayer(args.log)
+    if not len(replayer):
+        print("📼 Log is empty")
+        return
+    origin = int(replayer.records["t_us"][0])
+    start = origin + int(args.start * 1e6) if args.start is not None else None
+    end = origin + int(args.end * 1e6) if args.end is not None else None
+
+    counted = Counter()
+    if args.to == "http":
+        from scale_fleet import HttpSink
+
+        macs = [mac_text(mac) for mac in np.unique(replayer.records["mac"]).tolist()]
+        sink = HttpSink(args.url, concurrency=args.concurrency, macs=macs)
+        emit = http_emitter(sink)
+    elif args.to == "ws":
+        sink = ReplayWebSocketServer(args.host, args.port)
+        emit = sink.emit
+    else:
+        sink = None
+
+        def emit(records):
+            counted["sent"] += len(records)
+
+    if sink:
+        await sink.start()
+    started = time.perf_counter()
+    try:
+        played = await replayer.play(emit, start, end, speed=args.speed)
+        if args.to == "http":
+            await sink.queue.join()     # Let queued readings reach the backend
+    finally:
+        if sink:
+            await sink.stop()
+    elapsed = time.perf_counter() - started
+    stats = dict(sink.stats) if sink else dict(counted)
+    print(f"📼 Replayed {played:,} records in {elapsed:.2f}s "
+          f"({played / max(elapsed, 1e-9):,.0f}/s) {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay scale readings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="Summarize a log (and refresh its index)")
+    info.add_argument("log")
+
+    play = commands.add_parser("replay", help="Stream a log to the backend or WebSocket clients")
+    play.add_argument("log")
+    play.add_argument("--to", choices=("http", "ws", "none"), default="none")
+    play.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = max")
+    play.add_argument("--start", type=float, default=None, help="Seconds from the start of the log")
+    play.add_argument("--end", type=float, default=None, help="Seconds from the start of the log")
+    play.add_argument("--url", default="http://localhost:8000", help="Backend base URL (http)")
+    play.add_argument("--concurrency", type=int, default=64, help="Parallel requests (http)")
+    play.add_argument("--host", default="0.0.0.0", help="Bind address (ws)")
+    play.add_argument("--port", type=int, default=8765, help="Port (ws)")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        describe(args.log)
+    else:
+        asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n👋 Bye!")
@@ -0,0 +1,8 @@
+"""
+Tests run from emulator/ (``cd emulator && pytest``); the emulator modules
+import each other as top-level scripts, so their directory goes on the path.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
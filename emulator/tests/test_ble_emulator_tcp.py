@@ -0,0 +1,81 @@
+import asyncio
+
+from ble_emulator_tcp import ClientChannel
+
+
+class SlowSocket:
+    """A client whose sends block until the test lets them through."""
+
+    def __init__(self):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.remote_address = ("127.0.0.1", 0)
+
+    async def send(self, message: str):
+        await self.gate.wait()
+        self.sent.append(message)
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_a_stuck_send_drops_the_oldest_frames():
+    async def scenario():
+        socket = SlowSocket()
+        channel = ClientChannel(socket)
+        channel.push("first")
+        await _settle()             # The writer is now stuck sending "first"
+        frames = [f"reading-{i}" for i in range(ClientChannel.MAX_QUEUE + 4)]
+        for frame in frames:
+            channel.push(frame)
+        assert len(channel.queue) == ClientChannel.MAX_QUEUE
+        assert channel.dropped == 4
+
+        socket.gate.set()
+        await _settle()
+        channel.close()
+        return socket.sent, channel
+
+    sent, channel = asyncio.run(scenario())
+    # Only the newest frame goes out once the send unblocks; the rest are coalesced
+    assert sent == ["first", "reading-19"]
+    assert (channel.sent, channel.coalesced, channel.dropped) == (2, ClientChannel.MAX_QUEUE - 1, 4)
+    assert "dropped=4" in channel.stats()
+
+
+def test_replies_go_first_and_are_never_coalesced():
+    async def scenario():
+        socket = SlowSocket()
+        channel = ClientChannel(socket)
+        channel.push("reading-0")
+        await _settle()
+        channel.push("reading-1")
+        channel.push("reading-2")
+        channel.reply("ack-tare")
+        channel.reply("ack-unit")
+        socket.gate.set()
+        await _settle()
+        channel.close()
+        return socket.sent, channel
+
+    sent, channel = asyncio.run(scenario())
+    assert sent == ["reading-0", "ack-tare", "ack-unit", "reading-2"]
+    assert (channel.coalesced, channel.dropped) == (1, 0)
+
+
+def test_a_client_that_never_reads_loses_only_the_oldest_replies():
+    async def scenario():
+        socket = SlowSocket()
+        channel = ClientChannel(socket)
+        channel.push("reading-0")
+        await _settle()
+        for i in range(ClientChannel.MAX_REPLIES + 3):
+            channel.reply(f"ack-{i}")
+        channel.close()
+        return channel
+
+    channel = asyncio.run(scenario())
+    assert channel.dropped == 3
+    assert channel.replies[0] == "ack-3"
@@ -0,0 +1,35 @@
+from change_filter import ChangeFilter
+
+
+def test_moves_within_the_deadband_are_suppressed():
+    changes = ChangeFilter(deadband=0.5, heartbeat=5)
+    assert changes.should_send((100.0, True, 85, 0), 0.0)
+    assert not changes.should_send((100.4, True, 85, 0), 0.1)
+    assert not changes.should_send((99.6, True, 85, 0), 0.2)
+    assert changes.should_send((100.6, True, 85, 0), 0.3)
+    # The deadband is measured from the last reading sent, not the last seen
+    assert not changes.should_send((101.0, True, 85, 0), 0.4)
+    assert (changes.sent, changes.suppressed) == (2, 3)
+
+
+def test_stability_battery_and_error_changes_are_sent():
+    changes = ChangeFilter(deadband=0.5, heartbeat=5)
+    assert changes.should_send((250.0, False, 85, 0), 0.0)
+    assert changes.should_send((250.0, True, 85, 0), 0.1)
+    assert changes.should_send((250.0, False, 85, 0), 0.2)
+    assert changes.should_send((250.0, False, 84, 0), 0.3)
+    assert changes.should_send((250.0, False, 84, 2), 0.4)
+    assert not changes.should_send((250.1, False, 84, 2), 0.5)
+
+
+def test_heartbeat_while_idle():
+    changes = ChangeFilter(deadband=0.5, heartbeat=5)
+    assert changes.should_send((0.0, True, 85, 0), 0.0)
+    assert not any(changes.should_send((0.0, True, 85, 0), t / 10) for t in range(1, 50))
+    assert changes.should_send((0.0, True, 85, 0), 5.0)
+    assert not changes.should_send((0.0, True, 85, 0), 5.1)
+
+
+def test_parameters_are_clamped():
+    changes = ChangeFilter(deadband=-1, heartbeat=0)
+    assert (changes.deadband, changes.heartbeat) == (0.0, 0.1)
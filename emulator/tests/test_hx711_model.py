@@ -0,0 +1,50 @@
+import numpy as np
+
+from hx711_model import ERROR_NONE, ERROR_OVERLOAD, MAX_WEIGHT_G, HX711SignalModel
+
+
+def _drive(seed: int):
+    model = HX711SignalModel(8, seed=seed)
+    blocks = [model.run(40)]
+    model.set_load([1, 3, 5], [250.0, 1200.0, 4000.0])
+    model.tare([2])
+    blocks.append(model.advance(0.5))
+    model.calibrate([3], 1200.0)
+    blocks.append(model.run(40))
+    return blocks
+
+
+def test_same_seed_gives_identical_samples():
+    for a, b in zip(_drive(7), _drive(7)):
+        for field in ("t_ms", "raw", "weight", "stable", "error"):
+            np.testing.assert_array_equal(getattr(a, field), getattr(b, field))
+
+
+def test_different_seeds_differ():
+    assert not np.array_equal(_drive(7)[0].raw, _drive(8)[0].raw)
+
+
+def test_settles_on_the_placed_load():
+    model = HX711SignalModel(2, seed=1, spike_probability=0.0)
+    model.set_load([0], 500.0)
+    block = model.run(200)
+    assert abs(block.weight[0, -1] - 500.0) < 2.0
+    assert abs(block.weight[1, -1]) < 2.0
+    assert block.stable[:, -1].all()
+
+
+def test_error_is_kept_below_the_minimum_weight():
+    # Loads switch without ringing through the valid range on the way
+    model = HX711SignalModel(3, seed=2, spike_probability=0.0, settle_seconds=0.001)
+    model.set_load([0, 1], MAX_WEIGHT_G * 1.5)
+    model.run(80)
+    assert (model.error[:2] == ERROR_OVERLOAD).all()
+
+    # Like readWeight(): a reading under MIN_WEIGHT_G leaves errorCode as it was
+    model.set_load([0, 2], -500.0)
+    model.set_load([1], 100.0)
+    block = model.run(80)
+    assert block.error[0, -1] == ERROR_OVERLOAD
+    assert block.error[1, -1] == ERROR_NONE
+    assert block.error[2, -1] == ERROR_NONE
+    assert abs(block.weight[0, -1]) < 0.01
@@ -0,0 +1,76 @@
+import pytest
+
+from scale_protocol import (
+    MAX_DELTA_MS,
+    MULTI_HEADER,
+    MULTI_SAMPLE,
+    WEIGHT_PACKET,
+    SampleBatcher,
+    pack_samples,
+    pack_weight,
+    samples_per_notification,
+    unpack_samples,
+    unpack_weight,
+)
+
+
+def test_weight_packet_round_trip():
+    packet = pack_weight(1234.5, 1, True, 85, 2)
+    assert len(packet) == WEIGHT_PACKET.size == 12
+    assert unpack_weight(packet) == {"weight": 1234.5, "unit": 1, "stable": True, "battery": 85, "error": 2}
+
+
+def test_weight_packet_rejects_bad_magic_and_truncation():
+    packet = pack_weight(10.0, 0, False, 50, 0)
+    with pytest.raises(ValueError, match="Not a weight packet"):
+        unpack_weight(b"SCLM" + packet[4:])
+    with pytest.raises(ValueError, match="11 bytes"):
+        unpack_weight(packet[:-1])
+
+
+def test_multi_sample_round_trip_across_the_clock_wrap():
+    start = 0xFFFFFFFF - 20
+    samples = [(start + 12 * i, 100.0 + i / 4, i % 2 == 0) for i in range(5)]
+    packet = pack_samples(samples, 0, 90, 0)
+    assert len(packet) == MULTI_HEADER.size + 5 * MULTI_SAMPLE.size
+    unpacked = unpack_samples(packet)
+    assert (unpacked["unit"], unpacked["battery"], unpacked["error"]) == (0, 90, 0)
+    assert unpacked["samples"] == [(t & 0xFFFFFFFF, w, s) for t, w, s in samples]
+
+
+def test_multi_sample_packet_rejects_bad_packets():
+    packet = pack_samples([(0, 1.0, True), (12, 2.0, True)], 0, 90, 0)
+    with pytest.raises(ValueError, match="Not a multi-sample packet"):
+        unpack_samples(b"SCLE" + packet[4:])
+    with pytest.raises(ValueError, match="sample count"):
+        unpack_samples(packet[:-1])
+    with pytest.raises(ValueError, match="header"):
+        unpack_samples(packet[:MULTI_HEADER.size - 1])
+    with pytest.raises(ValueError, match="1 to 255"):
+        pack_samples([], 0, 90, 0)
+    with pytest.raises(ValueError, match="does not fit"):
+        pack_samples([(0, 1.0, True), (MAX_DELTA_MS + 1, 2.0, True)], 0, 90, 0)
+
+
+def test_batcher_fills_notifications_to_the_mtu():
+    batcher = SampleBatcher(mtu=247)
+    assert batcher.capacity == samples_per_notification(247)
+    packets = []
+    for i in range(batcher.capacity * 2 + 3):
+        packets += batcher.add(i * 12, float(i), True, 0, 80, 0)
+    assert len(packets) == 2
+    assert [len(unpack_samples(p)["samples"]) for p in packets] == [batcher.capacity] * 2
+
+    assert not batcher.due(batcher.samples[0][0] + 99)
+    assert batcher.due(batcher.samples[0][0] + 100)
+    rest = unpack_samples(batcher.flush(0, 80, 0))["samples"]
+    assert [t for t, _, _ in rest] == [12 * i for i in range(batcher.capacity * 2, batcher.capacity * 2 + 3)]
+    assert batcher.flush(0, 80, 0) is None
+
+
+def test_batcher_splits_packets_at_long_gaps():
+    batcher = SampleBatcher(mtu=247)
+    assert batcher.add(0, 1.0, True, 0, 80, 0) == []
+    packets = batcher.add(MAX_DELTA_MS + 1, 2.0, True, 0, 80, 0)
+    assert [s["samples"] for s in map(unpack_samples, packets)] == [[(0, 1.0, True)]]
+    assert batcher.samples == [(MAX_DELTA_MS + 1, 2.0, True)]
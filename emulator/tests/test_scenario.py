@@ -0,0 +1,153 @@
+import asyncio
+import os
+
+import pytest
+
+from ble_emulator_tcp import ScaleEmulator
+from scenario import ScaleTarget, ScenarioError, ScenarioRunner, VirtualClock, load_scenario, parse_scenario
+
+SCENARIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scenarios")
+
+
+class Recorder:
+    def __init__(self, fail_on: str = None):
+        self.events = []
+        self.fail_on = fail_on
+
+    def apply(self, event: dict):
+        if event["action"] == self.fail_on:
+            raise RuntimeError("scale went away")
+        self.events.append(event["action"])
+
+
+async def _finish(runner: ScenarioRunner):
+    while runner.state == "running":
+        await asyncio.sleep(0)
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"name": "no events"}, "'events' list"),
+    ({"events": [{"at": 1, "action": "dance"}]}, "Unknown action 'dance'"),
+    ({"events": [{"at": 1, "action": "load"}]}, "load event is missing grams"),
+    ({"events": [{"at": 1, "action": "load", "grams": "heavy"}]}, "invalid grams: expected a number"),
+    ({"events": [{"at": 1, "action": "battery", "level": 101}]}, "invalid level: 101 is outside 0..100"),
+    ({"events": [{"at": 1, "action": "error", "code": 2.5}]}, "invalid code: expected a whole number"),
+    ({"events": [{"at": 1, "action": "stable", "stable": "yes"}]}, "invalid stable: expected true or false"),
+    ({"events": [{"action": "tare"}]}, "tare event needs an 'at' time"),
+    ({"events": [{"at": -1, "action": "tare"}]}, "tare event needs an 'at' time"),
+    ({"events": [], "speed": -2}, "speed must be a number >= 0"),
+])
+def test_malformed_scenarios_are_rejected(data, message):
+    with pytest.raises(ScenarioError, match=message):
+        parse_scenario(data)
+
+
+def test_malformed_files_name_the_file(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('{"events": [')
+    with pytest.raises(ScenarioError, match="broken.json is not valid JSON"):
+        load_scenario(str(path))
+
+
+def test_events_are_sorted_stably():
+    scenario = parse_scenario({"events": [
+        {"at": 2, "action": "unload"},
+        {"at": 1, "action": "stable", "stable": False},
+        {"at": 1, "action": "load", "grams": 5},
+    ]})
+    assert [event["action"] for event in scenario["events"]] == ["stable", "load", "unload"]
+
+
+def test_checkout_scenario_drives_the_scale():
+    async def scenario():
+        scale = ScaleEmulator()
+        disconnects = []
+        runner = ScenarioRunner(ScaleTarget(scale, disconnects.append))
+        checkout = load_scenario(os.path.join(SCENARIOS, "checkout.json"))
+        runner.load({**checkout, "speed": 0})
+        runner.start()
+        await _finish(runner)
+        return scale, disconnects, runner.status()
+
+    scale, disconnects, status = asyncio.run(scenario())
+    assert status["state"] == "finished"
+    assert status["events_done"] == status["events_total"] == 12
+    assert status["time"] == 15.0
+    assert (scale.weight, scale.battery_level, scale.error_code, scale.is_stable) == (0.0, 15, 0, True)
+    assert disconnects == [3.0]
+
+
+def test_a_failing_step_marks_the_run_failed():
+    async def scenario():
+        target = Recorder(fail_on="battery")
+        runner = ScenarioRunner(target)
+        runner.handle({"command": "load", "scenario": {"speed": 0, "events": [
+            {"at": 0, "action": "tare"},
+            {"at": 1, "action": "battery", "level": 10},
+            {"at": 2, "action": "unload"},
+        ]}})
+        runner.handle({"command": "start"})
+        await _finish(runner)
+        return target, runner.status()
+
+    target, status = asyncio.run(scenario())
+    assert status["state"] == "failed"
+    assert status["error"] == "RuntimeError: scale went away"
+    assert status["events_done"] == 1
+    assert target.events == ["tare"]
+
+
+def test_control_commands_are_checked():
+    async def scenario():
+        runner = ScenarioRunner(Recorder())
+        with pytest.raises(ScenarioError, match="No scenario loaded"):
+            runner.handle({"command": "start"})
+        with pytest.raises(ScenarioError, match="Unknown command 'jump'"):
+            runner.handle({"command": "jump"})
+        with pytest.raises(ScenarioError, match="not running"):
+            runner.handle({"command": "pause"})
+        status = runner.handle({"command": "apply", "event": {"action": "load", "grams": 100}})
+        assert status["last_event"] == {"at": 0.0, "action": "load", "grams": 100.0}
+
+    asyncio.run(scenario())
+
+
+def test_virtual_clock_runs_faster_than_real_time():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        clock = VirtualClock(speed=100)
+        clock.reset()
+        clock.resume()
+        started = loop.time()
+        await clock.sleep_until(2.0)
+        return clock.now(), loop.time() - started
+
+    virtual, real = asyncio.run(scenario())
+    assert virtual >= 2.0
+    assert 0.015 <= real < 0.5
+
+
+def test_virtual_clock_pause_and_speed_changes():
+    async def scenario():
+        clock = VirtualClock(speed=1)
+        clock.reset()
+        assert clock.now() == 0.0          # Starts paused
+        clock.resume()
+        clock.set_speed(0)
+        frozen = clock.now()
+        await asyncio.sleep(0.02)
+        assert clock.now() == frozen       # Speed 0 only moves when awaited
+        await clock.sleep_until(30.0)
+        assert clock.now() == 30.0
+
+        clock.set_speed(1000)
+        clock.pause()
+        paused_at = clock.now()
+        waiter = asyncio.create_task(clock.sleep_until(paused_at + 1))
+        await asyncio.sleep(0.02)
+        assert clock.now() == paused_at and not waiter.done()
+        clock.resume()
+        await asyncio.wait_for(waiter, 1.0)
+        assert clock.now() >= paused_at + 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+import asyncio
+
+import numpy as np
+
+from stream_format import FILE_HEADER, FILE_MAGIC, RECORD
+from stream_log import INDEX_STRIDE, StreamRecorder, StreamReplayer, mac_bytes, mac_text
+
+# backend/tests/test_recording.py pins the same bytes for the backend's copy of the format
+HEADER_BYTES = b"SCLLOG1\x00\x1c\x00\x00\x00\x00\x00\x00\x00"
+RECORD_BYTES = bytes.fromhex("e803000000000000aabbccddee010000" "53434c45" "00002041" "01015000")
+
+
+def test_layout_matches_the_backend_recorder():
+    assert FILE_HEADER.pack(FILE_MAGIC, RECORD.size, 0) == HEADER_BYTES
+    assert RECORD.pack(1000, mac_bytes("AA:BB:CC:DD:EE:01"), 0, b"SCLE", 10.0, 1, 1, 80, 0) == RECORD_BYTES
+
+
+def test_record_and_replay_a_time_window(tmp_path):
+    path = str(tmp_path / "capture.scl")
+    count = INDEX_STRIDE * 2 + 100
+    with StreamRecorder(path, buffer_records=512) as recorder:
+        for i in range(count):
+            recorder.append(f"AA:BB:CC:DD:EE:{i % 4:02X}", float(i), i % 2 == 0, 80, t_us=1_000 * i)
+        # Clamped so the log never goes back in time
+        recorder.append("AA:BB:CC:DD:EE:00", -1.0, False, 80, t_us=0)
+
+    replayer = StreamReplayer(path)
+    assert len(replayer) == count + 1
+    assert replayer.records["t_us"][-1] == 1_000 * (count - 1)
+    assert mac_text(replayer.records["mac"][5]) == "AA:BB:CC:DD:EE:01"
+
+    played = []
+    sent = asyncio.run(replayer.play(played.append, start_us=1_000 * 4_100, end_us=1_000 * 4_200, speed=0))
+    weights = np.concatenate([block["weight"] for block in played])
+    assert sent == 100
+    assert weights.tolist() == [float(i) for i in range(4_100, 4_200)]
+
+
+def test_reopening_appends(tmp_path):
+    path = str(tmp_path / "capture.scl")
+    with StreamRecorder(path) as recorder:
+        recorder.append("AA:BB:CC:DD:EE:01", 1.0, True, 80, t_us=5_000)
+    with StreamRecorder(path) as recorder:
+        assert recorder.last_t_us == 5_000
+        recorder.append("AA:BB:CC:DD:EE:01", 2.0, True, 80, t_us=6_000)
+    assert StreamReplayer(path).records["weight"].tolist() == [1.0, 2.0]